@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Settings are read from the environment when the app modules are imported,
+# so .env has to be loaded before any of them.
+load_dotenv()
@@ -0,0 +1,424 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from app.domain import UserFile
+from app.exgent.agent import (
+    excel_tag_agent,
+    generate_agent,
+    structured_response_agent,
+)
+from app.exgent.agent_utils import render_sheet_source
+from app.exgent.fake_llm import FakeLiteLLMClient, install_fake_llm, pipeline_reply
+from app.exgent.llm_cache import set_default_response_cache
+from app.exgent.llm_scheduler import set_default_scheduler
+from app.exgent.tag_groups_agent import tag_report_group_agent
+from app.file_store.file_store import FileStore
+from app.server import server
+from app.server.excel_utils import convert_excel_to_sheet_data
+from app.server.http_cache import content_key
+from app.server.sheet_cache import SheetSource
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+from google.adk.apps.app import App
+from google.adk.runners import Runner
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION = """
+Uploads every .xlsx file under a directory and tags all of its sheets.
+
+Files go through the FileStore and SheetInfoStore of the server (under
+--storage-dir, base_storage_dir by default), so the results show up in the
+UI. Workbooks are parsed in a process pool while async workers tag the
+parsed sheets; model calls share the server's LLM scheduler settings. Each
+finished file is appended to a JSONL checkpoint, and files already recorded
+there as succeeded (with the same content) are skipped on the next run.
+"""
+
+
+class FileResult(BaseModel):
+    # Relative to the input directory
+    path: str
+    sha256: str
+    # succeeded or failed
+    status: str
+    file_id: Optional[str] = None
+    sheets: int = 0
+    failed_sheets: list[str] = []
+    error: Optional[str] = None
+    upload_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    tag_seconds: float = 0.0
+    seconds: float = 0.0
+    finished_at: datetime
+
+
+class Checkpoint:
+    """Append-only JSONL log of processed files; a path's last record wins."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.records: dict[str, FileResult] = {}
+        if path.exists():
+            for line in path.read_text().splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    result = FileResult.model_validate_json(line)
+                except ValidationError:
+                    # A line cut short by an interrupted run
+                    logger.warning("Skipping unreadable checkpoint line: %s", line)
+                    continue
+                self.records[result.path] = result
+
+    def is_done(self, path: str, sha256: str) -> bool:
+        result = self.records.get(path)
+        return (
+            result is not None
+            and result.sha256 == sha256
+            and result.status == "succeeded"
+        )
+
+    def uploaded_file_id(self, path: str, sha256: str) -> Optional[str]:
+        """file_id of an earlier upload of the same content, to avoid a copy."""
+        result = self.records.get(path)
+        if result is not None and result.sha256 == sha256:
+            return result.file_id
+        return None
+
+    def append(self, result: FileResult) -> None:
+        self.records[result.path] = result
+        with open(self.path, "a") as f:
+            f.write(result.model_dump_json() + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class BatchIngest:
+    """Uploads, parses and tags one workbook at a time per calling worker."""
+
+    def __init__(
+        self,
+        file_store: FileStore,
+        sheet_info_store: SheetInfoStore,
+        runner: Runner,
+        session_service: InMemorySessionService,
+        parse_pool: Executor,
+        user_id: str,
+        max_parallel_sheets: int,
+        incremental_tagging: Optional[bool] = None,
+    ):
+        self.file_store = file_store
+        self.sheet_info_store = sheet_info_store
+        self.runner = runner
+        self.session_service = session_service
+        self.parse_pool = parse_pool
+        self.user_id = user_id
+        self.max_parallel_sheets = max_parallel_sheets
+        self.incremental_tagging = incremental_tagging
+
+    async def _upload(
+        self, filename: str, content: bytes, file_id: Optional[str]
+    ) -> UserFile:
+        if file_id is not None:
+            try:
+                return await asyncio.to_thread(
+                    self.file_store.get_file_metadata, self.user_id, file_id
+                )
+            except FileNotFoundError:
+                pass
+        return await asyncio.to_thread(
+            self.file_store.create_file, self.user_id, filename, content
+        )
+
+    async def _tag(self, user_file: UserFile, sources: list[SheetSource]) -> list[str]:
+        """Tags the sheets; returns the names of those that failed."""
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel_sheets))
+
+        async def tag(source: SheetSource) -> Optional[str]:
+            async with semaphore:
+                try:
+                    async for _ in server.tag_sheet(
+                        self.runner,
+                        self.session_service,
+                        self.sheet_info_store,
+                        source,
+                        self.user_id,
+                        user_file.file_id,
+                        f"batch_{user_file.file_id}_{source.sheet_idx}",
+                        self.incremental_tagging,
+                    ):
+                        pass
+                except Exception:
+                    logger.exception(
+                        "Tagging sheet %r of %s failed",
+                        source.sheet_name,
+                        user_file.original_filename,
+                    )
+                    return source.sheet_name
+            return None
+
+        failed = await asyncio.gather(*(tag(source) for source in sources))
+        return [name for name in failed if name is not None]
+
+    async def process(
+        self, path: str, content: bytes, sha256: str, file_id: Optional[str]
+    ) -> FileResult:
+        result = FileResult(
+            path=path,
+            sha256=sha256,
+            status="failed",
+            file_id=file_id,
+            finished_at=datetime.now(timezone.utc),
+        )
+        start = time.perf_counter()
+        try:
+            user_file = await self._upload(Path(path).name, content, file_id)
+            result.file_id = user_file.file_id
+            uploaded = time.perf_counter()
+            result.upload_seconds = uploaded - start
+
+            loop = asyncio.get_running_loop()
+            sheet_data_list = await loop.run_in_executor(
+                self.parse_pool, convert_excel_to_sheet_data, content
+            )
+            key = content_key(user_file)
+            # Empty sheets have nothing to tag
+            sources = [
+                SheetSource(key, sheet_idx, sheet_name, sheet_data)
+                for sheet_idx, (sheet_name, sheet_data) in enumerate(sheet_data_list)
+                if sheet_data.data
+            ]
+            for source in sources:
+                await asyncio.to_thread(render_sheet_source, source)
+            parsed = time.perf_counter()
+            result.parse_seconds = parsed - uploaded
+            result.sheets = len(sources)
+
+            result.failed_sheets = await self._tag(user_file, sources)
+            result.tag_seconds = time.perf_counter() - parsed
+            if result.failed_sheets:
+                result.error = (
+                    f"{len(result.failed_sheets)} of {len(sources)} sheets failed"
+                )
+            else:
+                result.status = "succeeded"
+        except Exception as e:
+            logger.exception("Ingesting %s failed", path)
+            result.error = str(e)
+
+        result.seconds = time.perf_counter() - start
+        result.finished_at = datetime.now(timezone.utc)
+        return result
+
+
+def find_workbooks(input_dir: Path) -> list[Path]:
+    # Excel keeps "~$name.xlsx" lock files next to open workbooks
+    return sorted(
+        path
+        for path in input_dir.rglob("*.xlsx")
+        if path.is_file() and not path.name.startswith("~$")
+    )
+
+
+async def ingest_directory(
+    ingest: BatchIngest, input_dir: Path, checkpoint: Checkpoint, workers: int
+) -> tuple[list[FileResult], int]:
+    """Runs the workbooks through `workers` concurrent workers.
+
+    Returns the results of this run and the number of skipped files.
+    """
+    paths = find_workbooks(input_dir)
+    queue: asyncio.Queue[Path] = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+    results: list[FileResult] = []
+    skipped = 0
+
+    async def worker() -> None:
+        nonlocal skipped
+        while not queue.empty():
+            path = queue.get_nowait()
+            rel = path.relative_to(input_dir).as_posix()
+            content = await asyncio.to_thread(path.read_bytes)
+            sha256 = hashlib.sha256(content).hexdigest()
+            if checkpoint.is_done(rel, sha256):
+                skipped += 1
+                continue
+
+            result = await ingest.process(
+                rel, content, sha256, checkpoint.uploaded_file_id(rel, sha256)
+            )
+            checkpoint.append(result)
+            results.append(result)
+            print(
+                f"[{len(results) + skipped}/{len(paths)}] {rel}: {result.status}, "
+                f"{result.sheets} sheets in {result.seconds:.1f}s",
+                flush=True,
+            )
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    return results, skipped
+
+
+def format_report(results: list[FileResult], skipped: int, wall_seconds: float) -> str:
+    """Per-file timings of this run followed by the overall throughput."""
+    lines = []
+    if results:
+        width = max(len("file"), *(len(r.path) for r in results))
+        lines.append(
+            f"{'file':<{width}}  {'status':<9}  sheets  upload   parse     tag   total"
+        )
+        for r in sorted(results, key=lambda r: r.path):
+            lines.append(
+                f"{r.path:<{width}}  {r.status:<9}  {r.sheets:>6}  "
+                f"{r.upload_seconds:>6.2f}  {r.parse_seconds:>6.2f}  "
+                f"{r.tag_seconds:>6.2f}  {r.seconds:>6.2f}"
+            )
+        lines.append("")
+
+    succeeded = sum(r.status == "succeeded" for r in results)
+    sheets = sum(r.sheets for r in results)
+    minutes = max(wall_seconds, 1e-9) / 60
+    lines.append(
+        f"{len(results)} files processed ({succeeded} succeeded, "
+        f"{len(results) - succeeded} failed), {skipped} skipped; "
+        f"{sheets} sheets in {wall_seconds:.1f}s: "
+        f"{len(results) / minutes:.1f} files/min, {sheets / minutes:.1f} sheets/min"
+    )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.batch.ingest", description=DESCRIPTION
+    )
+    parser.add_argument("input_dir", type=Path, help="Directory of .xlsx files")
+    parser.add_argument(
+        "--storage-dir",
+        default=server.BASE_STORAGE_DIR,
+        help="Storage directory of the server (default: base_storage_dir)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="JSONL checkpoint (default: <input_dir>/ingest_checkpoint.jsonl)",
+    )
+    parser.add_argument("--user-id", default="user_one")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Files processed at the same time"
+    )
+    parser.add_argument(
+        "--parse-processes",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Processes parsing workbooks; 0 parses in a thread",
+    )
+    parser.add_argument(
+        "--max-parallel-sheets",
+        type=int,
+        default=server.ANALYZE_MAX_PARALLEL_SHEETS,
+        help="Sheets of one file tagged at the same time",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only tag groups changed since the last tagged version",
+    )
+    parser.add_argument(
+        "--fake-llm",
+        action="store_true",
+        help="Answer model calls locally with scripted replies (offline runs)",
+    )
+    parser.add_argument(
+        "--fake-llm-latency",
+        type=float,
+        default=0.0,
+        help="Seconds each fake model call takes",
+    )
+    args = parser.parse_args(argv)
+    if not args.storage_dir:
+        parser.error("--storage-dir is required when base_storage_dir is not set")
+    return args
+
+
+async def run(args: argparse.Namespace) -> int:
+    input_dir = args.input_dir.resolve()
+    if not input_dir.is_dir():
+        print(f"{input_dir} is not a directory", file=sys.stderr)
+        return 2
+    checkpoint = Checkpoint(args.checkpoint or input_dir / "ingest_checkpoint.jsonl")
+
+    session_service = InMemorySessionService()
+    runner = Runner(
+        app=App(name=server.TAG_JOB_APP_NAME, root_agent=excel_tag_agent, plugins=[]),
+        session_service=session_service,
+    )
+
+    models = [
+        generate_agent.model,
+        structured_response_agent.model,
+        tag_report_group_agent.model,
+    ]
+    clients = [model.llm_client for model in models]
+    if args.fake_llm:
+        install_fake_llm(
+            models,
+            FakeLiteLLMClient(reply=pipeline_reply, latency=args.fake_llm_latency),
+        )
+        # Fake replies must never be replayed to real runs
+        set_default_response_cache(None)
+    else:
+        set_default_response_cache(server.create_llm_response_cache(args.storage_dir))
+    set_default_scheduler(server.create_llm_scheduler())
+
+    parse_pool: Executor = (
+        ProcessPoolExecutor(max_workers=args.parse_processes)
+        if args.parse_processes > 0
+        else ThreadPoolExecutor(max_workers=1)
+    )
+    ingest = BatchIngest(
+        file_store=server.create_file_store(args.storage_dir),
+        sheet_info_store=server.create_sheet_info_store(args.storage_dir),
+        runner=runner,
+        session_service=session_service,
+        parse_pool=parse_pool,
+        user_id=args.user_id,
+        max_parallel_sheets=args.max_parallel_sheets,
+        incremental_tagging=True if args.incremental else None,
+    )
+    start = time.perf_counter()
+    try:
+        results, skipped = await ingest_directory(
+            ingest, input_dir, checkpoint, args.workers
+        )
+    finally:
+        parse_pool.shutdown(cancel_futures=True)
+        set_default_scheduler(None)
+        set_default_response_cache(None)
+        for model, client in zip(models, clients):
+            model.llm_client = client
+
+    print(format_report(results, skipped, time.perf_counter() - start))
+    return 0 if all(r.status == "succeeded" for r in results) else 1
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    return asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -49,6 +49,7 @@ class UserFile(BaseModel):
     original_filename: str
     user_id: str
     file_uri: str
+    content_hash: Optional[str] = None
     create_date: datetime
     update_date: datetime
     is_deleted: bool
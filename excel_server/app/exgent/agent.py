@@ -3,20 +3,34 @@ from typing import Any, Optional
 
 from app.domain import SheetStructure
 from app.exgent.agent_utils import (
+    SHEET_PROMPT_FORMAT,
     CustomLiteLlm,
+    sheet_instruction,
 )
+from app.exgent.heuristic_structure_agent import (
+    HeuristicStructureAgent,
+    skip_when_structure_detected,
+)
+from app.exgent.parse_sheet_structure_agent import ParseSheetStructureAgent
 from app.exgent.tag_groups_agent import tag_all_groups_agent
 from app.exgent.validate_sheet_structure_agent import ValidateSheetStructureAgent
 from google.adk.agents.llm_agent import LlmAgent
 from google.adk.agents.sequential_agent import SequentialAgent
 from pydantic import BaseModel
 
-EXCEL_FILE_DATA = "excel_file_data"
+# Matches how sheet_instruction renders {excel_file_data}; replaces the
+# <sheet data> marker of SHEET_STRUCTURE_PROMPT
+SHEET_DATA_DESCRIPTION = (
+    "CSV-formatted data representing a client's financial statement"
+    if SHEET_PROMPT_FORMAT == "csv"
+    else "the cells of a client's financial statement, one row per line, "
+    "prefixed with the row number"
+)
 
 SHEET_STRUCTURE_PROMPT = dedent("""
 **Role:** You are an expert financial analyst.
 
-**Task:** You will receive CSV-formatted data representing a client's financial statement. Your goal is to analyze this data *without writing any code* to understand its structure.
+**Task:** You will receive <sheet data>. Your goal is to analyze this data *without writing any code* to understand its structure.
 
 **Instructions:**
 
@@ -35,8 +49,8 @@ Important: You must complete all the steps above before generating your output.
 **Output Format:**
 Your response should be human readable **markdown:: format.
 Respond to the user that your task is to **Identify the structure of the excel file**. Then,
-1. Clearly state the statement type
-2. Then state the financial items column and date columns. You must output the column index. Index starts at 1.
+1. Clearly state the statement type, as `Statement Type: <type>`
+2. Then state the financial items column and date columns, as `Financial Items Column: <index>` and `Date Columns: <comma separated indices>`. You must output the column index. Index starts at 1.
 3. Then proceed to ouput the groups in the following format:
     * Group Name: A descriptive name from the group
     * Header Rows: List of comma separated row numbers representing the header rows in the group
@@ -47,11 +61,12 @@ Respond to the user that your task is to **Identify the structure of the excel f
 Important: do not include any other text or explanation in your response.
 If you notice you have already performed the task, varify your work and output a fresh response.
 -----
+{sheet_structure_hint?}
 
 **Data for Analysis:**
 
 {excel_file_data}
-""")
+""").replace("<sheet data>", SHEET_DATA_DESCRIPTION)
 
 STRUCTUED_RESPONSE_PROMPT = dedent("""
 Extract data from the input below
@@ -63,21 +78,34 @@ Input Text:
 """)
 
 
+QA_PROMPT = """
+    You are a helpful assistant. Use the provided knowledge base to answer user queries.
+    If the question does not pertain to the excel sheet, you should politely decline to answer.
+    If the question is not clear, you should ask the user to clarify.
+
+    Data for analysis:
+    {excel_file_data}
+    """
+
+
 class UIResponse(BaseModel):
     task_name: str
     data: Optional[dict[str, Any] | list[Any]] = None
     user_confirmation: Optional[bool] = None
 
 
+heuristic_structure_agent = HeuristicStructureAgent()
+
 generate_agent = LlmAgent(
     name="excel_tag_generate_agent",
     model=CustomLiteLlm(
         model="gemini/gemini-2.5-pro",
         stream=True,
     ),
-    instruction=SHEET_STRUCTURE_PROMPT,
+    instruction=sheet_instruction(SHEET_STRUCTURE_PROMPT),
     output_key="sheet_structure_human_readable",
     include_contents="none",
+    before_agent_callback=skip_when_structure_detected,
 )
 
 
@@ -132,6 +160,14 @@ structured_response_agent = LlmAgent(
     output_key="sheet_structure_json",
 )
 
+# The markdown from generate_agent is parsed locally; structured_response_agent
+# only runs when that fails
+parse_sheet_structure_agent = ParseSheetStructureAgent(
+    input_key="sheet_structure_human_readable",
+    output_key="sheet_structure_json",
+    fallback_agent=structured_response_agent,
+)
+
 validate_sheet_structure_agent = ValidateSheetStructureAgent(
     input_key="sheet_structure_json"
 )
@@ -145,22 +181,16 @@ qa_agent = LlmAgent(
         stream=True,
     ),
     description="Use this agent for general questions, FAQs, or information lookups.",
-    instruction="""
-    You are a helpful assistant. Use the provided knowledge base to answer user queries.
-    If the question does not pertain to the excel sheet, you should politely decline to answer.
-    If the question is not clear, you should ask the user to clarify.
-
-    Data for analysis:
-    {excel_file_data}
-    """,
+    instruction=sheet_instruction(QA_PROMPT),
 )
 
 excel_tag_agent = SequentialAgent(
     name="excel_tag_agent",
     description="Use this agent for tagging tasks.",
     sub_agents=[
+        heuristic_structure_agent,
         generate_agent,
-        structured_response_agent,
+        parse_sheet_structure_agent,
         validate_sheet_structure_agent,
         tag_all_groups_agent,
     ],
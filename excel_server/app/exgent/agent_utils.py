@@ -1,28 +1,94 @@
+import csv
+import functools
+import io
+import os
+import weakref
+from collections.abc import Mapping
 from typing import Any, AsyncGenerator, Optional
 
+from app.domain import SheetData
+from app.exgent.llm_cache import CACHE_METADATA_KEY, get_default_response_cache
+from app.exgent.llm_scheduler import estimate_request_tokens, get_default_scheduler
+from app.exgent.sheet_encoding import encode_sheet_compact
+from app.exgent.sheet_frame import SheetFrame
 from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.llm_agent import InstructionProvider
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.models.lite_llm import LiteLlm
 from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
+from google.adk.utils.instructions_utils import inject_session_state
+
+EXCEL_FILE_DATA = "excel_file_data"
+EXCEL_FILE_REF = "excel_file_ref"
+
+# How the sheet is rendered into prompts: "compact" (row-prefixed, empty
+# cells dropped) or "csv" (the full grid)
+SHEET_PROMPT_FORMAT = os.getenv("sheet_prompt_format", "compact")
+# When > 0, compact sheets are truncated to about this many tokens
+SHEET_PROMPT_TOKEN_BUDGET = int(os.getenv("sheet_prompt_token_budget", "0"))
+
+# SheetSources of the sheets agents are running on, by the reference sessions
+# keep in `excel_file_ref`. An entry lives as long as something (a run's
+# custom_metadata, the server's SheetSourceCache) still holds the source.
+_sheet_sources: weakref.WeakValueDictionary[str, Any] = weakref.WeakValueDictionary()
 
 
 class CustomLiteLlm(LiteLlm):
     force_stream: Optional[bool] = None
+    # Use the default LlmResponseCache, when one is configured
+    use_response_cache: bool = True
+    # Queue calls in the default LlmScheduler, when one is configured
+    use_scheduler: bool = True
 
     def __init__(self, model: str, stream: Optional[bool] = None, **kwargs):
         super().__init__(model=model, **kwargs)
         self.force_stream = stream
 
+    def _call_model(
+        self, llm_request: LlmRequest, stream: bool
+    ) -> AsyncGenerator[LlmResponse, None]:
+        scheduler = get_default_scheduler() if self.use_scheduler else None
+        call = functools.partial(
+            super().generate_content_async, llm_request, stream=stream
+        )
+        if scheduler is None:
+            return call()
+        return scheduler.run(
+            llm_request.model or self.model, estimate_request_tokens(llm_request), call
+        )
+
     async def generate_content_async(
         self, llm_request: LlmRequest, stream: bool = False
     ) -> AsyncGenerator[LlmResponse, None]:
         if self.force_stream is not None:
             stream = self.force_stream
 
-        async for response in super().generate_content_async(
-            llm_request, stream=stream
-        ):
+        cache = get_default_response_cache() if self.use_response_cache else None
+        if cache is None:
+            async for response in self._call_model(llm_request, stream):
+                yield response
+            return
+
+        cache_key = cache.make_key(llm_request.model or self.model, llm_request)
+        cached = await cache.lookup(cache_key.key)
+        if cached is not None:
+            for response in cached:
+                yield response
+            return
+
+        # Partial chunks are not cached; the final responses are, tagged with
+        # the key they are stored under.
+        final_responses: list[LlmResponse] = []
+        async for response in self._call_model(llm_request, stream):
+            if not response.partial:
+                response.custom_metadata = {
+                    **(response.custom_metadata or {}),
+                    CACHE_METADATA_KEY: {"hit": False, "key": cache_key.key},
+                }
+                final_responses.append(response.model_copy(deep=True))
             yield response
+        await cache.store(cache_key, final_responses)
 
 
 def get_session_state(
@@ -56,3 +122,94 @@ def get_custom_metadata(
         raise ValueError(f"Required metadata '{key}' is missing")
 
     return value
+
+
+def get_sheet_csv(invocation_context: InvocationContext) -> str:
+    """Returns the CSV of the sheet the conversation is about.
+
+    The session only keeps a reference (`excel_file_ref`); the content comes
+    from the `sheet_source` passed in custom_metadata. Sessions created before
+    that still carry the CSV itself in `excel_file_data`.
+    """
+    run_config = invocation_context.run_config
+    custom_metadata = (run_config.custom_metadata if run_config else None) or {}
+    source = custom_metadata.get("sheet_source")
+    if source is not None:
+        return source.csv
+
+    csv_data = get_session_state(invocation_context).get(EXCEL_FILE_DATA)
+    if csv_data is None:
+        raise ValueError("Excel file data is not set for key: excel_file_data")
+    return csv_data
+
+
+def get_sheet_frame(invocation_context: InvocationContext) -> SheetFrame:
+    """Returns the parsed sheet shared by the agents of an invocation.
+
+    The frame is built once per sheet source and reused by every sub-agent;
+    legacy sessions without a source get one parsed from their stored CSV.
+    """
+    run_config = invocation_context.run_config
+    custom_metadata = (run_config.custom_metadata if run_config else None) or {}
+    source = custom_metadata.get("sheet_source")
+    if source is not None:
+        return source.frame
+
+    rows = list(csv.reader(io.StringIO(get_sheet_csv(invocation_context))))
+    return SheetFrame.from_sheet_data(SheetData(data=rows))
+
+
+def render_sheet_source(source: Any) -> str:
+    """The sheet of a SheetSource as it is embedded in prompts."""
+    if SHEET_PROMPT_FORMAT == "csv":
+        return source.csv
+    return source.compact(SHEET_PROMPT_TOKEN_BUDGET)
+
+
+def register_sheet_source(source: Any) -> None:
+    """Makes `source` resolvable from the `excel_file_ref` of a session."""
+    _sheet_sources[source.key] = source
+
+
+def get_state_sheet_text(state: Mapping[str, Any]) -> str:
+    """Returns the sheet a session state refers to, rendered for prompts.
+
+    `excel_file_ref` is resolved through the registered sheet sources; legacy
+    sessions carry the CSV itself in `excel_file_data`.
+    """
+    ref = state.get(EXCEL_FILE_REF)
+    source = _sheet_sources.get(ref) if ref is not None else None
+    if source is not None:
+        return render_sheet_source(source)
+
+    csv_data = state.get(EXCEL_FILE_DATA)
+    if csv_data is None:
+        raise ValueError(f"No sheet source registered for {EXCEL_FILE_REF}={ref!r}")
+    if SHEET_PROMPT_FORMAT == "csv":
+        return csv_data
+    rows = list(csv.reader(io.StringIO(csv_data)))
+    return encode_sheet_compact(
+        SheetFrame.from_sheet_data(SheetData(data=rows)), SHEET_PROMPT_TOKEN_BUDGET
+    )
+
+
+def sheet_instruction(template: str) -> InstructionProvider:
+    """Instruction provider that renders `{excel_file_data}` from the sheet source.
+
+    The sheet is looked up from the session state's `excel_file_ref`, see
+    register_sheet_source. The rest of the template gets the usual session
+    state injection; the sheet is spliced in afterwards so braces in cell
+    values are left alone.
+    """
+    placeholder = "{" + EXCEL_FILE_DATA + "}"
+
+    async def provider(readonly_context: ReadonlyContext) -> str:
+        pieces = [
+            await inject_session_state(piece, readonly_context)
+            for piece in template.split(placeholder)
+        ]
+        if len(pieces) == 1:
+            return pieces[0]
+        return get_state_sheet_text(readonly_context.state).join(pieces)
+
+    return provider
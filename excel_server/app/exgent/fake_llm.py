@@ -0,0 +1,270 @@
+import asyncio
+import csv
+import io
+import re
+from typing import Any, AsyncIterator, Callable, Optional, Union
+
+import numpy as np
+from app.domain import ReportGroup, SheetData, SheetStructure
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.structure_heuristics import (
+    detect_columns,
+    detect_sheet_structure,
+    detect_statement_type,
+)
+from app.exgent.structure_parser import (
+    StructureParseError,
+    format_sheet_structure_markdown,
+    parse_sheet_structure_markdown,
+)
+from google.adk.models.lite_llm import LiteLLMClient
+from litellm import ModelResponse
+from litellm.exceptions import RateLimitError
+
+# (model, messages) -> reply text
+FakeReply = Callable[[str, list[dict[str, Any]]], str]
+
+
+def _message_text(message: dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(str(part.get("text", "")) for part in content)
+    return content
+
+
+def echo_reply(model: str, messages: list[dict[str, Any]]) -> str:
+    return f"{model}: {_message_text(messages[-1]) if messages else ''}"
+
+
+class FakeLiteLLMClient(LiteLLMClient):
+    """
+    Local stand-in for the LiteLLM client of CustomLiteLlm.
+
+    Answers every completion with `reply(model, messages)` after `latency`
+    seconds, streamed or not, and can fail the first `rate_limit_failures`
+    calls with a 429 the way a provider under load does. Records calls and
+    peak concurrency so limits can be checked. Install it with
+    `model.llm_client = FakeLiteLLMClient(...)`.
+    """
+
+    def __init__(
+        self,
+        reply: FakeReply = echo_reply,
+        latency: float = 0.0,
+        rate_limit_failures: int = 0,
+        tokens_per_call: int = 10,
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.rate_limit_failures = rate_limit_failures
+        self.tokens_per_call = tokens_per_call
+        self.calls: list[dict[str, Any]] = []
+        self.running = 0
+        self.max_running = 0
+
+    def _usage(self) -> dict[str, int]:
+        return {
+            "prompt_tokens": self.tokens_per_call,
+            "completion_tokens": 0,
+            "total_tokens": self.tokens_per_call,
+        }
+
+    async def _complete(self, model: str, messages: list[dict[str, Any]]) -> str:
+        self.calls.append({"model": model, "messages": messages})
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.rate_limit_failures > 0:
+                self.rate_limit_failures -= 1
+                raise RateLimitError(
+                    message="Rate limit exceeded (fake)",
+                    llm_provider="fake",
+                    model=model,
+                )
+            return self.reply(model, messages)
+        finally:
+            self.running -= 1
+
+    async def acompletion(
+        self, model, messages, tools, **kwargs
+    ) -> Union[ModelResponse, AsyncIterator[ModelResponse]]:
+        text = await self._complete(model, messages)
+        if not kwargs.get("stream"):
+            return ModelResponse(
+                choices=[
+                    {
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                usage=self._usage(),
+            )
+        return self._stream(text)
+
+    async def _stream(self, text: str) -> AsyncIterator[ModelResponse]:
+        yield ModelResponse(
+            stream=True,
+            choices=[{"delta": {"role": "assistant", "content": text}}],
+        )
+        yield ModelResponse(
+            stream=True,
+            choices=[{"delta": {}, "finish_reason": "stop"}],
+            usage=self._usage(),
+        )
+
+
+def install_fake_llm(
+    models: list[Any], client: Optional[FakeLiteLLMClient] = None
+) -> FakeLiteLLMClient:
+    """Points the given CustomLiteLlm models at one shared fake client."""
+    client = client or FakeLiteLLMClient()
+    for model in models:
+        model.llm_client = client
+    return client
+
+
+# --- Scripted replies for the tagging pipeline ---
+
+_COMPACT_ROW = re.compile(r"^(\d+) @(\d+): (.*)$")
+
+# Ontology tag for the first keyword found in a lowercased label
+_TAG_KEYWORDS = [
+    (("discount",), "Total Discounts"),
+    (
+        ("return", "refund", "cancellation", "allowance"),
+        "Total Cancellation and Returns",
+    ),
+    (("revenue", "sales"), "Gross Revenue"),
+    (("cost of", "cogs", "product cost"), "Gross Product Cost"),
+    (("shipping", "fulfillment", "merchant"), "Fulfillment, Shipping, Merchant Fee"),
+    (("marketing", "advertising"), "Marketing"),
+    (("payroll", "salar", "wage", "benefit", "bonus"), "Payroll, Benefits, and Admin"),
+    (("interest",), "Interest"),
+    (("depreciation", "amortization"), "Depreciation & Amortization"),
+    (("tax",), "Taxes"),
+    (("expense",), "Other Operating Expenses"),
+    (("cash", "bank"), "Cash and bank balances"),
+    (("inventor",), "Inventory"),
+    (("receivable",), "Accounts receivable"),
+    (("credit card",), "Credit Cards"),
+    (("payable",), "Accounts payable"),
+    (("property", "equipment"), "Property, Plant, & Equipment"),
+    (("loan", "debt"), "Long Term Debt (under LTL)"),
+    (("equity", "capital", "retained"), "Equity"),
+]
+
+
+def _sheet_frame_from_prompt(prompt: str) -> Optional[SheetFrame]:
+    """Rebuilds the sheet from the data section of the structure prompt."""
+    data = prompt.split("**Data for Analysis:**", 1)[-1]
+    cells: dict[tuple[int, int], str] = {}
+    for line in data.splitlines():
+        match = _COMPACT_ROW.match(line)
+        if match:
+            row, column = int(match.group(1)), int(match.group(2))
+            for offset, value in enumerate(match.group(3).split("|")):
+                cells[row, column + offset] = value
+    if cells:
+        n_rows = max(r for r, _ in cells) + 1
+        n_cols = max(c for _, c in cells) + 1
+        rows = [[str(r)] + [""] * (n_cols - 1) for r in range(n_rows)]
+        for (r, c), value in cells.items():
+            rows[r][c] = value
+        return SheetFrame.from_sheet_data(SheetData(data=rows))
+
+    # sheet_prompt_format=csv sends the whole grid
+    rows = [row for row in csv.reader(io.StringIO(data.strip())) if row]
+    return SheetFrame.from_sheet_data(SheetData(data=rows)) if len(rows) > 1 else None
+
+
+def _fallback_structure(frame: SheetFrame) -> Optional[SheetStructure]:
+    """One group of all rows with numbers, the last one being its total."""
+    columns = detect_columns(frame)
+    if columns is None:
+        return None
+    items_column, date_columns = columns
+    numeric = ~np.isnan(frame.values[:, date_columns]).all(axis=1)
+    rows = [
+        r
+        for r in range(1, frame.shape[0])
+        if numeric[r] and str(frame.labels[r, items_column]).strip()
+    ]
+    if len(rows) < 2:
+        return None
+    labels = [str(frame.labels[r, items_column]).strip() for r in rows]
+    return SheetStructure(
+        statement_type=detect_statement_type(labels) or "Income Statement",
+        financial_items_column=items_column,
+        date_columns=date_columns,
+        groups=[
+            ReportGroup(
+                name=labels[-1], header_rows=[], line_items=rows[:-1], total=rows[-1]
+            )
+        ],
+    )
+
+
+def _structure_reply(prompt: str) -> str:
+    frame = _sheet_frame_from_prompt(prompt)
+    structure = None
+    if frame is not None:
+        structure = detect_sheet_structure(frame) or _fallback_structure(frame)
+    if frame is None or structure is None:
+        return "No financial statement groups were found in this sheet."
+    return format_sheet_structure_markdown(structure)
+
+
+def _extraction_reply(prompt: str) -> str:
+    try:
+        structure = parse_sheet_structure_markdown(prompt)
+    except StructureParseError:
+        structure = SheetStructure(
+            statement_type="Unknown",
+            financial_items_column=1,
+            date_columns=[2],
+            groups=[],
+        )
+    return structure.model_dump_json()
+
+
+def _tag_for(label: str, is_total: bool) -> str:
+    label = label.casefold()
+    for keywords, tag in _TAG_KEYWORDS:
+        if any(keyword in label for keyword in keywords):
+            if tag == "Gross Revenue" and is_total:
+                return "Net Revenue"
+            return tag
+    return "Unclear"
+
+
+def _tag_reply(prompt: str) -> str:
+    data = prompt.split("**User Input:**", 1)[-1]
+    lines = []
+    for row in csv.reader(io.StringIO(data.strip())):
+        # row_number,row_type,financial_item,value
+        if len(row) >= 3 and row[0].strip().isdigit() and row[1] != "header":
+            lines.append(f"{row[0].strip()},{_tag_for(row[2], row[1] == 'total_row')}")
+    return "\n".join(lines)
+
+
+def pipeline_reply(model: str, messages: list[dict[str, Any]]) -> str:
+    """
+    Plausible replies for each prompt of excel_tag_agent, computed locally.
+
+    * structure detection: the rule-based structure of the sheet in the
+      prompt, or a single group of its numeric rows;
+    * structure extraction: the markdown structure as SheetStructure JSON;
+    * group tagging: `row,tag` lines picked by keywords of the labels.
+
+    Anything else is echoed. Meant for offline runs and tests, not for
+    judging tag quality.
+    """
+    prompt = "\n".join(_message_text(message) for message in messages)
+    if "**Data for Analysis:**" in prompt and "Statement Type" in prompt:
+        return _structure_reply(prompt)
+    if "Extract data from the input below" in prompt:
+        return _extraction_reply(prompt)
+    if "Internal Ontology" in prompt:
+        return _tag_reply(prompt)
+    return echo_reply(model, messages)
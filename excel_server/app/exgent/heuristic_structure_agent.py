@@ -0,0 +1,121 @@
+import os
+from typing import AsyncGenerator, Optional
+
+from app.exgent.agent_utils import get_sheet_frame
+from app.exgent.structure_heuristics import coverage, detect_sheet_structure
+from app.exgent.structure_parser import format_sheet_structure_markdown
+from app.exgent.validate_sheet_structure_agent import validate_groups
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.genai.types import Content, Part
+
+# Try rule-based structure detection before asking the LLM
+STRUCTURE_HEURISTICS = os.getenv("structure_heuristics", "true").lower() == "true"
+# Share of the labeled numeric rows the detected groups must cover before the
+# LLM is skipped; sheets the rules only partly understand still go to the LLM
+STRUCTURE_HEURISTICS_MIN_COVERAGE = float(
+    os.getenv("structure_heuristics_min_coverage", "0.8")
+)
+
+# Session state keys written for the structure detection agents
+SHEET_STRUCTURE_DETECTED = "sheet_structure_detected"
+SHEET_STRUCTURE_HINT = "sheet_structure_hint"
+SHEET_STRUCTURE_HUMAN_READABLE = "sheet_structure_human_readable"
+
+HINT_TEMPLATE = """
+**Candidate Structure:** Rule-based detection produced the structure below, but {reason}. Use it as a starting point only and verify every group against the data.
+
+{structure}
+"""
+
+
+class HeuristicStructureAgent(BaseAgent):
+    """Detects the sheet structure with local rules ahead of generate_agent.
+
+    When every detected group adds up (checked like ValidateSheetStructureAgent
+    does) and the groups cover enough of the sheet, the structure is written
+    to `sheet_structure_human_readable` and generate_agent is skipped via
+    `skip_when_structure_detected`. Otherwise the candidate is left in
+    `sheet_structure_hint` for the LLM prompt.
+    """
+
+    enabled: bool = STRUCTURE_HEURISTICS
+    min_coverage: float = STRUCTURE_HEURISTICS_MIN_COVERAGE
+
+    def __init__(
+        self,
+        enabled: bool = STRUCTURE_HEURISTICS,
+        min_coverage: float = STRUCTURE_HEURISTICS_MIN_COVERAGE,
+    ):
+        super().__init__(
+            name="heuristic_structure_agent",
+            enabled=enabled,  # pyright: ignore[reportCallIssue]
+            min_coverage=min_coverage,  # pyright: ignore[reportCallIssue]
+        )
+
+    def _detect(self, ctx: InvocationContext) -> dict[str, object]:
+        # State from an earlier run must not leak into this one
+        state_delta: dict[str, object] = {
+            SHEET_STRUCTURE_DETECTED: False,
+            SHEET_STRUCTURE_HINT: "",
+        }
+        if not self.enabled:
+            return state_delta
+
+        frame = get_sheet_frame(ctx)
+        candidate = detect_sheet_structure(frame)
+        if candidate is None:
+            return state_delta
+
+        total_labels = {
+            group.total: frame.labels[
+                group.total, candidate.financial_items_column
+            ].strip()
+            for group in candidate.groups
+        }
+        structure = format_sheet_structure_markdown(candidate, total_labels)
+        failed = sorted(
+            {r.group_name for r in validate_groups(frame, candidate) if not r.matches}
+        )
+        covered = coverage(frame, candidate)
+        if not failed and covered >= self.min_coverage:
+            state_delta[SHEET_STRUCTURE_DETECTED] = True
+            state_delta[SHEET_STRUCTURE_HUMAN_READABLE] = structure
+            return state_delta
+
+        if failed:
+            reason = f"these groups do not add up: {', '.join(failed)}"
+        else:
+            reason = f"its groups cover only {covered:.0%} of the rows with numbers"
+        state_delta[SHEET_STRUCTURE_HINT] = HINT_TEMPLATE.format(
+            reason=reason, structure=structure
+        )
+        return state_delta
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=self._detect(ctx)),
+        )
+
+
+def skip_when_structure_detected(
+    callback_context: CallbackContext,
+) -> Optional[Content]:
+    """before_agent_callback for generate_agent.
+
+    Replies with the locally detected structure instead of running the model.
+    """
+    if not callback_context.state.get(SHEET_STRUCTURE_DETECTED):
+        return None
+    return Content(
+        parts=[Part(text=callback_context.state[SHEET_STRUCTURE_HUMAN_READABLE])],
+        role="model",
+    )
@@ -0,0 +1,375 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import BaseModel, computed_field
+from sqlalchemy import DateTime, Integer, String, Text, create_engine, delete
+from sqlalchemy.orm import Mapped, declarative_base, mapped_column, sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# Key under which cache provenance is recorded in LlmResponse.custom_metadata
+CACHE_METADATA_KEY = "llm_cache"
+
+
+class CachedLlmResponse(BaseModel):
+    """A cached model reply together with what produced it."""
+
+    key: str
+    model: str
+    prompt_hash: str
+    output_schema: Optional[str] = None
+    # The request as sent to the model, for auditing what a reply answers
+    request_json: str
+    responses: list[LlmResponse]
+    created_at: datetime
+    hit_count: int = 0
+    last_hit_at: Optional[datetime] = None
+
+
+class LlmCacheKey(BaseModel):
+    key: str
+    model: str
+    prompt_hash: str
+    output_schema: Optional[str] = None
+    request_json: str
+
+
+class LlmCacheStats(BaseModel):
+    hits: int
+    misses: int
+    writes: int
+    bypassed: int
+
+    @computed_field
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+########################################################
+# Storage backends
+########################################################
+
+
+class LlmCacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedLlmResponse]:
+        pass
+
+    @abstractmethod
+    def put(self, entry: CachedLlmResponse) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    def record_hit(self, key: str, hit_at: datetime) -> None:
+        """Updates the audit counters of an entry that was served."""
+
+
+class InMemoryLlmCacheBackend(LlmCacheBackend):
+    """Process-local LRU of cached responses."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedLlmResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedLlmResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, entry: CachedLlmResponse) -> None:
+        with self._lock:
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def record_hit(self, key: str, hit_at: datetime) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.hit_count += 1
+                entry.last_hit_at = hit_at
+
+
+Base = declarative_base()
+
+
+class LlmResponseCacheModel(Base):
+    __tablename__ = "llm_response_cache"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    model: Mapped[str] = mapped_column(String)
+    prompt_hash: Mapped[str] = mapped_column(String)
+    output_schema: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    request_json: Mapped[str] = mapped_column(Text)
+    responses_json: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    hit_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_hit_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def to_pydantic(self) -> CachedLlmResponse:
+        return CachedLlmResponse(
+            key=self.key,
+            model=self.model,
+            prompt_hash=self.prompt_hash,
+            output_schema=self.output_schema,
+            request_json=self.request_json,
+            responses=[
+                LlmResponse.model_validate(r) for r in json.loads(self.responses_json)
+            ],
+            created_at=self.created_at.replace(tzinfo=timezone.utc),
+            hit_count=self.hit_count,
+            last_hit_at=(
+                self.last_hit_at.replace(tzinfo=timezone.utc)
+                if self.last_hit_at is not None
+                else None
+            ),
+        )
+
+
+class SqliteLlmCacheBackend(LlmCacheBackend):
+    """Cached responses persisted in a SQL database (SQLite on disk).
+
+    Entries survive restarts and can be inspected directly, e.g. to see which
+    request a cached reply was recorded for and how often it was served.
+    """
+
+    def __init__(self, db_url: str):
+        self.engine = create_engine(db_url)
+        Base.metadata.create_all(self.engine)
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine
+        )
+
+    def get(self, key: str) -> Optional[CachedLlmResponse]:
+        with self.SessionLocal() as session:
+            result = session.get(LlmResponseCacheModel, key)
+            return result.to_pydantic() if result else None
+
+    def put(self, entry: CachedLlmResponse) -> None:
+        with self.SessionLocal() as session:
+            session.merge(
+                LlmResponseCacheModel(
+                    key=entry.key,
+                    model=entry.model,
+                    prompt_hash=entry.prompt_hash,
+                    output_schema=entry.output_schema,
+                    request_json=entry.request_json,
+                    responses_json=json.dumps(
+                        [
+                            r.model_dump(mode="json", exclude_none=True)
+                            for r in entry.responses
+                        ]
+                    ),
+                    created_at=entry.created_at.astimezone(timezone.utc).replace(
+                        tzinfo=None
+                    ),
+                    hit_count=entry.hit_count,
+                    last_hit_at=(
+                        entry.last_hit_at.astimezone(timezone.utc).replace(tzinfo=None)
+                        if entry.last_hit_at is not None
+                        else None
+                    ),
+                )
+            )
+            session.commit()
+
+    def delete(self, key: str) -> None:
+        with self.SessionLocal() as session:
+            session.execute(
+                delete(LlmResponseCacheModel).where(LlmResponseCacheModel.key == key)
+            )
+            session.commit()
+
+    def record_hit(self, key: str, hit_at: datetime) -> None:
+        with self.SessionLocal() as session:
+            result = session.get(LlmResponseCacheModel, key)
+            if result is not None:
+                result.hit_count += 1
+                result.last_hit_at = hit_at.astimezone(timezone.utc).replace(
+                    tzinfo=None
+                )
+                session.commit()
+
+
+########################################################
+# Response cache
+########################################################
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextlib.contextmanager
+def llm_cache_bypass() -> Iterator[None]:
+    """Skips cache lookups for model calls made inside the block.
+
+    Fresh replies are still written, so this also refreshes stale entries.
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _schema_name(llm_request: LlmRequest) -> Optional[str]:
+    schema = llm_request.config.response_schema if llm_request.config else None
+    if schema is None:
+        return None
+    if isinstance(schema, type):
+        return f"{schema.__module__}.{schema.__qualname__}"
+    if hasattr(schema, "model_dump_json"):
+        return schema.model_dump_json(exclude_none=True)
+    return json.dumps(schema, sort_keys=True, default=str)
+
+
+def _request_json(llm_request: LlmRequest) -> str:
+    # Everything that shapes the reply: the rendered prompt, the system
+    # instruction, tools and generation settings. The response schema is
+    # keyed separately since it may be a python type.
+    config = (
+        llm_request.config.model_dump(
+            mode="json",
+            exclude_none=True,
+            exclude={"response_schema", "http_options", "labels"},
+        )
+        if llm_request.config
+        else {}
+    )
+    contents = [
+        c.model_dump(mode="json", exclude_none=True) for c in llm_request.contents
+    ]
+    return json.dumps({"contents": contents, "config": config}, sort_keys=True)
+
+
+class LlmResponseCache:
+    """Caches final model replies keyed by (model, prompt hash, output schema).
+
+    Only complete, error-free replies are stored. Replies served from the cache
+    carry `custom_metadata["llm_cache"]` with the entry key and the time it was
+    recorded, and fresh replies carry the key they were stored under, so every
+    event can be traced back to its cache entry.
+    """
+
+    def __init__(
+        self,
+        backend: LlmCacheBackend,
+        ttl_seconds: Optional[float] = None,
+        bypass: bool = False,
+    ):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.bypass = bypass
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._bypassed = 0
+
+    @staticmethod
+    def make_key(model: str, llm_request: LlmRequest) -> LlmCacheKey:
+        request_json = _request_json(llm_request)
+        prompt_hash = hashlib.sha256(request_json.encode("utf-8")).hexdigest()
+        schema = _schema_name(llm_request)
+        key = hashlib.sha256(
+            json.dumps([model, prompt_hash, schema]).encode("utf-8")
+        ).hexdigest()
+        return LlmCacheKey(
+            key=key,
+            model=model,
+            prompt_hash=prompt_hash,
+            output_schema=schema,
+            request_json=request_json,
+        )
+
+    def is_bypassed(self) -> bool:
+        return self.bypass or _bypass.get()
+
+    def _expired(self, entry: CachedLlmResponse, now: datetime) -> bool:
+        if self.ttl_seconds is None:
+            return False
+        return now - entry.created_at > timedelta(seconds=self.ttl_seconds)
+
+    async def lookup(self, key: str) -> Optional[list[LlmResponse]]:
+        if self.is_bypassed():
+            self._bypassed += 1
+            return None
+        entry = await asyncio.to_thread(self.backend.get, key)
+        now = datetime.now(timezone.utc)
+        if entry is not None and self._expired(entry, now):
+            await asyncio.to_thread(self.backend.delete, key)
+            entry = None
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        await asyncio.to_thread(self.backend.record_hit, key, now)
+        logger.info("LLM cache hit %s for %s", key[:12], entry.model)
+        responses = []
+        for response in entry.responses:
+            response = response.model_copy(deep=True)
+            response.custom_metadata = {
+                **(response.custom_metadata or {}),
+                CACHE_METADATA_KEY: {
+                    "hit": True,
+                    "key": key,
+                    "cached_at": entry.created_at.isoformat(),
+                },
+            }
+            responses.append(response)
+        return responses
+
+    async def store(self, cache_key: LlmCacheKey, responses: list[LlmResponse]) -> None:
+        if not responses or any(r.error_code for r in responses):
+            return
+        entry = CachedLlmResponse(
+            **cache_key.model_dump(),
+            responses=responses,
+            created_at=datetime.now(timezone.utc),
+        )
+        await asyncio.to_thread(self.backend.put, entry)
+        self._writes += 1
+
+    def stats(self) -> LlmCacheStats:
+        return LlmCacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            writes=self._writes,
+            bypassed=self._bypassed,
+        )
+
+
+_default_cache: Optional[LlmResponseCache] = None
+
+
+def set_default_response_cache(cache: Optional[LlmResponseCache]) -> None:
+    """Sets the cache used by CustomLiteLlm models; None disables caching."""
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_response_cache() -> Optional[LlmResponseCache]:
+    return _default_cache
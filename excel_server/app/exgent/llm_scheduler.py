@@ -0,0 +1,316 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import random
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import AsyncGenerator, AsyncIterator, Callable, Iterator, Optional
+
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from litellm.exceptions import RateLimitError
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Scheduling class of a model call; lower values are served first."""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class LlmQueueTimeout(TimeoutError):
+    """A model call could not start before its deadline."""
+
+
+class ModelLimits(BaseModel):
+    # Calls in flight at once
+    max_concurrency: int = 8
+    # Estimated prompt + actual reply tokens per minute; 0 means unlimited
+    tokens_per_minute: int = 0
+
+
+class ModelSchedulerStats(BaseModel):
+    model: str
+    active: int
+    queued: int
+    granted: int
+    timed_out: int
+    rate_limited: int
+    retries: int
+
+
+_priority: ContextVar[Priority] = ContextVar(
+    "llm_priority", default=Priority.INTERACTIVE
+)
+# Absolute time.monotonic() by which queued calls must have started
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+@contextlib.contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Runs the model calls made inside the block with the given priority.
+
+    Tasks started inside the block inherit it, so wrapping an agent run
+    covers all of its sub-agents.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextlib.contextmanager
+def llm_deadline(seconds: float) -> Iterator[None]:
+    """Model calls made inside the block give up if not started in `seconds`."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def estimate_request_tokens(llm_request: LlmRequest) -> int:
+    """Rough prompt size of a request (about 4 characters a token)."""
+    chars = 0
+    config = llm_request.config
+    if config is not None and isinstance(config.system_instruction, str):
+        chars += len(config.system_instruction)
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            if part.text:
+                chars += len(part.text)
+    return max(1, (chars + 3) // 4)
+
+
+class _Waiter:
+    def __init__(self, future: asyncio.Future, tokens: int):
+        self.future = future
+        self.tokens = tokens
+
+
+class LlmLease:
+    """A granted slot; records the reply's actual token usage."""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.used_tokens: Optional[int] = None
+
+    def record(self, response: LlmResponse) -> None:
+        usage = response.usage_metadata
+        if usage is not None and usage.total_token_count:
+            self.used_tokens = usage.total_token_count
+
+
+class _ModelState:
+    def __init__(self, limits: ModelLimits):
+        self.limits = limits
+        self.active = 0
+        self.tokens = float(limits.tokens_per_minute)
+        self.updated = time.monotonic()
+        self.waiters: list[tuple[int, float, int, _Waiter]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.timed_out = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+    @property
+    def rate(self) -> float:
+        return self.limits.tokens_per_minute / 60.0
+
+    def refill(self, now: float) -> None:
+        capacity = self.limits.tokens_per_minute
+        if capacity > 0:
+            self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class LlmScheduler:
+    """
+    Shared admission control for model calls.
+
+    Each model gets a concurrency limit and an optional token bucket refilled
+    at `tokens_per_minute`. Calls queue by priority class, then by earliest
+    deadline, then in arrival order. A call that cannot start before its
+    deadline raises LlmQueueTimeout. Calls failing with a 429 before
+    producing output are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        default_limits: Optional[ModelLimits] = None,
+        model_limits: Optional[dict[str, ModelLimits]] = None,
+        max_retries: int = 3,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 30.0,
+        queue_timeout_seconds: Optional[float] = None,
+    ):
+        self.default_limits = default_limits or ModelLimits()
+        self.model_limits = model_limits or {}
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._models: dict[str, _ModelState] = {}
+        self._seq = itertools.count()
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            limits = self.model_limits.get(model, self.default_limits)
+            state = self._models[model] = _ModelState(limits)
+        return state
+
+    def _dispatch(self, state: _ModelState) -> None:
+        """Grants queued calls in order while limits allow."""
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        now = time.monotonic()
+        state.refill(now)
+        capacity = state.limits.tokens_per_minute
+        while state.waiters:
+            waiter = state.waiters[0][-1]
+            if waiter.future.done():
+                # Timed out or cancelled while queued
+                heapq.heappop(state.waiters)
+                continue
+            if state.active >= state.limits.max_concurrency:
+                return
+            if capacity > 0:
+                # Calls larger than the whole bucket wait for a full bucket
+                needed = min(waiter.tokens, capacity)
+                if state.tokens < needed:
+                    delay = (needed - state.tokens) / state.rate
+                    state.timer = asyncio.get_running_loop().call_later(
+                        delay, self._dispatch, state
+                    )
+                    return
+                state.tokens -= waiter.tokens
+            heapq.heappop(state.waiters)
+            state.active += 1
+            state.granted += 1
+            waiter.future.set_result(None)
+
+    def _release(self, state: _ModelState, lease: LlmLease) -> None:
+        state.active -= 1
+        if state.limits.tokens_per_minute > 0 and lease.used_tokens is not None:
+            # Settle the estimate against what the call actually used
+            state.refill(time.monotonic())
+            state.tokens -= lease.used_tokens - lease.tokens
+        self._dispatch(state)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model: str, tokens: int) -> AsyncIterator[LlmLease]:
+        """Waits for a slot of `model` with room for `tokens` and holds it."""
+        state = self._state(model)
+        deadline = _deadline.get()
+        if self.queue_timeout_seconds is not None:
+            queue_deadline = time.monotonic() + self.queue_timeout_seconds
+            deadline = (
+                queue_deadline if deadline is None else min(deadline, queue_deadline)
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            state.waiters,
+            (
+                _priority.get(),
+                deadline if deadline is not None else math.inf,
+                next(self._seq),
+                _Waiter(future, tokens),
+            ),
+        )
+        self._dispatch(state)
+
+        lease = LlmLease(tokens)
+        if not future.done():
+            timeout = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            try:
+                done, _ = await asyncio.wait({future}, timeout=timeout)
+            except BaseException:
+                if not future.cancel():
+                    self._release(state, lease)
+                raise
+            if not done:
+                future.cancel()
+                state.timed_out += 1
+                self._dispatch(state)
+                raise LlmQueueTimeout(
+                    f"No {model} slot became free before the deadline"
+                )
+        try:
+            yield lease
+        finally:
+            self._release(state, lease)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max_seconds, self.backoff_base_seconds * 2**attempt)
+        # Equal jitter keeps retries of a burst from landing together
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def run(
+        self,
+        model: str,
+        tokens: int,
+        call: Callable[[], AsyncGenerator[LlmResponse, None]],
+    ) -> AsyncGenerator[LlmResponse, None]:
+        """Streams `call()` inside a slot, retrying rate limited attempts."""
+        state = self._state(model)
+        for attempt in itertools.count():
+            produced = False
+            try:
+                async with self.slot(model, tokens) as lease:
+                    async for response in call():
+                        produced = True
+                        lease.record(response)
+                        yield response
+                return
+            except RateLimitError:
+                state.rate_limited += 1
+                # A partly streamed reply cannot be replayed
+                if produced or attempt >= self.max_retries:
+                    raise
+            delay = self._backoff(attempt)
+            state.retries += 1
+            logger.info("%s rate limited, retry %d in %.1fs", model, attempt + 1, delay)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> list[ModelSchedulerStats]:
+        return [
+            ModelSchedulerStats(
+                model=model,
+                active=state.active,
+                queued=sum(not w[-1].future.done() for w in state.waiters),
+                granted=state.granted,
+                timed_out=state.timed_out,
+                rate_limited=state.rate_limited,
+                retries=state.retries,
+            )
+            for model, state in self._models.items()
+        ]
+
+
+_default_scheduler: Optional[LlmScheduler] = None
+
+
+def set_default_scheduler(scheduler: Optional[LlmScheduler]) -> None:
+    """Sets the scheduler used by CustomLiteLlm models; None disables it."""
+    global _default_scheduler
+    _default_scheduler = scheduler
+
+
+def get_default_scheduler() -> Optional[LlmScheduler]:
+    return _default_scheduler
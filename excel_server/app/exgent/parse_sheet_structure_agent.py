@@ -0,0 +1,81 @@
+import logging
+import os
+from typing import AsyncGenerator
+
+from app.exgent.agent_utils import get_sheet_frame
+from app.exgent.structure_parser import (
+    StructureParseError,
+    parse_sheet_structure_markdown,
+)
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.genai.types import Content, Part
+
+logger = logging.getLogger(__name__)
+
+# Parse the markdown structure reply locally and only ask the fallback agent
+# (an LLM extraction call) when the reply does not follow the expected layout
+STRUCTURE_LOCAL_PARSER = os.getenv("structure_local_parser", "true").lower() == "true"
+
+
+class ParseSheetStructureAgent(BaseAgent):
+    """Turns the human readable structure in `input_key` into a SheetStructure.
+
+    The structure is written to `output_key` the way an LlmAgent with
+    `output_schema=SheetStructure` would, so later agents do not care which
+    path produced it.
+    """
+
+    input_key: str
+    output_key: str
+    use_local_parser: bool = STRUCTURE_LOCAL_PARSER
+
+    def __init__(
+        self,
+        input_key: str,
+        output_key: str,
+        fallback_agent: BaseAgent,
+        use_local_parser: bool = STRUCTURE_LOCAL_PARSER,
+    ):
+        super().__init__(
+            name="parse_sheet_structure_agent",
+            input_key=input_key,  # pyright: ignore[reportCallIssue]
+            output_key=output_key,  # pyright: ignore[reportCallIssue]
+            use_local_parser=use_local_parser,  # pyright: ignore[reportCallIssue]
+            sub_agents=[fallback_agent],
+        )
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        if self.use_local_parser:
+            n_rows, n_cols = get_sheet_frame(ctx).shape
+            try:
+                sheet_structure = parse_sheet_structure_markdown(
+                    ctx.session.state.get(self.input_key) or "", n_rows, n_cols
+                )
+            except StructureParseError as e:
+                logger.info("Structure reply not parsed locally, using LLM: %s", e)
+            else:
+                yield Event(
+                    invocation_id=ctx.invocation_id,
+                    author=self.name,
+                    branch=ctx.branch,
+                    content=Content(
+                        parts=[Part(text=sheet_structure.model_dump_json())],
+                        role="model",
+                    ),
+                    actions=EventActions(
+                        state_delta={
+                            self.output_key: sheet_structure.model_dump(
+                                exclude_none=True
+                            )
+                        }
+                    ),
+                )
+                return
+
+        async for event in self.sub_agents[0].run_async(ctx):
+            yield event
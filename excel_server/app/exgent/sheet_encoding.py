@@ -0,0 +1,76 @@
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.tag_groups_utils import estimate_tokens
+
+COMPACT_SHEET_PREAMBLE = (
+    "One line per non-empty row: `row @column: cell|cell|...`. Cells are listed "
+    "from the given column on (column 1 is A); leading and trailing empty "
+    "cells are left out and inner empty cells are blank."
+)
+
+
+def _cell(value: str) -> str:
+    # Keep leading indentation, it often marks the row hierarchy
+    value = value.rstrip().replace("\r", " ").replace("\n", " ").replace("|", "/")
+    # Dates are read as midnight timestamps and integral values as floats
+    if value.endswith(" 00:00:00"):
+        return value[: -len(" 00:00:00")]
+    if value.endswith(".0") and value[:-2].lstrip("-").isdigit():
+        return value[:-2]
+    return value
+
+
+def compact_rows(frame: SheetFrame) -> list[str]:
+    """
+    Encodes each non-empty row of the sheet as `row @column: cell|cell|...`.
+
+    Row 0 (column letters) and column 0 (row numbers) of the grid are
+    dropped since every line carries both, and so are the empty cells at
+    either end of a row, which also removes trailing columns.
+    """
+    labels = frame.labels[1:, 1:]
+    lines = []
+    for row_idx, row in enumerate(labels, start=1):
+        cells = [_cell(value) if value else "" for value in row]
+        filled = [i for i, cell in enumerate(cells) if cell.strip()]
+        if filled:
+            first, last = filled[0], filled[-1]
+            lines.append(
+                f"{row_idx} @{first + 1}: " + "|".join(cells[first : last + 1])
+            )
+    return lines
+
+
+def encode_sheet_compact(frame: SheetFrame, token_budget: int = 0) -> str:
+    """
+    Compact, row-number-prefixed text of the sheet for prompts.
+
+    With a token budget (> 0), rows past the budget are cut and replaced by a
+    line saying which rows were left out, so the model knows the sheet is
+    incomplete.
+    """
+    lines = compact_rows(frame)
+    text = "\n".join([COMPACT_SHEET_PREAMBLE, *lines])
+    if token_budget <= 0 or estimate_tokens(text) <= token_budget:
+        return text
+
+    kept = [COMPACT_SHEET_PREAMBLE]
+    # Leave room for the truncation note
+    used = estimate_tokens(COMPACT_SHEET_PREAMBLE) + 32
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > token_budget:
+            break
+        kept.append(line)
+        used += tokens
+
+    omitted = lines[len(kept) - 1 :]
+    if not omitted:
+        # No row was cut, e.g. an empty sheet with a budget below the preamble
+        return "\n".join(kept)
+    first_row = omitted[0].split(" ", 1)[0]
+    last_row = omitted[-1].split(" ", 1)[0]
+    kept.append(
+        f"[truncated: {len(omitted)} more non-empty rows ({first_row}-{last_row}) "
+        f"of {frame.shape[0] - 1} were left out to fit the token budget]"
+    )
+    return "\n".join(kept)
@@ -0,0 +1,70 @@
+import math
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from app.domain import SheetData
+
+
+def parse_number(value: Optional[str]) -> float:
+    """Parses a financial cell value, NaN when it is not a number.
+
+    Handles negatives in parentheses, currency symbols and thousands
+    separators, e.g. `($1,234.50)` -> -1234.5.
+    """
+    if value is None:
+        return math.nan
+    s = str(value).strip()
+    if not s:
+        return math.nan
+    # Handle negative numbers in parentheses
+    if "(" in s and ")" in s:
+        s = "-" + s.replace("(", "").replace(")", "")
+    # Remove currency symbols and commas
+    s = s.replace("$", "").replace(",", "").replace(" ", "")
+    try:
+        return float(s)
+    except ValueError:
+        return math.nan
+
+
+def parse_numbers(labels: np.ndarray) -> np.ndarray:
+    """Vectorized parse_number over a grid of cell strings."""
+    cells = pd.Series(labels.ravel(), dtype=object).fillna("").astype(str).str.strip()
+    negative = cells.str.contains("(", regex=False) & cells.str.contains(
+        ")", regex=False
+    )
+    cells = cells.where(~negative, "-" + cells.str.replace(r"[()]", "", regex=True))
+    cells = cells.str.replace(r"[$, ]", "", regex=True)
+    values = pd.to_numeric(cells, errors="coerce").to_numpy(dtype=np.float64)
+    return values.reshape(labels.shape)
+
+
+class SheetFrame:
+    """Typed view of a sheet grid, built once from SheetData.
+
+    `labels` holds the cell strings and `values` the same grid parsed as
+    numbers (NaN where a cell is not numeric). Row and column indices match
+    the SheetData grid, i.e. the row numbers the agents work with.
+    """
+
+    def __init__(self, labels: np.ndarray, values: np.ndarray):
+        self.labels = labels
+        self.values = values
+
+    @classmethod
+    def from_sheet_data(cls, sheet_data: SheetData) -> "SheetFrame":
+        rows = sheet_data.data
+        width = max((len(row) for row in rows), default=0)
+        labels = np.full((len(rows), width), "", dtype=object)
+        for row_idx, row in enumerate(rows):
+            labels[row_idx, : len(row)] = row
+        return cls(labels, parse_numbers(labels))
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.labels.shape
+
+    def to_dataframe(self) -> pd.DataFrame:
+        # Empty cells become NaN, the way read_csv would have read them
+        return pd.DataFrame(np.where(self.labels == "", np.nan, self.labels))
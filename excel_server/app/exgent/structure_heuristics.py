@@ -0,0 +1,200 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from app.domain import ReportGroup, SheetStructure
+from app.exgent.sheet_frame import SheetFrame
+
+# A column holds dates when it has at least this share of the numeric cells
+# of the most numeric column
+DATE_COLUMN_MIN_SHARE = 0.5
+
+
+@dataclass
+class _Row:
+    row: int
+    label: str
+    indent: int
+    numeric: bool
+
+
+@dataclass
+class _OpenGroup:
+    header_rows: list[int]
+    name: str
+    indent: int = -1
+    line_items: list[int] = field(default_factory=list)
+    item_indent: Optional[int] = None
+
+    def add(self, row: _Row) -> None:
+        self.line_items.append(row.row)
+        if self.item_indent is None or row.indent < self.item_indent:
+            self.item_indent = row.indent
+
+
+def detect_columns(frame: SheetFrame) -> Optional[tuple[int, list[int]]]:
+    """
+    Guesses the financial items column and the date columns.
+
+    The items column is the one with the most text cells; date columns are
+    the other columns that are mostly numbers. Row 0 and column 0 of the grid
+    (column letters and row numbers) are ignored.
+    """
+    labels = frame.labels[1:, 1:]
+    numeric = ~np.isnan(frame.values[1:, 1:])
+    text = (np.char.strip(labels.astype(str)) != "") & ~numeric
+    if labels.size == 0 or not text.any():
+        return None
+
+    items_column = int(text.sum(axis=0).argmax()) + 1
+    numeric_counts = numeric.sum(axis=0)
+    numeric_counts[items_column - 1] = 0
+    if numeric_counts.max() == 0:
+        return None
+    threshold = DATE_COLUMN_MIN_SHARE * numeric_counts.max()
+    date_columns = [int(c) + 1 for c in np.flatnonzero(numeric_counts >= threshold)]
+    return items_column, date_columns
+
+
+def _rows(frame: SheetFrame, items_column: int, date_columns: list[int]) -> list[_Row]:
+    numeric = ~np.isnan(frame.values[:, date_columns]).all(axis=1)
+    rows = []
+    for row in range(1, frame.shape[0]):
+        label = str(frame.labels[row, items_column]).rstrip()
+        if label.strip():
+            indent = len(label) - len(label.lstrip())
+            rows.append(_Row(row, label.strip(), indent, bool(numeric[row])))
+    return rows
+
+
+# Statement type keywords, looked up in the financial item labels
+STATEMENT_KEYWORDS = {
+    "Balance Sheet": ("assets", "liabilities", "equity"),
+    "Income Statement": ("revenue", "income", "expense", "cost of"),
+    "Cash Flow Statement": (
+        "operating activities",
+        "investing activities",
+        "cash flow",
+    ),
+}
+
+
+def detect_statement_type(labels: list[str]) -> Optional[str]:
+    """The statement type whose keywords occur in the most labels, if any."""
+    text = [label.casefold() for label in labels]
+    scores = {
+        statement_type: sum(any(k in label for k in keywords) for label in text)
+        for statement_type, keywords in STATEMENT_KEYWORDS.items()
+    }
+    statement_type, score = max(scores.items(), key=lambda item: item[1])
+    return statement_type if score > 0 else None
+
+
+def _is_total_label(label: str) -> bool:
+    return label.casefold().startswith("total")
+
+
+def _group_name(group: _OpenGroup, total: _Row) -> str:
+    if group.name:
+        return group.name
+    name = total.label
+    return name[len("total") :].strip(" :-") if _is_total_label(name) else name
+
+
+def detect_sheet_structure(frame: SheetFrame) -> Optional[SheetStructure]:
+    """
+    Rule-based guess at the structure of a financial statement.
+
+    Rows are read top to bottom by their financial item label:
+
+    * a row with numbers is a line item, or the total of the open group when
+      its label starts with "Total" or it is less indented than the group's
+      line items;
+    * a row without numbers is a header when the next row is indented deeper
+      (or no group is open), otherwise a line item without values.
+
+    Groups nest: a closed group's total becomes a line item of the group
+    around it. Headers that never get a total (titles, section captions) are
+    dropped. Returns None when no columns or groups are found.
+    """
+    columns = detect_columns(frame)
+    if columns is None:
+        return None
+    items_column, date_columns = columns
+
+    rows = _rows(frame, items_column, date_columns)
+    stack: list[_OpenGroup] = []
+    groups: list[ReportGroup] = []
+    for i, row in enumerate(rows):
+        next_indent = rows[i + 1].indent if i + 1 < len(rows) else -1
+        top = stack[-1] if stack else None
+
+        if not row.numeric:
+            if top is not None and top.line_items and next_indent <= row.indent:
+                top.add(row)
+                continue
+            # Headers at this level or deeper that got no line items are stale
+            while stack and not stack[-1].line_items and stack[-1].indent >= row.indent:
+                stack.pop()
+            stack.append(
+                _OpenGroup(header_rows=[row.row], name=row.label, indent=row.indent)
+            )
+            continue
+
+        if (
+            top is not None
+            and top.line_items
+            and top.item_indent is not None
+            and (_is_total_label(row.label) or row.indent < top.item_indent)
+        ):
+            stack.pop()
+            groups.append(
+                ReportGroup(
+                    name=_group_name(top, row),
+                    header_rows=top.header_rows,
+                    line_items=top.line_items,
+                    total=row.row,
+                )
+            )
+            if stack:
+                stack[-1].add(row)
+            continue
+
+        if _is_total_label(row.label):
+            continue
+        if top is None:
+            if next_indent > row.indent:
+                # A computed line such as gross margin ahead of a new section
+                continue
+            top = _OpenGroup(header_rows=[], name="", indent=row.indent)
+            stack.append(top)
+        top.add(row)
+
+    statement_type = detect_statement_type([r.label for r in rows])
+    if not groups or statement_type is None:
+        return None
+    return SheetStructure(
+        statement_type=statement_type,
+        financial_items_column=items_column,
+        date_columns=date_columns,
+        groups=groups,
+    )
+
+
+def coverage(frame: SheetFrame, sheet_structure: SheetStructure) -> float:
+    """Share of the labeled rows with numbers that belong to some group."""
+    rows = [
+        r.row
+        for r in _rows(
+            frame, sheet_structure.financial_items_column, sheet_structure.date_columns
+        )
+        if r.numeric
+    ]
+    if not rows:
+        return 0.0
+    grouped = {
+        row
+        for group in sheet_structure.groups
+        for row in [*group.line_items, group.total]
+    }
+    return sum(row in grouped for row in rows) / len(rows)
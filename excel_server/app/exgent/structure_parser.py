@@ -0,0 +1,224 @@
+import re
+from typing import Optional
+
+from app.domain import ReportGroup, SheetStructure
+
+# Markdown decoration around "Key: value" lines
+_EMPHASIS = re.compile(r"\*\*|__|`")
+_LINE_PREFIX = re.compile(r"^\s*(?:[#>*+\-]+|\d+[.)])\s+")
+_PARENTHESIZED = re.compile(r"\([^)]*\)")
+_INT_RANGE = re.compile(r"(\d+)\s*(?:-|–|to|through)\s*(\d+)|(\d+)")
+_COLUMN_RANGE = re.compile(
+    r"\b([A-Z]{1,2})\b(?:\s*(?:-|–|to|through)\s*\b([A-Z]{1,2})\b)?"
+)
+
+# Ranges wider than this are treated as a misread rather than expanded
+_MAX_RANGE = 10_000
+
+
+class StructureParseError(ValueError):
+    pass
+
+
+def _field(key: str) -> Optional[str]:
+    key = key.strip().lower()
+    if "statement type" in key:
+        return "statement_type"
+    if "financial item" in key:
+        return "financial_items_column"
+    if "date column" in key:
+        return "date_columns"
+    if "group name" in key or re.fullmatch(r"group\s*\d*", key):
+        return "group"
+    if "header row" in key:
+        return "header_rows"
+    if "line item" in key:
+        return "line_items"
+    if "total row" in key or key == "total":
+        return "total"
+    return None
+
+
+def _ints(value: str) -> list[int]:
+    # Descriptions are usually parenthesized, e.g. `12 (Total Revenue)`; only
+    # look inside the parentheses when there is no number outside them.
+    for text in (_PARENTHESIZED.sub(" ", value), value):
+        numbers: list[int] = []
+        for start, end, single in _INT_RANGE.findall(text):
+            if single:
+                numbers.append(int(single))
+                continue
+            first, last = int(start), int(end)
+            if not 0 <= last - first <= _MAX_RANGE:
+                raise StructureParseError(f"Bad range {start}-{end} in {value!r}")
+            numbers.extend(range(first, last + 1))
+        if numbers:
+            return numbers
+    return []
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index
+
+
+def _columns(value: str) -> list[int]:
+    """Column indices, written as numbers (1 = A) or as column letters."""
+    numbers = _ints(value)
+    if numbers:
+        return numbers
+    columns: list[int] = []
+    for start, end in _COLUMN_RANGE.findall(value):
+        first = _column_index(start)
+        last = _column_index(end) if end else first
+        columns.extend(range(first, last + 1))
+    return columns
+
+
+def _text(value: str) -> str:
+    return value.strip().strip(".").strip()
+
+
+def _is_empty(value: str) -> bool:
+    return _text(value).lower() in {"", "none", "n/a", "na", "-", "[]"}
+
+
+def parse_sheet_structure_markdown(
+    text: str, n_rows: Optional[int] = None, n_cols: Optional[int] = None
+) -> SheetStructure:
+    """
+    Parses the markdown reply of the structure detection prompt.
+
+    Expects the layout SHEET_STRUCTURE_PROMPT asks for: the statement type,
+    the financial items and date columns, then one block of `Group Name`,
+    `Header Rows`, `Line Items` and `Total Row` per group. When the sheet
+    dimensions are given, row and column numbers must fall inside the sheet.
+
+    Raises:
+        StructureParseError: if the reply does not follow the layout, so the
+            caller can fall back to LLM extraction.
+    """
+    fields: dict[str, str] = {}
+    groups: list[dict[str, str]] = []
+    pending: Optional[str] = None
+
+    for raw_line in text.splitlines():
+        line = _EMPHASIS.sub("", raw_line)
+        while _LINE_PREFIX.match(line):
+            line = _LINE_PREFIX.sub("", line, count=1)
+        key, sep, value = line.partition(":")
+        field = _field(key) if sep else None
+        if field is None and not sep:
+            # A heading such as `## Statement Type` with the value below it
+            field = _field(line) if len(line) < 40 else None
+            if field is not None:
+                pending = field
+                continue
+            if pending is not None and line.strip():
+                field, value = pending, line
+        if field is None:
+            continue
+        pending = None
+
+        if field == "group":
+            groups.append({"name": value})
+        elif field in ("header_rows", "line_items", "total"):
+            if not groups:
+                raise StructureParseError(f"{key.strip()} before any group")
+            groups[-1][field] = value
+        else:
+            fields.setdefault(field, value)
+
+    missing = {"statement_type", "financial_items_column", "date_columns"} - set(fields)
+    if missing:
+        raise StructureParseError(f"Missing {', '.join(sorted(missing))}")
+    if not groups:
+        raise StructureParseError("No groups found")
+
+    statement_type = _text(fields["statement_type"])
+    items_columns = _columns(fields["financial_items_column"])
+    date_columns = _columns(fields["date_columns"])
+    if not statement_type or not items_columns or not date_columns:
+        raise StructureParseError("Statement type or columns are empty")
+
+    report_groups = []
+    for group in groups:
+        name = _text(group["name"])
+        if not name or "total" not in group or "line_items" not in group:
+            raise StructureParseError(f"Incomplete group {name!r}")
+        totals = _ints(group["total"])
+        if not totals:
+            raise StructureParseError(f"No total row for group {name!r}")
+        header_rows = (
+            []
+            if _is_empty(group.get("header_rows", ""))
+            else _ints(group["header_rows"])
+        )
+        line_items = (
+            [] if _is_empty(group["line_items"]) else _ints(group["line_items"])
+        )
+        report_groups.append(
+            ReportGroup(
+                name=name,
+                header_rows=header_rows,
+                line_items=line_items,
+                total=totals[0],
+            )
+        )
+
+    structure = SheetStructure(
+        statement_type=statement_type,
+        financial_items_column=items_columns[0],
+        date_columns=date_columns,
+        groups=report_groups,
+    )
+    _check_bounds(structure, n_rows, n_cols)
+    return structure
+
+
+def _check_bounds(
+    structure: SheetStructure, n_rows: Optional[int], n_cols: Optional[int]
+) -> None:
+    if n_cols is not None:
+        for column in [structure.financial_items_column, *structure.date_columns]:
+            if not 1 <= column < n_cols:
+                raise StructureParseError(f"Column {column} is outside the sheet")
+    if n_rows is not None:
+        for group in structure.groups:
+            for row in [*group.header_rows, *group.line_items, group.total]:
+                if not 1 <= row < n_rows:
+                    raise StructureParseError(
+                        f"Row {row} of group {group.name!r} is outside the sheet"
+                    )
+
+
+def format_sheet_structure_markdown(
+    sheet_structure: SheetStructure, total_labels: Optional[dict[int, str]] = None
+) -> str:
+    """Renders a SheetStructure in the layout parse_sheet_structure_markdown reads."""
+    total_labels = total_labels or {}
+
+    def rows(numbers: list[int]) -> str:
+        return ", ".join(str(n) for n in numbers) if numbers else "None"
+
+    lines = [
+        f"**Statement Type:** {sheet_structure.statement_type}",
+        f"**Financial Items Column:** {sheet_structure.financial_items_column}",
+        f"**Date Columns:** {rows(sheet_structure.date_columns)}",
+        "",
+        "### Groups",
+        "",
+    ]
+    for group in sheet_structure.groups:
+        total = str(group.total)
+        if group.total in total_labels:
+            total += f" ({total_labels[group.total]})"
+        lines += [
+            f"*   **Group Name:** {group.name}",
+            f"    *   **Header Rows:** {rows(group.header_rows)}",
+            f"    *   **Line Items:** {rows(group.line_items)}",
+            f"    *   **Total Row:** {total}",
+        ]
+    return "\n".join(lines)
@@ -1,10 +1,26 @@
-import io
+import asyncio
+import os
 from typing import AsyncGenerator
 
-import pandas as pd
-from app.domain import SheetStructure, SheetTag
-from app.exgent.agent_utils import CustomLiteLlm, get_custom_metadata, get_text_content
-from app.exgent.tag_groups_utils import generate_group_csv
+from app.domain import ReportGroup, SheetStructure, SheetTag
+from app.exgent.agent_utils import (
+    CustomLiteLlm,
+    get_custom_metadata,
+    get_sheet_frame,
+    get_text_content,
+)
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.tag_groups_utils import (
+    format_group_batch,
+    generate_groups_csv,
+    group_signature,
+    merge_known_tags,
+    pack_group_batches,
+    parse_tag_results,
+    row_labels,
+    split_tag_results,
+    unknown_rows_group,
+)
 from app.sheet_info_store.sheet_info_store import SheetInfoStore
 from google.adk.agents.base_agent import BaseAgent
 from google.adk.agents.invocation_context import InvocationContext
@@ -12,6 +28,24 @@ from google.adk.agents.llm_agent import LlmAgent
 from google.adk.events.event import Event
 from google.genai.types import CodeExecutionResult, Content, Outcome, Part
 
+# Number of groups tagged concurrently by TagAllGroupsAgent
+TAG_GROUPS_MAX_CONCURRENCY = int(os.getenv("tag_groups_max_concurrency", "4"))
+# When > 0, consecutive groups are packed into one tagging request holding up
+# to this many (estimated) tokens of group data
+TAG_GROUPS_BATCH_TOKEN_BUDGET = int(os.getenv("tag_groups_batch_token_budget", "0"))
+# Tags are saved once at the end of a run; when > 0 they are also saved after
+# every this many groups
+TAG_GROUPS_CHECKPOINT_INTERVAL = int(os.getenv("tag_groups_checkpoint_interval", "0"))
+# Opt-in: pre-tag rows whose label the user has already tagged in earlier
+# files, without asking the model
+TAG_GROUPS_USE_LABEL_INDEX = (
+    os.getenv("tag_groups_use_label_index", "false").lower() == "true"
+)
+# Opt-in: keep the saved tags of groups whose rows and labels did not change
+# since the last tagged version and only tag new or modified groups. Can be
+# set per run with the `incremental_tagging` custom_metadata entry.
+TAG_GROUPS_INCREMENTAL = os.getenv("tag_groups_incremental", "false").lower() == "true"
+
 TAG_REPORT_GROUP_PROMPT = """
 ## 🎯 Role and Goal
 You are an expert financial analyst. Your task is to receive a snippet of a financial statement and map **each individual line** to the single best-matching concept from the company's internal ontology.
@@ -55,7 +89,7 @@ You must use **only** the tags from the lists below.
   
 ## ⚙️ Instructions & Rules
 
-1.  **Analyze Each Line:** You will be given a block of text. Process every single line provided (e.g., `Row:`, `Item:`, `Total:`, and context lines like `Verifying group:`).
+1.  **Analyze Each Line:** You will be given a block of text. Process every single line provided (e.g., `Row:`, `Item:`, `Total:`, and context lines like `Verifying group:`). The block may hold several groups, each introduced by a `Verifying group:` line; tag the lines of every group.
 2.  **Assign Best Tag:** Match each line to the *single best tag* from the **Internal Ontology**.
 3.  **Use Context:** Use contextual clues (like `Verifying group: Total Revenue`) and your financial expertise to understand the items.
       * For example, specific sales lines (e.g., 'X Men Sales CA', 'Software') map to **Gross Revenue**.
@@ -102,9 +136,160 @@ tag_report_group_agent = LlmAgent(
 
 class TagAllGroupsAgent(BaseAgent):
     input_key: str
+    max_concurrency: int = TAG_GROUPS_MAX_CONCURRENCY
+    batch_token_budget: int = TAG_GROUPS_BATCH_TOKEN_BUDGET
+    checkpoint_interval: int = TAG_GROUPS_CHECKPOINT_INTERVAL
+    use_label_index: bool = TAG_GROUPS_USE_LABEL_INDEX
+    incremental: bool = TAG_GROUPS_INCREMENTAL
+
+    def __init__(
+        self,
+        input_key: str,
+        max_concurrency: int = TAG_GROUPS_MAX_CONCURRENCY,
+        batch_token_budget: int = TAG_GROUPS_BATCH_TOKEN_BUDGET,
+        checkpoint_interval: int = TAG_GROUPS_CHECKPOINT_INTERVAL,
+        use_label_index: bool = TAG_GROUPS_USE_LABEL_INDEX,
+        incremental: bool = TAG_GROUPS_INCREMENTAL,
+    ):
+        super().__init__(
+            name="tag_all_groups_agent",
+            input_key=input_key,  # pyright: ignore[reportCallIssue]
+            max_concurrency=max_concurrency,  # pyright: ignore[reportCallIssue]
+            batch_token_budget=batch_token_budget,  # pyright: ignore[reportCallIssue]
+            checkpoint_interval=checkpoint_interval,  # pyright: ignore[reportCallIssue]
+            use_label_index=use_label_index,  # pyright: ignore[reportCallIssue]
+            incremental=incremental,  # pyright: ignore[reportCallIssue]
+        )
 
-    def __init__(self, input_key: str):
-        super().__init__(name="tag_all_groups_agent", input_key=input_key)  # pyright: ignore[reportCallIssue]
+    def _batch_context(
+        self, ctx: InvocationContext, batch_idx: int, report_group_data: str
+    ) -> InvocationContext:
+        # Each request gets its own copy of the session state so concurrent
+        # requests never see each other's report_group_data.
+        state = {**ctx.session.state, "report_group_data": report_group_data}
+        return ctx.model_copy(
+            update={
+                "session": ctx.session.model_copy(update={"state": state}),
+                "branch": f"{ctx.branch or self.name}.batch_{batch_idx}",
+            }
+        )
+
+    async def _tag_batch(
+        self,
+        ctx: InvocationContext,
+        semaphore: asyncio.Semaphore,
+        batch_idx: int,
+        report_group_data: str,
+    ) -> list[SheetTag]:
+        async with semaphore:
+            batch_ctx = self._batch_context(ctx, batch_idx, report_group_data)
+            sheet_tags: list[SheetTag] = []
+            async for event in tag_report_group_agent.run_async(batch_ctx):
+                if not event.partial:
+                    results = get_text_content(event)
+                    if results:
+                        sheet_tags.extend(parse_tag_results(results))
+            return sheet_tags
+
+    def _known_tags(
+        self,
+        ctx: InvocationContext,
+        sheet_structure: SheetStructure,
+        frame: SheetFrame,
+    ) -> dict[int, str]:
+        """Row -> tag for rows whose label the user has tagged before."""
+        if not self.use_label_index:
+            return {}
+        sheet_info_store: SheetInfoStore = get_custom_metadata(ctx, "sheet_info_store")
+        labels = row_labels(sheet_structure, frame)
+        label_tags = sheet_info_store.get_label_tags(
+            ctx.session.user_id,
+            sheet_structure.statement_type,
+            list(set(labels.values())),
+        )
+        return {
+            row: label_tags[label]
+            for row, label in labels.items()
+            if label in label_tags
+        }
+
+    def _is_incremental(self, ctx: InvocationContext) -> bool:
+        custom_metadata = ctx.run_config.custom_metadata if ctx.run_config else None
+        override = (custom_metadata or {}).get("incremental_tagging")
+        return self.incremental if override is None else bool(override)
+
+    def _unchanged_group_tags(
+        self,
+        ctx: InvocationContext,
+        sheet_structure: SheetStructure,
+        frame: SheetFrame,
+    ) -> dict[int, str]:
+        """Row -> saved tag for the groups unchanged since the last tagged version."""
+        if not self._is_incremental(ctx):
+            return {}
+        sheet_info_store: SheetInfoStore = get_custom_metadata(ctx, "sheet_info_store")
+        file_id: str = get_custom_metadata(ctx, "file_id")
+        sheet_idx: int = get_custom_metadata(ctx, "sheet_idx")
+
+        previous = sheet_info_store.get_latest_tagged(
+            "tag_all_groups_agent", file_id, sheet_idx
+        )
+        if previous is None or previous.payload is None:
+            return {}
+        previous_structure = previous.payload.structure
+        previous_signatures = {
+            group_signature(previous_structure, group, frame)
+            for group in previous_structure.groups
+        }
+        previous_tags = {t.row: t.tag for t in previous.payload.tags}
+
+        unchanged: dict[int, str] = {}
+        for group in sheet_structure.groups:
+            if group_signature(sheet_structure, group, frame) in previous_signatures:
+                for row in [*group.line_items, group.total]:
+                    if row in previous_tags:
+                        unchanged[row] = previous_tags[row]
+        return unchanged
+
+    def _save_tags(self, ctx: InvocationContext, sheet_tags: list[SheetTag]) -> bool:
+        sheet_info_store: SheetInfoStore = get_custom_metadata(ctx, "sheet_info_store")
+        file_id: str = get_custom_metadata(ctx, "file_id")
+        sheet_idx: int = get_custom_metadata(ctx, "sheet_idx")
+        sheet_name: str = get_custom_metadata(ctx, "sheet_name")
+
+        latest_sheet_info = sheet_info_store.get_latest(
+            "tag_all_groups_agent", file_id, sheet_idx
+        )
+        if latest_sheet_info is None or latest_sheet_info.payload is None:
+            return False
+
+        latest_sheet_info.payload.tags = list(sheet_tags)
+        sheet_info_store.add_sheet_info(
+            "tag_all_groups_agent",
+            file_id,
+            sheet_idx,
+            sheet_name,
+            latest_sheet_info.payload,
+        )
+        return True
+
+    def _group_tagged_event(
+        self, group: ReportGroup, saved: bool, unchanged: bool = False
+    ) -> Event:
+        if unchanged:
+            part = Part(text=f"**Task** - {group.name} unchanged, kept its tags.")
+        else:
+            part = Part(text=f"**Task** - {group.name} tagged.")
+        # Only ask the UI to refresh when there is a new SheetInfo version
+        if saved:
+            part.code_execution_result = CodeExecutionResult(
+                output="UI update required. New Sheet Info results are available.",
+                outcome=Outcome.OUTCOME_OK,
+            )
+        return Event(
+            author="tag_all_groups_agent",
+            content=Content(parts=[part], role="assistant"),
+        )
 
     async def _run_async_impl(
         self, ctx: InvocationContext
@@ -113,78 +298,84 @@ class TagAllGroupsAgent(BaseAgent):
             ctx.session.state[self.input_key]
         )
 
-        csv_data = ctx.session.state["excel_file_data"]
-        if csv_data is None:
-            raise ValueError("Excel file data is not set for key: excel_file_data")
-
-        df = pd.read_csv(io.StringIO(csv_data), header=None)
-        items_column = sheet_structure.financial_items_column
-        date_columns = sheet_structure.date_columns
-
-        sheet_tags: list[SheetTag] = []
-        for group in sheet_structure.groups:
-            group_csv = generate_group_csv(group, df, items_column, date_columns)
-            ctx.session.state["report_group_data"] = group_csv
-
-            async for event in tag_report_group_agent.run_async(ctx):
-                if not event.partial:
-                    results = get_text_content(event)
-                    if results:
-                        for row in results.split("\n"):
-                            row = row.strip()
-                            if not row:
-                                continue
-                            # Split only on the first comma to handle tags containing commas
-                            parts = row.split(",", 1)
-                            if len(parts) != 2:
-                                continue
-
-                            row_number_str, tag = parts
-                            try:
-                                row_number = int(row_number_str.strip())
-                                sheet_tags.append(
-                                    SheetTag(row=row_number, tag=tag.strip())
-                                )
-                            except ValueError:
-                                # Skip lines that don't start with a valid integer row number
-                                continue
-
-            sheet_info_store: SheetInfoStore = get_custom_metadata(
-                ctx, "sheet_info_store"
-            )
-            file_id: str = get_custom_metadata(ctx, "file_id")
-            sheet_idx: int = get_custom_metadata(ctx, "sheet_idx")
-            sheet_name: str = get_custom_metadata(ctx, "sheet_name")
-
-            latest_sheet_info = sheet_info_store.get_latest(
-                "tag_all_groups_agent", file_id, sheet_idx
+        groups = sheet_structure.groups
+        frame = get_sheet_frame(ctx)
+
+        # Rows with a known tag skip the LLM; groups left with nothing to tag
+        # are not sent at all. Tags saved for unchanged groups take precedence
+        # over the label index.
+        unchanged = self._unchanged_group_tags(ctx, sheet_structure, frame)
+        known = {**self._known_tags(ctx, sheet_structure, frame), **unchanged}
+        pending = {
+            group_idx: unknown_rows_group(group, known)
+            for group_idx, group in enumerate(groups)
+        }
+        llm_group_idxs = [i for i, group in pending.items() if group is not None]
+        llm_groups = [pending[i] for i in llm_group_idxs]
+        group_csvs = generate_groups_csv(
+            sheet_structure.model_copy(update={"groups": llm_groups}), frame
+        )
+        # With a token budget, several groups share one request so the prompt
+        # preamble is paid once per batch instead of once per group.
+        batches = [
+            [llm_group_idxs[i] for i in batch]
+            for batch in pack_group_batches(group_csvs, self.batch_token_budget)
+        ]
+        group_csv_of = dict(zip(llm_group_idxs, group_csvs))
+
+        # Tag all batches concurrently, but merge results and emit progress in
+        # group order so the saved tags and the event stream are deterministic.
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        tasks = [
+            asyncio.create_task(
+                self._tag_batch(
+                    ctx,
+                    semaphore,
+                    batch_idx,
+                    format_group_batch(
+                        [pending[i] for i in batch], [group_csv_of[i] for i in batch]
+                    ),
+                )
             )
+            for batch_idx, batch in enumerate(batches)
+        ]
 
-            if latest_sheet_info is not None and latest_sheet_info.payload is not None:
-                latest_sheet_info.payload.tags = sheet_tags
-                sheet_info_store.add_sheet_info(
-                    "tag_all_groups_agent",
-                    file_id,
-                    sheet_idx,
-                    sheet_name,
-                    latest_sheet_info.payload,
+        # Tags accumulate in memory and are written once at the end (plus every
+        # checkpoint_interval groups), rather than as a new version per group.
+        batch_of_group = {i: b for b, batch in enumerate(batches) for i in batch}
+        llm_tags_of: dict[int, list[SheetTag]] = {}
+        sheet_tags: list[SheetTag] = []
+        try:
+            for group_idx, group in enumerate(groups):
+                batch_idx = batch_of_group.get(group_idx)
+                if batch_idx is not None and group_idx not in llm_tags_of:
+                    batch = batches[batch_idx]
+                    split = split_tag_results(
+                        await tasks[batch_idx], [pending[i] for i in batch]
+                    )
+                    llm_tags_of.update(zip(batch, split))
+                sheet_tags.extend(
+                    merge_known_tags(group, llm_tags_of.get(group_idx, []), known)
                 )
-
-                yield Event(
-                    author="tag_all_groups_agent",
-                    content=Content(
-                        parts=[
-                            Part(
-                                text=f"**Task** - {group.name} tagged.",
-                                code_execution_result=CodeExecutionResult(
-                                    output="UI update required. New Sheet Info results are available.",
-                                    outcome=Outcome.OUTCOME_OK,
-                                ),
-                            ),
-                        ],
-                        role="assistant",
+                groups_done = group_idx + 1
+
+                saved = False
+                if groups_done == len(groups) or (
+                    self.checkpoint_interval > 0
+                    and groups_done % self.checkpoint_interval == 0
+                ):
+                    saved = self._save_tags(ctx, sheet_tags)
+
+                yield self._group_tagged_event(
+                    group,
+                    saved,
+                    unchanged=all(
+                        r in unchanged for r in [*group.line_items, group.total]
                     ),
                 )
+        finally:
+            for task in tasks:
+                task.cancel()
 
         yield Event(
             author="tag_all_groups_agent",
@@ -1,5 +1,14 @@
+import csv
+import io
+import itertools
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-from app.domain import ReportGroup
+from app.domain import ReportGroup, SheetInfoPayload, SheetStructure, SheetTag
+from app.exgent.sheet_frame import SheetFrame
+
+GROUP_CSV_COLUMNS = ["row_number", "row_type", "financial_item", "value"]
 
 
 def generate_group_csv(
@@ -74,3 +83,236 @@ def generate_group_csv(
     result_df = result_df[["row_number", "row_type", "financial_item", "value"]]
 
     return result_df.to_csv(index=False)
+
+
+def generate_groups_csv(
+    sheet_structure: SheetStructure, frame: SheetFrame
+) -> list[str]:
+    """
+    Generates the CSV of every group of a SheetStructure in one pass.
+
+    Gathers all groups' rows with index arrays into a single preallocated
+    grid and slices each group's CSV out of it. Cells are written exactly as
+    in the sheet grid, so the output equals generate_group_csv on
+    SheetFrame.to_dataframe(). It differs from generate_group_csv on a
+    DataFrame parsed with pd.read_csv: there, cells such as `NA`, `N/A` or
+    `null` were read as missing and written as empty.
+
+    Returns:
+        One CSV string per group, in group order.
+    """
+    groups = sheet_structure.groups
+    n_rows, n_cols = frame.shape
+    items_column = sheet_structure.financial_items_column
+    date_columns = sheet_structure.date_columns
+
+    # Flatten (group, row, row_type) for headers, line items and the total
+    group_rows = [
+        [*group.header_rows, *group.line_items, group.total] for group in groups
+    ]
+    row_types = [
+        ["header"] * len(group.header_rows)
+        + ["line_item"] * len(group.line_items)
+        + ["total_row"]
+        for group in groups
+    ]
+    rows = np.fromiter(
+        (r for g in group_rows for r in g),
+        dtype=np.intp,
+        count=sum(map(len, group_rows)),
+    )
+    types = np.array([t for g in row_types for t in g], dtype=object)
+    group_ids = np.repeat(np.arange(len(groups)), [len(g) for g in group_rows])
+
+    # Rows outside the sheet are dropped
+    in_range = (rows >= 0) & (rows < n_rows)
+    rows, types, group_ids = rows[in_range], types[in_range], group_ids[in_range]
+    offsets = np.concatenate(
+        ([0], np.cumsum(np.bincount(group_ids, minlength=len(groups))))
+    )
+
+    output = np.full((len(rows), len(GROUP_CSV_COLUMNS)), "", dtype=object)
+    if n_cols > 0:
+        # row_number is the first column of the sheet
+        output[:, 0] = frame.labels[rows, 0]
+    output[:, 1] = types
+    if 0 <= items_column < n_cols:
+        output[:, 2] = frame.labels[rows, items_column]
+    # value from the first date column
+    if date_columns and 0 <= date_columns[0] < n_cols:
+        output[:, 3] = frame.labels[rows, date_columns[0]]
+
+    group_csvs = []
+    for start, end in itertools.pairwise(offsets):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(GROUP_CSV_COLUMNS)
+        writer.writerows(output[start:end].tolist())
+        group_csvs.append(buffer.getvalue())
+    return group_csvs
+
+
+def parse_tag_results(results: str) -> list[SheetTag]:
+    """Parses `row_number,tag` lines from the tagging agent's response."""
+    sheet_tags: list[SheetTag] = []
+    for row in results.split("\n"):
+        row = row.strip()
+        if not row:
+            continue
+        # Split only on the first comma to handle tags containing commas
+        parts = row.split(",", 1)
+        if len(parts) != 2:
+            continue
+
+        row_number_str, tag = parts
+        try:
+            row_number = int(row_number_str.strip())
+        except ValueError:
+            # Skip lines that don't start with a valid integer row number
+            continue
+        sheet_tags.append(SheetTag(row=row_number, tag=tag.strip()))
+    return sheet_tags
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (about 4 characters a token)."""
+    return (len(text) + 3) // 4
+
+
+def pack_group_batches(group_csvs: list[str], token_budget: int) -> list[list[int]]:
+    """
+    Packs consecutive groups into batches whose CSVs fit the token budget.
+
+    A group larger than the budget gets a batch of its own. A budget of 0
+    disables batching.
+
+    Returns:
+        Lists of group indices, in group order.
+    """
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for idx, group_csv in enumerate(group_csvs):
+        tokens = estimate_tokens(group_csv)
+        if current and (token_budget <= 0 or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(idx)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def format_group_batch(groups: list[ReportGroup], group_csvs: list[str]) -> str:
+    """Joins the CSVs of several groups into one tagging request."""
+    if len(group_csvs) == 1:
+        return group_csvs[0]
+    return "\n".join(
+        f"Verifying group: {group.name}\n{group_csv}"
+        for group, group_csv in zip(groups, group_csvs)
+    )
+
+
+def split_tag_results(
+    sheet_tags: list[SheetTag], groups: list[ReportGroup]
+) -> list[list[SheetTag]]:
+    """Splits the tags of a batched request back per group by row membership."""
+    if len(groups) == 1:
+        return [sheet_tags]
+    return [
+        [
+            tag
+            for tag in sheet_tags
+            if tag.row in group.header_rows
+            or tag.row in group.line_items
+            or tag.row == group.total
+        ]
+        for group in groups
+    ]
+
+
+def _label(frame: SheetFrame, row: int, items_column: int) -> Optional[str]:
+    n_rows, n_cols = frame.shape
+    if 0 <= row < n_rows and 0 <= items_column < n_cols:
+        return frame.labels[row, items_column] or None
+    return None
+
+
+def row_labels(sheet_structure: SheetStructure, frame: SheetFrame) -> dict[int, str]:
+    """Financial item label of every line item and total row of the groups."""
+    labels: dict[int, str] = {}
+    for group in sheet_structure.groups:
+        for row in [*group.line_items, group.total]:
+            label = _label(frame, row, sheet_structure.financial_items_column)
+            if label is not None:
+                labels[row] = label
+    return labels
+
+
+def group_signature(
+    sheet_structure: SheetStructure, group: ReportGroup, frame: SheetFrame
+) -> tuple:
+    """
+    The rows of a group and their financial item labels.
+
+    Groups with equal signatures are tagged the same, whatever their name.
+    """
+    rows = [*group.header_rows, *group.line_items, group.total]
+    labels = [_label(frame, r, sheet_structure.financial_items_column) for r in rows]
+    return (
+        tuple(group.header_rows),
+        tuple(group.line_items),
+        group.total,
+        tuple(labels),
+    )
+
+
+def label_tags_from_payload(
+    payload: SheetInfoPayload, frame: SheetFrame
+) -> list[tuple[str, str]]:
+    """(label, tag) pairs for the tagged rows of a saved sheet."""
+    items_column = payload.structure.financial_items_column
+    label_tags = []
+    for sheet_tag in payload.tags:
+        label = _label(frame, sheet_tag.row, items_column)
+        if label is not None:
+            label_tags.append((label, sheet_tag.tag))
+    return label_tags
+
+
+def unknown_rows_group(
+    group: ReportGroup, known: dict[int, str]
+) -> Optional[ReportGroup]:
+    """
+    The group restricted to line items without a known tag.
+
+    The total row is kept for context. Returns None when every line item and
+    the total are already known, i.e. the group needs no LLM call.
+    """
+    line_items = [r for r in group.line_items if r not in known]
+    if not line_items and group.total in known:
+        return None
+    if len(line_items) == len(group.line_items):
+        return group
+    return group.model_copy(update={"line_items": line_items})
+
+
+def merge_known_tags(
+    group: ReportGroup, llm_tags: list[SheetTag], known: dict[int, str]
+) -> list[SheetTag]:
+    """Combines index hits with the LLM's tags, in group row order."""
+    group_rows = list(dict.fromkeys([*group.line_items, group.total]))
+    group_known = {r: known[r] for r in group_rows if r in known}
+    if not group_known:
+        return llm_tags
+
+    from_llm = {t.row: t for t in llm_tags if t.row not in group_known}
+    merged = []
+    for row in group_rows:
+        if row in group_known:
+            merged.append(SheetTag(row=row, tag=group_known[row]))
+        elif row in from_llm:
+            merged.append(from_llm.pop(row))
+    merged.extend(from_llm.values())
+    return merged
@@ -1,9 +1,9 @@
-import io
 from typing import AsyncGenerator
 
-import pandas as pd
+import numpy as np
 from app.domain import ReportGroupValidationResult, SheetInfoPayload, SheetStructure
-from app.exgent.agent_utils import get_custom_metadata
+from app.exgent.agent_utils import get_custom_metadata, get_sheet_frame
+from app.exgent.sheet_frame import SheetFrame
 from app.sheet_info_store.sheet_info_store import SheetInfoStore
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.agents.llm_agent import LlmAgent
@@ -11,28 +11,69 @@ from google.adk.events.event import Event
 from google.genai.types import CodeExecutionResult, Content, Outcome, Part
 
 
+def validate_groups(
+    frame: SheetFrame, sheet_structure: SheetStructure, tolerance: float = 0.01
+) -> list[ReportGroupValidationResult]:
+    """
+    Checks that each group's line items add up to its total row.
+
+    All groups and date columns are summed in one gather over the numeric
+    grid. Non-numeric cells count as 0 and rows outside the sheet are
+    ignored.
+
+    Returns:
+        One result per (group, date column), in group order.
+    """
+    groups = sheet_structure.groups
+    date_columns = sheet_structure.date_columns
+    n_rows = frame.shape[0]
+    # (rows, date columns) with non-numeric cells as 0
+    values = np.nan_to_num(frame.values[:, date_columns], nan=0.0)
+
+    # Gather every in-range line item row, tagged with its group, and sum the
+    # rows of each group across all date columns at once
+    group_ids = np.array(
+        [
+            g
+            for g, group in enumerate(groups)
+            for r in group.line_items
+            if 0 <= r < n_rows
+        ],
+        dtype=np.intp,
+    )
+    line_item_rows = np.array(
+        [r for group in groups for r in group.line_items if 0 <= r < n_rows],
+        dtype=np.intp,
+    )
+    calculated = np.zeros((len(groups), len(date_columns)))
+    np.add.at(calculated, group_ids, values[line_item_rows])
+
+    total_rows = np.array([group.total for group in groups], dtype=np.intp)
+    in_range = (total_rows >= 0) & (total_rows < n_rows)
+    actual = np.zeros_like(calculated)
+    actual[in_range] = values[total_rows[in_range]]
+
+    matches = np.abs(calculated - actual) < tolerance
+
+    return [
+        ReportGroupValidationResult(
+            group_name=group.name,
+            date_column=date_col,
+            calculated_total=float(calculated[g, d]),
+            actual_total=float(actual[g, d]),
+            matches=bool(matches[g, d]),
+        )
+        for g, group in enumerate(groups)
+        for d, date_col in enumerate(date_columns)
+    ]
+
+
 class ValidateSheetStructureAgent(LlmAgent):
     input_key: str
 
     def __init__(self, input_key: str):
         super().__init__(name="tag_ontology_agent", input_key=input_key)  # pyright: ignore[reportCallIssue]
 
-    def _parse_value(self, value) -> float:
-        if pd.isna(value) or value == "":
-            return 0.0
-        s = str(value).strip()
-        if not s:
-            return 0.0
-        # Handle negative numbers in parentheses
-        if "(" in s and ")" in s:
-            s = "-" + s.replace("(", "").replace(")", "")
-        # Remove currency symbols and commas
-        s = s.replace("$", "").replace(",", "").replace(" ", "")
-        try:
-            return float(s)
-        except ValueError:
-            return 0.0
-
     async def _run_async_impl(
         self, ctx: InvocationContext
     ) -> AsyncGenerator[Event, None]:
@@ -40,43 +81,8 @@ class ValidateSheetStructureAgent(LlmAgent):
             ctx.session.state[self.input_key]
         )
 
-        csv_data = ctx.session.state["excel_file_data"]
-        if csv_data is None:
-            raise ValueError("Excel file data is not set for key: excel_file_data")
-
-        df = pd.read_csv(io.StringIO(csv_data), header=None)
-        items_column = sheet_structure.financial_items_column
-        date_columns = sheet_structure.date_columns
-
-        validation_results: list[ReportGroupValidationResult] = []
-
-        for group in sheet_structure.groups:
-            # Validate row groups and check totals
-            for date_col in date_columns:
-                calculated_total = 0.0
-                # Sum the line items
-                for line_item_row in group.line_items:
-                    if 0 <= line_item_row < len(df):
-                        val = self._parse_value(df.iloc[line_item_row, date_col])
-                        calculated_total += val
-
-                # Get the actual total
-                actual_total = 0.0
-                if 0 <= group.total < len(df):
-                    actual_total = self._parse_value(df.iloc[group.total, date_col])
-
-                # Check if they match (with tolerance)
-                matches = abs(calculated_total - actual_total) < 0.01
-
-                group_result = ReportGroupValidationResult(
-                    group_name=group.name,
-                    date_column=date_col,
-                    calculated_total=calculated_total,
-                    actual_total=actual_total,
-                    matches=matches,
-                )
-
-                validation_results.append(group_result)
+        frame = get_sheet_frame(ctx)
+        validation_results = validate_groups(frame, sheet_structure)
 
         # Keep track of results in session state
         sheet_info_store: SheetInfoStore = get_custom_metadata(ctx, "sheet_info_store")
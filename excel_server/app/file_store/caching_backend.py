@@ -0,0 +1,220 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from app.file_store.file_store import StorageBackend
+from pydantic import BaseModel, computed_field
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+    max_bytes: int
+
+    @computed_field
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class _FillLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Threads holding or waiting for the lock
+        self.users = 0
+
+
+class CachingStorageBackend(StorageBackend):
+    """Wraps a (slow) StorageBackend with a size-bounded local disk LRU.
+
+    * save writes through to the wrapped backend, then populates the cache.
+    * A read miss fetches once from the wrapped backend and fills the cache
+      atomically (temp file + rename); concurrent misses on the same URI wait
+      for the first fill instead of fetching again.
+    * open() misses stream from the wrapped backend without filling the cache.
+    * Least recently used entries are evicted once max_bytes is exceeded.
+
+    Uploaded files are immutable, so cached entries never need revalidation.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        cache_dir: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.backend = backend
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._fill_locks: dict[str, _FillLock] = {}
+        # cache path name -> size, ordered from least to most recently used
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._load_existing_entries()
+
+    def _load_existing_entries(self) -> None:
+        # Re-adopt entries left by a previous process, oldest access first.
+        # Leftover temp files from interrupted fills are removed.
+        paths = []
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith(".fill-"):
+                path.unlink(missing_ok=True)
+            elif path.is_file():
+                paths.append(path)
+        for path in sorted(paths, key=lambda p: p.stat().st_atime):
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._size_bytes += size
+        with self._lock:
+            self._evict_locked()
+
+    def _cache_name(self, file_uri: str) -> str:
+        return hashlib.sha256(file_uri.encode("utf-8")).hexdigest()
+
+    def _touch(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._entries:
+                return False
+            self._entries.move_to_end(name)
+            return True
+
+    def _evict_locked(self) -> None:
+        while self._size_bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            (self.cache_dir / name).unlink(missing_ok=True)
+            self._size_bytes -= size
+            self._evictions += 1
+
+    def _fill(self, name: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix=".fill-", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self.cache_dir / name)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self._size_bytes -= previous
+            self._entries[name] = len(content)
+            self._size_bytes += len(content)
+            self._evict_locked()
+
+    def _read_cached(self, name: str) -> bytes | None:
+        try:
+            with open(self.cache_dir / name, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted between lookup and open
+            return None
+
+    def _open_cached(self, name: str) -> BinaryIO | None:
+        try:
+            return open(self.cache_dir / name, "rb")
+        except FileNotFoundError:
+            # Evicted between lookup and open
+            return None
+
+    @contextmanager
+    def _fill_lock(self, name: str) -> Iterator[None]:
+        # Held while filling `name`. The lock entry is shared by every thread
+        # waiting on it and only dropped once the last one is done, so a late
+        # reader cannot create a second lock and fetch again.
+        with self._lock:
+            fill_lock = self._fill_locks.get(name)
+            if fill_lock is None:
+                fill_lock = self._fill_locks[name] = _FillLock()
+            fill_lock.users += 1
+        try:
+            with fill_lock.lock:
+                yield
+        finally:
+            with self._lock:
+                fill_lock.users -= 1
+                if not fill_lock.users:
+                    del self._fill_locks[name]
+
+    def save(self, file_id: str, content: bytes) -> str:
+        file_uri = self.backend.save(file_id, content)
+        self._fill(self._cache_name(file_uri), content)
+        return file_uri
+
+    def read(self, file_uri: str) -> bytes:
+        name = self._cache_name(file_uri)
+        if self._touch(name):
+            content = self._read_cached(name)
+            if content is not None:
+                with self._lock:
+                    self._hits += 1
+                return content
+
+        with self._fill_lock(name):
+            # Another thread may have filled the entry while we waited.
+            if self._touch(name):
+                content = self._read_cached(name)
+                if content is not None:
+                    with self._lock:
+                        self._hits += 1
+                    return content
+
+            with self._lock:
+                self._misses += 1
+            content = self.backend.read(file_uri)
+            self._fill(name, content)
+        return content
+
+    def open(self, file_uri: str) -> BinaryIO:
+        name = self._cache_name(file_uri)
+        if self._touch(name):
+            stream = self._open_cached(name)
+            if stream is not None:
+                with self._lock:
+                    self._hits += 1
+                return stream
+        # A miss is not filled: open() serves partial reads (e.g. only the zip
+        # directory for sheet names), and filling would fetch the whole object
+        # from the wrapped backend instead of the few ranges actually read.
+        # Whole-file reads go through read(), which fills the cache.
+        with self._lock:
+            self._misses += 1
+        return self.backend.open(file_uri)
+
+    def delete(self, file_uri: str) -> None:
+        self.backend.delete(file_uri)
+        name = self._cache_name(file_uri)
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is not None:
+                self._size_bytes -= size
+        (self.cache_dir / name).unlink(missing_ok=True)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                size_bytes=self._size_bytes,
+                max_bytes=self.max_bytes,
+            )
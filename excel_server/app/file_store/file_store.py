@@ -1,11 +1,21 @@
+import hashlib
+import io
 import os
 from abc import ABC, abstractmethod
 from datetime import UTC, datetime
 from pathlib import Path
-from typing import Callable, List, Optional
+from typing import BinaryIO, Callable, List, Optional
 from uuid import uuid4
 
-from sqlalchemy import Boolean, DateTime, String, create_engine, select
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    String,
+    create_engine,
+    inspect,
+    select,
+    text,
+)
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column, sessionmaker
 
 from app.domain import UserFile
@@ -26,6 +36,8 @@ class UserFileModel(Base):
     original_filename: Mapped[str] = mapped_column(String)
     user_id: Mapped[str] = mapped_column(String)
     file_uri: Mapped[str] = mapped_column(String)
+    # sha256 of the uploaded bytes. Null for files uploaded before it existed.
+    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
     create_date: Mapped[datetime] = mapped_column(DateTime, default=get_utc_now)
     update_date: Mapped[datetime] = mapped_column(
@@ -38,6 +50,7 @@ class UserFileModel(Base):
             original_filename=self.original_filename,
             user_id=self.user_id,
             file_uri=self.file_uri,
+            content_hash=self.content_hash,
             create_date=self.create_date,
             update_date=self.update_date,
             is_deleted=self.is_deleted,
@@ -60,6 +73,14 @@ class StorageBackend(ABC):
         """Delete content at the URI."""
         pass
 
+    def open(self, file_uri: str) -> BinaryIO:
+        """Open a seekable, read-only binary stream over the content at the URI.
+
+        Backends that can serve partial reads should override this so callers
+        only fetch the byte ranges they actually touch.
+        """
+        return io.BytesIO(self.read(file_uri))
+
 
 class LocalFileStoreBackend(StorageBackend):
     def __init__(self, base_path: str = "./file_storage"):
@@ -78,6 +99,9 @@ class LocalFileStoreBackend(StorageBackend):
         with open(file_uri, "rb") as f:
             return f.read()
 
+    def open(self, file_uri: str) -> BinaryIO:
+        return open(file_uri, "rb")
+
     def delete(self, file_uri: str) -> None:
         try:
             os.remove(file_uri)
@@ -98,12 +122,22 @@ class FileStore:
         """
         self.engine = create_engine(db_url)
         Base.metadata.create_all(self.engine)
+        self._migrate()
         self.SessionLocal = sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine
         )
         self.backend = backend
         self.auth_callback = auth_callback
 
+    def _migrate(self) -> None:
+        # create_all does not add columns to an existing table.
+        columns = {c["name"] for c in inspect(self.engine).get_columns("user_files")}
+        if "content_hash" not in columns:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    text("ALTER TABLE user_files ADD COLUMN content_hash VARCHAR")
+                )
+
     def _check_auth(
         self, user_id: str, action: str, file_id: Optional[str] = None
     ) -> None:
@@ -122,6 +156,7 @@ class FileStore:
             original_filename=filename,
             user_id=user_id,
             file_uri=file_uri,
+            content_hash=hashlib.sha256(content).hexdigest(),
             create_date=get_utc_now(),
             update_date=get_utc_now(),
             is_deleted=False,
@@ -143,6 +178,17 @@ class FileStore:
             content = self.backend.read(db_file.file_uri)
             return db_file.to_pydantic(), content
 
+    def open_file(self, user_id: str, file_id: str) -> tuple[UserFile, BinaryIO]:
+        """Like get_file, but returns a stream instead of the full content."""
+        self._check_auth(user_id, "read", file_id)
+        with self.SessionLocal() as session:
+            db_file = session.get(UserFileModel, file_id)
+            if not db_file or db_file.is_deleted:
+                raise FileNotFoundError(f"File {file_id} not found")
+
+            stream = self.backend.open(db_file.file_uri)
+            return db_file.to_pydantic(), stream
+
     def get_file_metadata(self, user_id: str, file_id: str) -> UserFile:
         with self.SessionLocal() as session:
             db_file = session.get(UserFileModel, file_id)
@@ -0,0 +1,232 @@
+import io
+from collections import OrderedDict
+from typing import BinaryIO, Optional
+
+from app.file_store.file_store import StorageBackend
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - exercised only without the s3 extra
+    boto3 = None
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one).
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only view of an S3 object backed by ranged GETs.
+
+    Reads are served from block-aligned ranges that are kept in a small LRU,
+    so zipfile probing for the central directory at the end of an xlsx and
+    then jumping back to individual members costs a handful of requests
+    instead of a full download.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        size: int,
+        block_size: int = 256 * 1024,
+        max_blocks: int = 64,
+    ):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._size = size
+        self._pos = 0
+        self._block_size = block_size
+        self._max_blocks = max_blocks
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+        self.bytes_fetched = 0
+        self.requests_made = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return self._pos
+
+    def _block(self, index: int) -> bytes:
+        block = self._blocks.get(index)
+        if block is not None:
+            self._blocks.move_to_end(index)
+            return block
+
+        start = index * self._block_size
+        end = min(start + self._block_size, self._size) - 1
+        response = self._client.get_object(
+            Bucket=self._bucket, Key=self._key, Range=f"bytes={start}-{end}"
+        )
+        block = response["Body"].read()
+        self.requests_made += 1
+        self.bytes_fetched += len(block)
+
+        self._blocks[index] = block
+        if len(self._blocks) > self._max_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        total = 0
+        while total < len(view) and self._pos < self._size:
+            index, offset = divmod(self._pos, self._block_size)
+            chunk = self._block(index)[offset : offset + len(view) - total]
+            view[total : total + len(chunk)] = chunk
+            total += len(chunk)
+            self._pos += len(chunk)
+        return total
+
+
+class S3StorageBackend(StorageBackend):
+    """StorageBackend for S3 and S3-compatible stores (MinIO, moto server, ...).
+
+    URIs have the form ``s3://<bucket>/<prefix><file_id>``. A single boto3
+    client (thread-safe, with a pooled HTTP connection manager) is shared by
+    every call.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        part_size: int = 8 * 1024 * 1024,
+        max_pool_connections: int = 32,
+        read_block_size: int = 256 * 1024,
+        client=None,
+    ):
+        if boto3 is None:
+            raise ImportError(
+                "S3StorageBackend requires boto3. Install it with `uv sync --extra s3`."
+            )
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.read_block_size = read_block_size
+        self.client = client or boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region_name,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+
+    def _uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def _parse_uri(self, file_uri: str) -> tuple[str, str]:
+        if not file_uri.startswith("s3://"):
+            raise ValueError(f"Not an s3 uri: {file_uri}")
+        bucket, _, key = file_uri[len("s3://") :].partition("/")
+        if not bucket or not key:
+            raise ValueError(f"Malformed s3 uri: {file_uri}")
+        return bucket, key
+
+    def save(self, file_id: str, content: bytes) -> str:
+        return self.save_stream(file_id, io.BytesIO(content))
+
+    def save_stream(self, file_id: str, stream: BinaryIO) -> str:
+        """Upload from a stream, switching to a multipart upload for large objects.
+
+        Only one part is held in memory at a time.
+        """
+        key = f"{self.prefix}{file_id}"
+        first_part = stream.read(self.part_size)
+        next_part = stream.read(self.part_size)
+        if not next_part:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=first_part)
+            return self._uri(key)
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)[
+            "UploadId"
+        ]
+        try:
+            parts = []
+            part_number = 1
+            part = first_part
+            while part:
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=part,
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+                part_number += 1
+                part, next_part = next_part, stream.read(self.part_size)
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id
+            )
+            raise
+        return self._uri(key)
+
+    def read(self, file_uri: str) -> bytes:
+        bucket, key = self._parse_uri(file_uri)
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(f"Object {file_uri} not found") from e
+            raise
+
+    def read_range(self, file_uri: str, start: int, end: int) -> bytes:
+        """Read the inclusive byte range [start, end] of an object."""
+        bucket, key = self._parse_uri(file_uri)
+        response = self.client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+        )
+        return response["Body"].read()
+
+    def open(self, file_uri: str) -> BinaryIO:
+        bucket, key = self._parse_uri(file_uri)
+        try:
+            size = self.client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(f"Object {file_uri} not found") from e
+            raise
+        return S3RangeReader(
+            self.client, bucket, key, size, block_size=self.read_block_size
+        )
+
+    def delete(self, file_uri: str) -> None:
+        bucket, key = self._parse_uri(file_uri)
+        # delete_object is idempotent, matching LocalFileStoreBackend
+        self.client.delete_object(Bucket=bucket, Key=key)
@@ -0,0 +1,204 @@
+import sys
+from array import array
+from typing import Iterable, Optional
+
+from app.domain import FileDetailResponse, SheetData
+from fastapi import Request
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - exercised only without the extra
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - exercised only without the extra
+    pa = None
+
+JSON = "application/json"
+MSGPACK = "application/vnd.exgent.sheet+msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+########################################################
+# Format negotiation
+########################################################
+
+
+def available_formats(allow_arrow: bool = True) -> list[str]:
+    formats = []
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    if allow_arrow and pa is not None:
+        formats.append(ARROW)
+    return formats
+
+
+def negotiate_format(request: Request, allow_arrow: bool = True) -> str:
+    """Pick a binary format the client explicitly asked for, else JSON.
+
+    Only exact media types count; `*/*` and missing Accept headers get JSON
+    so existing clients are unaffected.
+    """
+    accepted: dict[str, float] = {}
+    for item in request.headers.get("accept", "").split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            accepted[media_type.lower()] = quality
+
+    best, best_quality = JSON, accepted.get(JSON, 0.0)
+    for media_type in available_formats(allow_arrow):
+        quality = accepted.get(media_type, 0.0)
+        if quality > 0 and quality >= best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+########################################################
+# MessagePack with a string dictionary
+#
+# Grids are sent column-major. Every distinct cell string is stored once in
+# `strings`; each column is a little-endian array of indices into it, using
+# the narrowest unsigned type (`code_width` bytes) that fits the dictionary.
+# /filedetails shares one dictionary across all sheets.
+########################################################
+
+
+def _columns(rows: list[list[str]]) -> list[Iterable[str]]:
+    width = max((len(row) for row in rows), default=0)
+    if any(len(row) != width for row in rows):
+        rows = [row + [""] * (width - len(row)) for row in rows]
+    return list(zip(*rows))
+
+
+_TYPECODES = {1: "B", 2: "H", 4: "I"}
+
+
+def _code_width(dictionary_size: int) -> int:
+    if dictionary_size <= 0xFF + 1:
+        return 1
+    if dictionary_size <= 0xFFFF + 1:
+        return 2
+    return 4
+
+
+def _encode_codes(codes: list[int], width: int) -> bytes:
+    encoded = array(_TYPECODES[width], codes)
+    if sys.byteorder != "little":
+        encoded.byteswap()
+    return encoded.tobytes()
+
+
+def _decode_codes(data: bytes, width: int) -> array:
+    decoded = array(_TYPECODES[width])
+    decoded.frombytes(data)
+    if sys.byteorder != "little":
+        decoded.byteswap()
+    return decoded
+
+
+def _grid_codes(rows: list[list[str]], dictionary: dict[str, int]) -> list[list[int]]:
+    return [
+        [dictionary.setdefault(value, len(dictionary)) for value in column]
+        for column in _columns(rows)
+    ]
+
+
+def _pack_grid(rows: int, columns: list[list[int]], width: int) -> dict:
+    return {"rows": rows, "columns": [_encode_codes(c, width) for c in columns]}
+
+
+def _decode_grid(grid: dict, strings: list[str], width: int) -> SheetData:
+    columns = [
+        [strings[code] for code in _decode_codes(c, width)] for c in grid["columns"]
+    ]
+    return SheetData(data=[list(row) for row in zip(*columns)] if columns else [])
+
+
+def encode_sheet_data_msgpack(sheet_data: SheetData) -> bytes:
+    dictionary: dict[str, int] = {}
+    columns = _grid_codes(sheet_data.data, dictionary)
+    width = _code_width(len(dictionary))
+    return msgpack.packb(
+        {
+            "strings": list(dictionary),
+            "code_width": width,
+            **_pack_grid(len(sheet_data.data), columns, width),
+        }
+    )
+
+
+def decode_sheet_data_msgpack(data: bytes) -> SheetData:
+    message = msgpack.unpackb(data)
+    return _decode_grid(message, message["strings"], message["code_width"])
+
+
+def encode_file_details_msgpack(details: FileDetailResponse) -> bytes:
+    dictionary: dict[str, int] = {}
+    grids = [
+        (len(sheet_data.data), _grid_codes(sheet_data.data, dictionary))
+        for sheet_data in details.sheets_data
+    ]
+    width = _code_width(len(dictionary))
+    return msgpack.packb(
+        {
+            "sheets": [sheet.model_dump(mode="json") for sheet in details.sheets],
+            "strings": list(dictionary),
+            "code_width": width,
+            "sheets_data": [_pack_grid(rows, cols, width) for rows, cols in grids],
+        }
+    )
+
+
+def decode_file_details_msgpack(data: bytes) -> FileDetailResponse:
+    message = msgpack.unpackb(data)
+    return FileDetailResponse(
+        sheets=message["sheets"],
+        sheets_data=[
+            _decode_grid(grid, message["strings"], message["code_width"])
+            for grid in message["sheets_data"]
+        ],
+    )
+
+
+########################################################
+# Arrow IPC stream
+#
+# One dictionary-encoded string column per grid column, named by position.
+# An IPC stream carries a single schema, so only /sheetdata offers it.
+########################################################
+
+
+def encode_sheet_data_arrow(sheet_data: SheetData) -> bytes:
+    arrays = []
+    for column in _columns(sheet_data.data):
+        encoded = pa.array(column, type=pa.string()).dictionary_encode()
+        index_type = {1: pa.uint8(), 2: pa.uint16()}.get(
+            _code_width(len(encoded.dictionary)), pa.int32()
+        )
+        arrays.append(encoded.cast(pa.dictionary(index_type, pa.string())))
+    table = pa.Table.from_arrays(arrays, names=[str(i) for i in range(len(arrays))])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_sheet_data_arrow(data: bytes) -> SheetData:
+    table = pa.ipc.open_stream(data).read_all()
+    columns = [column.to_pylist() for column in table.columns]
+    return SheetData(data=[list(row) for row in zip(*columns)] if columns else [])
+
+
+def encode_sheet_data(sheet_data: SheetData, media_type: str) -> Optional[bytes]:
+    if media_type == MSGPACK:
+        return encode_sheet_data_msgpack(sheet_data)
+    if media_type == ARROW:
+        return encode_sheet_data_arrow(sheet_data)
+    return None
@@ -0,0 +1,81 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - exercised only without the extra
+    brotli = None
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = 4) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        compressed = self.compressor.process(body)
+        if more_body:
+            return compressed + self.compressor.flush()
+        return compressed + self.compressor.finish()
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:] or 0)
+            except ValueError:
+                quality = 0.0
+            if quality == 0:
+                continue
+        if coding:
+            accepted.add(coding.lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """Brotli or gzip response compression, picked from Accept-Encoding.
+
+    Brotli is preferred when the optional `brotli` package is installed; it
+    compresses the repetitive string grids of the sheet payloads noticeably
+    better than gzip at similar CPU cost. Responses smaller than minimum_size
+    and event streams (the chat SSE endpoint) are sent uncompressed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        responder: ASGIApp
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(
+                self.app, self.minimum_size, quality=self.brotli_quality
+            )
+        elif "gzip" in accepted:
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.gzip_level
+            )
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+
+        await responder(scope, receive, send)
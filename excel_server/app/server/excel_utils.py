@@ -1,5 +1,8 @@
+import csv
 import io
-from typing import Optional
+import zipfile
+from typing import BinaryIO, Optional
+from xml.etree import ElementTree
 
 from app.domain import SheetData
 from openpyxl import load_workbook
@@ -7,12 +10,19 @@ from openpyxl.utils import get_column_letter
 
 
 def get_workbook_sheets(
-    excel_bytes: bytes,
+    excel_file: bytes | BinaryIO,
 ) -> list[str]:
-    workbook = load_workbook(
-        filename=io.BytesIO(excel_bytes), read_only=True, data_only=True
-    )
-    return workbook.sheetnames
+    # Sheet names live in xl/workbook.xml. Reading it straight from the zip
+    # touches only the central directory and that one member, which lets
+    # remote backends serve the call with a few ranged reads (openpyxl opens
+    # every worksheet part even in read_only mode).
+    if isinstance(excel_file, bytes):
+        excel_file = io.BytesIO(excel_file)
+    with zipfile.ZipFile(excel_file) as archive:
+        root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    return [
+        sheet.attrib["name"] for sheet in root.iter() if sheet.tag.endswith("}sheet")
+    ]
 
 
 def _get_sheet_data(sheet) -> SheetData:
@@ -86,3 +96,18 @@ def convert_excel_to_sheet_data(
         sheets_data.append((sheet_name, sheet_data))
 
     return sheets_data
+
+
+def list_to_csv_string(data: list[list[str]]) -> str:
+    # 1. Create an in-memory text buffer
+    output = io.StringIO()
+
+    # 2. Initialize the writer
+    # lineterminator='\n' ensures consistent line endings across OS platforms
+    writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+
+    # 3. Write all rows
+    writer.writerows(data)
+
+    # 4. Retrieve the string and return it
+    return output.getvalue()
@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class ServerExecutors:
+    """Dedicated thread pools for blocking work done by the async routes.
+
+    * io: disk, object store and database calls. Short and numerous, so the
+      pool is wide.
+    * parse: openpyxl workbook parsing. CPU bound and slow, so the pool is
+      narrow; a burst of large uploads queues here instead of occupying the
+      threads that cheap metadata calls need.
+    """
+
+    def __init__(self, io_workers: int = 16, parse_workers: int = 4):
+        self.io_workers = io_workers
+        self.parse_workers = parse_workers
+        self.io = ThreadPoolExecutor(
+            max_workers=io_workers, thread_name_prefix="exgent-io"
+        )
+        self.parse = ThreadPoolExecutor(
+            max_workers=parse_workers, thread_name_prefix="exgent-parse"
+        )
+
+    @classmethod
+    def from_env(cls) -> "ServerExecutors":
+        return cls(
+            io_workers=int(os.getenv("io_executor_workers", "16")),
+            parse_workers=int(
+                os.getenv("parse_executor_workers", str(min(4, os.cpu_count() or 1)))
+            ),
+        )
+
+    async def run_io(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.io, functools.partial(func, *args, **kwargs)
+        )
+
+    async def run_parse(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.parse, functools.partial(func, *args, **kwargs)
+        )
+
+    def shutdown(self) -> None:
+        self.io.shutdown(wait=False, cancel_futures=True)
+        self.parse.shutdown(wait=False, cancel_futures=True)
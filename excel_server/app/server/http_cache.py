@@ -0,0 +1,57 @@
+import hashlib
+from typing import Optional
+
+from app.domain import UserFile
+from fastapi import Request, Response
+
+# The grid data of an uploaded file never changes.
+IMMUTABLE = "private, max-age=31536000, immutable"
+# Sheet info changes whenever a new version is written; always revalidate.
+REVALIDATE = "private, no-cache"
+
+
+def content_key(user_file: UserFile) -> str:
+    # Files uploaded before content hashes were recorded fall back to the
+    # file_id, which is just as stable since uploads are immutable.
+    return user_file.content_hash or user_file.file_id
+
+
+def make_etag(*parts: object) -> str:
+    # Weak: the same tag is sent whether CompressionMiddleware serves the body
+    # gzip, br or uncompressed, so the bytes are not identical across them.
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8"))
+    return f'W/"{digest.hexdigest()[:32]}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison
+    tag = _opaque_tag(etag)
+    for candidate in header.split(","):
+        candidate = _opaque_tag(candidate.strip())
+        if candidate == "*" or candidate == tag:
+            return True
+    return False
+
+
+def cache_headers(
+    etag: str, cache_control: str, vary: Optional[str] = None
+) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary is not None:
+        headers["Vary"] = vary
+    return headers
+
+
+def not_modified(etag: str, cache_control: str, vary: Optional[str] = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control, vary))
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str) -> None:
+    response.headers.update(cache_headers(etag, cache_control))
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from app.exgent.llm_scheduler import Priority, llm_priority
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED = {JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+class JobInfo(BaseModel):
+    job_id: str
+    kind: str
+    user_id: str
+    file_id: str
+    sheet_idx: Optional[int] = None
+    # Settings the job runs with, e.g. incremental_tagging
+    options: dict[str, Any] = {}
+    status: JobStatus = JobStatus.QUEUED
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    # Progress events published so far, including those no longer kept
+    event_count: int = 0
+    # Summary set by the job itself, e.g. per-sheet outcomes of an analysis
+    result: Optional[dict[str, Any]] = None
+
+
+JobFunc = Callable[["Job"], Awaitable[None]]
+Cleanup = Callable[[], Awaitable[None]]
+
+
+class Job:
+    """
+    A queued run; its latest progress events are kept for late subscribers.
+
+    At most `max_events` events are kept while the job runs, and only the
+    last `max_finished_events` once it is done, so a reconnecting client can
+    still replay the final ones. Older events are dropped.
+    """
+
+    def __init__(
+        self,
+        info: JobInfo,
+        func: JobFunc,
+        max_events: int = 1000,
+        max_finished_events: int = 20,
+    ):
+        self.info = info
+        self.func = func
+        self.max_events = max(1, max_events)
+        self.max_finished_events = max(1, max_finished_events)
+        # Identical jobs share this key while queued or running
+        self.key = (
+            info.kind,
+            info.user_id,
+            info.file_id,
+            info.sheet_idx,
+            tuple(sorted(info.options.items())),
+        )
+        # JSON documents, ready to be sent as SSE data; events[0] has index
+        # first_index
+        self.events: list[str] = []
+        # Run when the job is dropped, e.g. to delete its agent sessions
+        self.cleanups: list[Cleanup] = []
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.info.status in FINISHED
+
+    @property
+    def first_index(self) -> int:
+        return self.info.event_count - len(self.events)
+
+    def publish(self, data: str) -> None:
+        self.events.append(data)
+        self.info.event_count += 1
+        self._trim(self.max_events)
+        self._notify()
+
+    def _trim(self, keep: int) -> None:
+        if len(self.events) > keep:
+            del self.events[: len(self.events) - keep]
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _finish(self, status: JobStatus, error: Optional[str] = None) -> None:
+        self.info.status = status
+        self.info.error = error
+        self.info.finished_at = datetime.now(timezone.utc)
+        self._trim(self.max_finished_events)
+        self._notify()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[tuple[int, str]]:
+        """
+        Yields (index, event) from `start` on, then live until the job ends.
+
+        Events dropped before they were read are skipped.
+        """
+        index = start
+        while True:
+            changed = self._changed
+            while index < self.info.event_count:
+                index = max(index, self.first_index)
+                yield index, self.events[index - self.first_index]
+                index += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+class JobQueue:
+    """
+    In-process queue of background runs, served by a fixed pool of workers.
+
+    Jobs run in worker tasks rather than in the request that created them, so
+    they outlive client disconnects. Their model calls are scheduled with
+    background priority, behind interactive chat. Submitting a job identical
+    to one still queued or running (same kind, user, file, sheet and options)
+    returns the existing job. Jobs live in memory: finished ones are kept, up to
+    `max_finished_jobs`, for polling, and a restart drops them all. The
+    cleanups of a job run when it is dropped.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_finished_jobs: int = 1000,
+        max_events_per_job: int = 1000,
+        max_finished_job_events: int = 20,
+    ):
+        self.workers = workers
+        self.max_finished_jobs = max_finished_jobs
+        self.max_events_per_job = max_events_per_job
+        self.max_finished_job_events = max_finished_job_events
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._active: dict[tuple, Job] = {}
+        self._queue: asyncio.Queue[Job] = asyncio.Queue()
+        self._worker_tasks: list[asyncio.Task] = []
+        self._cleanup_tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(max(1, self.workers))
+        ]
+
+    async def stop(self) -> None:
+        """Stops the workers; queued and running jobs are cancelled."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        for job in list(self._active.values()):
+            if job.task is not None:
+                job.task.cancel()
+                await asyncio.wait({job.task})
+            if not job.done:
+                self._close(job, JobStatus.CANCELLED, "Server shut down")
+        # A restart drops every job, so nothing needs their sessions any more
+        for job in list(self._jobs.values()):
+            self._evict(job)
+        if self._cleanup_tasks:
+            await asyncio.wait(self._cleanup_tasks)
+
+    def submit(
+        self,
+        kind: str,
+        user_id: str,
+        file_id: str,
+        func: JobFunc,
+        sheet_idx: Optional[int] = None,
+        options: Optional[dict[str, Any]] = None,
+    ) -> Job:
+        job = Job(
+            JobInfo(
+                job_id=uuid.uuid4().hex,
+                kind=kind,
+                user_id=user_id,
+                file_id=file_id,
+                sheet_idx=sheet_idx,
+                options=options or {},
+                created_at=datetime.now(timezone.utc),
+            ),
+            func,
+            max_events=self.max_events_per_job,
+            max_finished_events=self.max_finished_job_events,
+        )
+        existing = self._active.get(job.key)
+        if existing is not None:
+            return existing
+
+        self._jobs[job.info.job_id] = job
+        self._active[job.key] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, user_id: str, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.info.user_id == user_id else None
+
+    def list_jobs(self, user_id: str) -> list[JobInfo]:
+        return [job.info for job in self._jobs.values() if job.info.user_id == user_id]
+
+    def cancel(self, user_id: str, job_id: str) -> Optional[Job]:
+        job = self.get(user_id, job_id)
+        if job is None or job.done:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued; the worker skips it
+            self._close(job, JobStatus.CANCELLED)
+        return job
+
+    def _close(self, job: Job, status: JobStatus, error: Optional[str] = None) -> None:
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        job._finish(status, error)
+
+        finished = [j for j in self._jobs.values() if j.done]
+        for old in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            self._evict(old)
+
+    def _evict(self, job: Job) -> None:
+        del self._jobs[job.info.job_id]
+        if job.cleanups:
+            task = asyncio.create_task(self._cleanup(job))
+            self._cleanup_tasks.add(task)
+            task.add_done_callback(self._cleanup_tasks.discard)
+
+    async def _cleanup(self, job: Job) -> None:
+        for cleanup in job.cleanups:
+            try:
+                await cleanup()
+            except Exception:
+                logger.exception("Cleaning up job %s failed", job.info.job_id)
+
+    async def _run(self, job: Job) -> None:
+        with llm_priority(Priority.BACKGROUND):
+            try:
+                await job.func(job)
+            except asyncio.CancelledError:
+                self._close(job, JobStatus.CANCELLED)
+                raise
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job.info.job_id, job.info.kind)
+                self._close(job, JobStatus.FAILED, str(e))
+                return
+        self._close(job, JobStatus.SUCCEEDED)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job.done:
+                continue
+            job.info.status = JobStatus.RUNNING
+            job.info.started_at = datetime.now(timezone.utc)
+            job._notify()
+            job.task = asyncio.create_task(self._run(job))
+            # Waiting does not propagate the job's own cancellation
+            await asyncio.wait({job.task})
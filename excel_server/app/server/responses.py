@@ -0,0 +1,24 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    # Hand orjson the model's field dict instead of round-tripping through
+    # model_dump, which would copy every row of a sheet grid.
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class SheetJSONResponse(JSONResponse):
+    """orjson-encoded response for the large sheet payloads.
+
+    Return it directly from a route (with the domain model as content) so
+    FastAPI skips its own validate-and-encode pass over the grid.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
@@ -1,9 +1,10 @@
-import csv
-import io
+import asyncio
+import functools
 import json
+import logging
 import os
-from contextlib import asynccontextmanager
-from typing import List, Optional
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncGenerator, List, Optional
 
 import uvicorn
 from app.domain import (
@@ -13,16 +14,73 @@ from app.domain import (
     SheetInfoPayload,
     UserFile,
 )
-from app.exgent.agent import router_agent
-from app.file_store.file_store import FileStore, LocalFileStoreBackend
+from app.exgent.agent import excel_tag_agent, router_agent
+from app.exgent.agent_utils import (
+    EXCEL_FILE_REF,
+    register_sheet_source,
+    render_sheet_source,
+)
+from app.exgent.llm_cache import (
+    InMemoryLlmCacheBackend,
+    LlmCacheStats,
+    LlmResponseCache,
+    SqliteLlmCacheBackend,
+    get_default_response_cache,
+    llm_cache_bypass,
+    set_default_response_cache,
+)
+from app.exgent.llm_scheduler import (
+    LlmScheduler,
+    ModelLimits,
+    ModelSchedulerStats,
+    get_default_scheduler,
+    set_default_scheduler,
+)
+from app.exgent.tag_groups_utils import label_tags_from_payload
+from app.file_store.caching_backend import CacheStats, CachingStorageBackend
+from app.file_store.file_store import (
+    FileStore,
+    LocalFileStoreBackend,
+    StorageBackend,
+)
+from app.server.binary_encoding import (
+    JSON,
+    MSGPACK,
+    encode_file_details_msgpack,
+    encode_sheet_data,
+    negotiate_format,
+)
+from app.server.compression import CompressionMiddleware
 from app.server.excel_utils import (
     convert_excel_to_sheet_data,
     get_sheet_data,
     get_workbook_sheets,
 )
+from app.server.executors import ServerExecutors
+from app.server.http_cache import (
+    IMMUTABLE,
+    REVALIDATE,
+    cache_headers,
+    content_key,
+    etag_matches,
+    make_etag,
+    not_modified,
+    set_cache_headers,
+)
+from app.server.job_queue import Cleanup, Job, JobInfo, JobQueue, JobStatus
+from app.server.responses import SheetJSONResponse
+from app.server.sheet_cache import SheetSource, SheetSourceCache
 from app.sheet_info_store.sheet_info_store import SheetInfoStore
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
+from app.sheet_info_store.write_coalescer import SheetInfoWriteCoalescer
+from fastapi import (
+    Depends,
+    FastAPI,
+    File,
+    HTTPException,
+    Request,
+    Response,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from google.adk.agents.run_config import RunConfig, StreamingMode
@@ -37,50 +95,150 @@ from google.genai.types import Content, Part
 from pydantic import BaseModel
 
 # --- Configuration ---
-load_dotenv()
+# .env is loaded by the app package, before any settings are read
+
+logger = logging.getLogger(__name__)
 
+# Required by the server (checked at startup); the batch CLI can pass its own
 BASE_STORAGE_DIR = os.getenv("base_storage_dir")
-if BASE_STORAGE_DIR is None:
-    raise ValueError("base_storage_dir environment variable is not set")
+
+STORAGE_BACKEND = os.getenv("storage_backend", "local")
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("storage_cache_max_bytes", "0"))
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("compression_minimum_size", "1024"))
+SHEET_INFO_WRITE_WINDOW_MS = int(os.getenv("sheet_info_write_window_ms", "300"))
+SHEET_INFO_WRITE_MAX_DELAY_MS = int(os.getenv("sheet_info_write_max_delay_ms", "2000"))
+SHEET_CACHE_MAX_ENTRIES = int(os.getenv("sheet_cache_max_entries", "32"))
+LLM_CACHE_BACKEND = os.getenv("llm_cache_backend", "none")
+LLM_CACHE_TTL_SECONDS = os.getenv("llm_cache_ttl_seconds")
+LLM_MAX_CONCURRENCY = int(os.getenv("llm_max_concurrency", "8"))
+LLM_QUEUE_TIMEOUT_SECONDS = os.getenv("llm_queue_timeout_seconds")
+JOB_WORKERS = int(os.getenv("job_workers", "2"))
+ANALYZE_MAX_PARALLEL_SHEETS = int(os.getenv("analyze_max_parallel_sheets", "4"))
+
+# Sessions of background tagging jobs are kept apart from the chat sessions
+TAG_JOB_APP_NAME = "excel_tag_jobs"
+TAG_JOB_MESSAGE = "Tag this sheet."
 
 # --- Dependencies ---
 file_store: Optional[FileStore] = None
 sheet_info_store: Optional[SheetInfoStore] = None
 runner: Optional[Runner] = None
 session_service: Optional[DatabaseSessionService] = None
+executors: Optional[ServerExecutors] = None
+sheet_info_writer: Optional[SheetInfoWriteCoalescer] = None
+sheet_source_cache: Optional[SheetSourceCache] = None
+tag_job_runner: Optional[Runner] = None
+job_queue: Optional[JobQueue] = None
+
+
+def create_storage_backend(fs_files_path: str, base_storage_dir: str) -> StorageBackend:
+    backend = _create_base_storage_backend(fs_files_path)
+    if STORAGE_CACHE_MAX_BYTES > 0:
+        cache_dir = os.getenv("storage_cache_dir") or os.path.join(
+            base_storage_dir, "file_store", "cache"
+        )
+        backend = CachingStorageBackend(
+            backend, cache_dir=cache_dir, max_bytes=STORAGE_CACHE_MAX_BYTES
+        )
+    return backend
+
+
+def _create_base_storage_backend(fs_files_path: str) -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalFileStoreBackend(base_path=fs_files_path)
+    if STORAGE_BACKEND == "s3":
+        from app.file_store.s3_backend import S3StorageBackend
+
+        bucket = os.getenv("s3_bucket")
+        if not bucket:
+            raise ValueError("s3_bucket environment variable is not set")
+        return S3StorageBackend(
+            bucket=bucket,
+            prefix=os.getenv("s3_prefix", ""),
+            endpoint_url=os.getenv("s3_endpoint_url"),
+            region_name=os.getenv("s3_region"),
+        )
+    raise ValueError(f"Unknown storage_backend: {STORAGE_BACKEND}")
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global file_store, sheet_info_store, session_service, adk_runner
-
-    # Initialize FileStore
-    if not BASE_STORAGE_DIR:
-        raise ValueError("base_storage_dir environment variable is not set")
-
-    if not os.path.exists(BASE_STORAGE_DIR):
-        os.makedirs(BASE_STORAGE_DIR, exist_ok=True)
-
-    fs_db_path = os.path.join(BASE_STORAGE_DIR, "file_store", "file_store_db.sqllite")
-    fs_files_path = os.path.join(BASE_STORAGE_DIR, "file_store", "files")
+def create_file_store(base_storage_dir: str) -> FileStore:
+    fs_db_path = os.path.join(base_storage_dir, "file_store", "file_store_db.sqllite")
+    fs_files_path = os.path.join(base_storage_dir, "file_store", "files")
 
     # Ensure directories exist
     os.makedirs(os.path.dirname(fs_db_path), exist_ok=True)
     os.makedirs(os.path.dirname(fs_files_path), exist_ok=True)
 
-    file_store = FileStore(
+    return FileStore(
         db_url=f"sqlite:///{fs_db_path}",
-        backend=LocalFileStoreBackend(base_path=fs_files_path),
+        backend=create_storage_backend(fs_files_path, base_storage_dir),
     )
 
-    # Initialize FileExtractStore
+
+def create_sheet_info_store(base_storage_dir: str) -> SheetInfoStore:
     fes_db_path = os.path.join(
-        BASE_STORAGE_DIR, "file_extract_store", "file_extract_store_db.sqllite"
+        base_storage_dir, "file_extract_store", "file_extract_store_db.sqllite"
     )
 
     # Ensure directories exist
     os.makedirs(os.path.dirname(fes_db_path), exist_ok=True)
-    sheet_info_store = SheetInfoStore(db_url=f"sqlite:///{fes_db_path}")
+    return SheetInfoStore(db_url=f"sqlite:///{fes_db_path}")
+
+
+def create_llm_response_cache(base_storage_dir: str) -> Optional[LlmResponseCache]:
+    if LLM_CACHE_BACKEND == "none":
+        return None
+    if LLM_CACHE_BACKEND == "memory":
+        backend = InMemoryLlmCacheBackend(
+            max_entries=int(os.getenv("llm_cache_max_entries", "1024"))
+        )
+    elif LLM_CACHE_BACKEND == "sqlite":
+        db_path = os.path.join(base_storage_dir, "llm_cache", "llm_cache_db.sqllite")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        backend = SqliteLlmCacheBackend(db_url=f"sqlite:///{db_path}")
+    else:
+        raise ValueError(f"Unknown llm_cache_backend: {LLM_CACHE_BACKEND}")
+    return LlmResponseCache(
+        backend,
+        ttl_seconds=float(LLM_CACHE_TTL_SECONDS) if LLM_CACHE_TTL_SECONDS else None,
+        bypass=os.getenv("llm_cache_bypass", "false").lower() == "true",
+    )
+
+
+def create_llm_scheduler() -> Optional[LlmScheduler]:
+    if LLM_MAX_CONCURRENCY <= 0:
+        return None
+    model_limits = {
+        model: ModelLimits.model_validate(limits)
+        for model, limits in json.loads(os.getenv("llm_model_limits", "{}")).items()
+    }
+    return LlmScheduler(
+        default_limits=ModelLimits(
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            tokens_per_minute=int(os.getenv("llm_tokens_per_minute", "0")),
+        ),
+        model_limits=model_limits,
+        max_retries=int(os.getenv("llm_max_retries", "3")),
+        queue_timeout_seconds=(
+            float(LLM_QUEUE_TIMEOUT_SECONDS) if LLM_QUEUE_TIMEOUT_SECONDS else None
+        ),
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global file_store, sheet_info_store, session_service, adk_runner, executors
+    global sheet_info_writer, sheet_source_cache, tag_job_runner, job_queue
+
+    # Initialize FileStore
+    if not BASE_STORAGE_DIR:
+        raise ValueError("base_storage_dir environment variable is not set")
+
+    if not os.path.exists(BASE_STORAGE_DIR):
+        os.makedirs(BASE_STORAGE_DIR, exist_ok=True)
+
+    file_store = create_file_store(BASE_STORAGE_DIR)
+    sheet_info_store = create_sheet_info_store(BASE_STORAGE_DIR)
 
     # Initialize SessionService
     session_db_path = os.path.join(
@@ -107,8 +265,38 @@ async def lifespan(app: FastAPI):
         memory_service=memory_service,
     )
 
+    # Background jobs run the tagging pipeline directly, without the router
+    tag_job_runner = Runner(
+        app=App(name=TAG_JOB_APP_NAME, root_agent=excel_tag_agent, plugins=[]),
+        artifact_service=artifact_service,
+        session_service=session_service,
+        memory_service=memory_service,
+    )
+
+    executors = ServerExecutors.from_env()
+    sheet_info_writer = SheetInfoWriteCoalescer(
+        window_seconds=SHEET_INFO_WRITE_WINDOW_MS / 1000,
+        max_delay_seconds=SHEET_INFO_WRITE_MAX_DELAY_MS / 1000,
+        run_blocking=executors.run_io,
+    )
+    sheet_source_cache = SheetSourceCache(max_entries=SHEET_CACHE_MAX_ENTRIES)
+    set_default_response_cache(create_llm_response_cache(BASE_STORAGE_DIR))
+    set_default_scheduler(create_llm_scheduler())
+    job_queue = JobQueue(workers=JOB_WORKERS)
+    await job_queue.start()
+
     yield
 
+    await job_queue.stop()
+    job_queue = None
+    set_default_scheduler(None)
+    set_default_response_cache(None)
+
+    await sheet_info_writer.flush_all()
+    sheet_info_writer = None
+    executors.shutdown()
+    executors = None
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -120,6 +308,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
 
 # --- Models ---
 
@@ -159,6 +348,88 @@ def get_session_service() -> DatabaseSessionService:
     return session_service
 
 
+def get_executors() -> ServerExecutors:
+    if executors is None:
+        raise HTTPException(status_code=500, detail="Executors not initialized")
+    return executors
+
+
+def get_sheet_info_writer() -> SheetInfoWriteCoalescer:
+    if sheet_info_writer is None:
+        raise HTTPException(
+            status_code=500, detail="SheetInfoWriteCoalescer not initialized"
+        )
+    return sheet_info_writer
+
+
+def get_tag_job_runner() -> Runner:
+    if tag_job_runner is None:
+        raise HTTPException(status_code=500, detail="Tag job runner not initialized")
+    return tag_job_runner
+
+
+def get_job_queue() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=500, detail="JobQueue not initialized")
+    return job_queue
+
+
+def get_sheet_source_cache() -> SheetSourceCache:
+    if sheet_source_cache is None:
+        raise HTTPException(status_code=500, detail="SheetSourceCache not initialized")
+    return sheet_source_cache
+
+
+async def load_sheet_source(
+    f_store: FileStore,
+    cache: SheetSourceCache,
+    pool: ServerExecutors,
+    user_id: str,
+    file_id: str,
+    sheet_idx: int,
+) -> SheetSource:
+    """Parsed sheet for a file, read and parsed only on a cache miss."""
+    user_file = await pool.run_io(f_store.get_file_metadata, user_id, file_id)
+    key = content_key(user_file)
+    source = cache.get(key, sheet_idx)
+    if source is not None:
+        return source
+
+    user_file, content = await pool.run_io(f_store.get_file, user_id, file_id)
+    sheet_data_list = await pool.run_parse(
+        convert_excel_to_sheet_data, content, [sheet_idx]
+    )
+    sheet_name, sheet_data = sheet_data_list[0]
+    source = SheetSource(key, sheet_idx, sheet_name, sheet_data)
+    # Render the prompt text off the event loop too; it is memoized on the
+    # source
+    await pool.run_parse(render_sheet_source, source)
+    return cache.put(source)
+
+
+async def load_workbook_sources(
+    f_store: FileStore,
+    cache: SheetSourceCache,
+    pool: ServerExecutors,
+    user_id: str,
+    file_id: str,
+) -> list[SheetSource]:
+    """Parsed sheets of the whole workbook, from a single workbook parse."""
+    user_file, content = await pool.run_io(f_store.get_file, user_id, file_id)
+    key = content_key(user_file)
+    sheet_data_list = await pool.run_parse(convert_excel_to_sheet_data, content)
+
+    sources = []
+    for sheet_idx, (sheet_name, sheet_data) in enumerate(sheet_data_list):
+        source = cache.get(key, sheet_idx)
+        if source is None:
+            source = SheetSource(key, sheet_idx, sheet_name, sheet_data)
+            await pool.run_parse(render_sheet_source, source)
+            source = cache.put(source)
+        sources.append(source)
+    return sources
+
+
 # --- Routes ---
 
 
@@ -167,21 +438,49 @@ def read_root():
     return {"message": "Hello, World!"}
 
 
+@app.get("/stats/storage_cache", response_model=CacheStats)
+async def get_storage_cache_stats(
+    store: FileStore = Depends(get_file_store),
+) -> CacheStats:
+    if not isinstance(store.backend, CachingStorageBackend):
+        raise HTTPException(status_code=404, detail="Storage cache is not enabled")
+    return store.backend.stats()
+
+
+@app.get("/stats/llm_cache", response_model=LlmCacheStats)
+async def get_llm_cache_stats() -> LlmCacheStats:
+    cache = get_default_response_cache()
+    if cache is None:
+        raise HTTPException(status_code=404, detail="LLM response cache is not enabled")
+    return cache.stats()
+
+
+@app.get("/stats/llm_scheduler", response_model=list[ModelSchedulerStats])
+async def get_llm_scheduler_stats() -> list[ModelSchedulerStats]:
+    scheduler = get_default_scheduler()
+    if scheduler is None:
+        raise HTTPException(status_code=404, detail="LLM scheduler is not enabled")
+    return scheduler.stats()
+
+
 @app.get("/files", response_model=List[UserFile])
-def list_files(
-    user_id: str = Depends(get_user_id), store: FileStore = Depends(get_file_store)
+async def list_files(
+    user_id: str = Depends(get_user_id),
+    store: FileStore = Depends(get_file_store),
+    pool: ServerExecutors = Depends(get_executors),
 ):
-    return store.list_files(user_id)
+    return await pool.run_io(store.list_files, user_id)
 
 
 @app.delete("/files/{file_id}", response_model=UserFile)
-def delete_file(
+async def delete_file(
     file_id: str,
     user_id: str = Depends(get_user_id),
     store: FileStore = Depends(get_file_store),
+    pool: ServerExecutors = Depends(get_executors),
 ):
     try:
-        return store.delete_file(user_id, file_id)
+        return await pool.run_io(store.delete_file, user_id, file_id)
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -189,32 +488,61 @@ def delete_file(
 
 
 @app.get("/files/{file_id}", response_model=UserFile)
-def get_user_file(
+async def get_user_file(
     file_id: str,
     user_id: str = Depends(get_user_id),
     store: FileStore = Depends(get_file_store),
+    pool: ServerExecutors = Depends(get_executors),
 ) -> UserFile:
-    return store.get_file_metadata(user_id, file_id)
+    return await pool.run_io(store.get_file_metadata, user_id, file_id)
+
+
+def file_details_etag(
+    user_file: UserFile, versions: dict[int, int], media_type: str
+) -> str:
+    return make_etag(
+        "filedetails", content_key(user_file), sorted(versions.items()), media_type
+    )
 
 
 @app.get("/filedetails/{file_id}", response_model=FileDetailResponse)
-def get_file_details(
+async def get_file_details(
     file_id: str,
+    http_request: Request,
     user_id: str = Depends(get_user_id),
     f_store: FileStore = Depends(get_file_store),
     sheet_info_store: SheetInfoStore = Depends(get_sheet_info_store),
-) -> FileDetailResponse:
+    pool: ServerExecutors = Depends(get_executors),
+) -> FileDetailResponse | Response:
     try:
+        # The file is immutable, so the response only changes when a sheet
+        # gets a new sheet info version. Answer 304 before reading the file.
+        media_type = negotiate_format(http_request, allow_arrow=False)
+        user_file = await pool.run_io(f_store.get_file_metadata, user_id, file_id)
+        versions = await pool.run_io(
+            sheet_info_store.get_latest_versions, user_id, file_id
+        )
+        etag = file_details_etag(user_file, versions, media_type)
+        if etag_matches(http_request, etag):
+            return not_modified(etag, REVALIDATE, vary="Accept")
+
         # Get file metadata and content
-        user_file, content = f_store.get_file(user_id, file_id)
+        user_file, content = await pool.run_io(f_store.get_file, user_id, file_id)
 
-        sheet_data_list = convert_excel_to_sheet_data(content)
+        sheet_data_list = await pool.run_parse(convert_excel_to_sheet_data, content)
+
+        # Get latest extract for every sheet in a single trip to the io pool
+        extracts = await pool.run_io(
+            lambda: [
+                sheet_info_store.get_latest(user_id, file_id, idx)
+                for idx in range(len(sheet_data_list))
+            ]
+        )
 
         sheets = []
         sheets_data: list[SheetData] = []
         for idx, (name, sheet_data) in enumerate(sheet_data_list):
-            # Get latest extract for this sheet
-            extract = sheet_info_store.get_latest(user_id, file_id, idx)
+            extract = extracts[idx]
             sheets.append(
                 SheetInfo(
                     user_id=user_id,
@@ -227,9 +555,23 @@ def get_file_details(
             )
             sheets_data.append(sheet_data)
 
-        return FileDetailResponse(
+        details = FileDetailResponse(
             **user_file.model_dump(), sheets=sheets, sheets_data=sheets_data
         )
+        # Tagged with the versions that were serialized, in case a sheet got a
+        # new version since the check above.
+        served_versions = {
+            sheet.sheet_idx: sheet.version for sheet in sheets if sheet.version
+        }
+        etag = file_details_etag(user_file, served_versions, media_type)
+        headers = cache_headers(etag, REVALIDATE, vary="Accept")
+        if media_type == MSGPACK:
+            return Response(
+                encode_file_details_msgpack(details),
+                media_type=media_type,
+                headers=headers,
+            )
+        return SheetJSONResponse(details, headers=headers)
 
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -237,35 +579,72 @@ def get_file_details(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _read_sheet_names(f_store: FileStore, user_id: str, file_id: str) -> list[str]:
+    user_file, stream = f_store.open_file(user_id, file_id)
+    with stream:
+        return get_workbook_sheets(stream)
+
+
 @app.get("/sheets/{file_id}", response_model=list[str])
-def get_sheet_names(
+async def get_sheet_names(
     file_id: str,
     user_id: str = Depends(get_user_id),
     f_store: FileStore = Depends(get_file_store),
+    pool: ServerExecutors = Depends(get_executors),
 ) -> list[str]:
-    user_file, content = f_store.get_file(user_id, file_id)
-    return get_workbook_sheets(content)
+    # Only reads the zip directory and workbook.xml, so it stays on the io pool
+    return await pool.run_io(_read_sheet_names, f_store, user_id, file_id)
 
 
 @app.get("/sheetdata/{file_id}/{sheet_idx}", response_model=SheetData)
-def get_sheet_data_by_index(
+async def get_sheet_data_by_index(
     file_id: str,
     sheet_idx: int,
+    http_request: Request,
     user_id: str = Depends(get_user_id),
     f_store: FileStore = Depends(get_file_store),
-) -> SheetData:
-    user_file, content = f_store.get_file(user_id, file_id)
-    return get_sheet_data(content, sheet_idx)
+    pool: ServerExecutors = Depends(get_executors),
+) -> SheetData | Response:
+    # JSON by default; MessagePack or Arrow IPC when the client asks for it
+    media_type = negotiate_format(http_request)
+    user_file = await pool.run_io(f_store.get_file_metadata, user_id, file_id)
+    etag = make_etag("sheetdata", content_key(user_file), sheet_idx, media_type)
+    if etag_matches(http_request, etag):
+        return not_modified(etag, IMMUTABLE, vary="Accept")
+
+    user_file, content = await pool.run_io(f_store.get_file, user_id, file_id)
+    sheet_data = await pool.run_parse(get_sheet_data, content, sheet_idx)
+    headers = cache_headers(etag, IMMUTABLE, vary="Accept")
+    if media_type == JSON:
+        return SheetJSONResponse(sheet_data, headers=headers)
+    return Response(
+        encode_sheet_data(sheet_data, media_type),
+        media_type=media_type,
+        headers=headers,
+    )
 
 
 @app.get("/sheetinfo/{file_id}/{sheet_idx}", response_model=SheetInfo)
-def get_sheet_info_by_index(
+async def get_sheet_info_by_index(
     file_id: str,
     sheet_idx: int,
+    http_request: Request,
+    response: Response,
     user_id: str = Depends(get_user_id),
     sheet_info_store: SheetInfoStore = Depends(get_sheet_info_store),
-) -> Optional[SheetInfo]:
-    result = sheet_info_store.get_latest(user_id, file_id, sheet_idx)
+    pool: ServerExecutors = Depends(get_executors),
+) -> Optional[SheetInfo] | Response:
+    versions = await pool.run_io(sheet_info_store.get_latest_versions, user_id, file_id)
+    etag = make_etag("sheetinfo", file_id, sheet_idx, versions.get(sheet_idx, 0))
+    if etag_matches(http_request, etag):
+        return not_modified(etag, REVALIDATE)
+
+    result = await pool.run_io(sheet_info_store.get_latest, user_id, file_id, sheet_idx)
+    # Tagged with the version that is served, which may be newer than the one
+    # checked above
+    version = result.version if result is not None else 0
+    etag = make_etag("sheetinfo", file_id, sheet_idx, version)
+    set_cache_headers(response, etag, REVALIDATE)
     return (
         result
         if result is not None
@@ -280,51 +659,106 @@ def get_sheet_info_by_index(
     )
 
 
+async def index_label_tags(
+    f_store: FileStore,
+    sheet_info_store: SheetInfoStore,
+    cache: SheetSourceCache,
+    pool: ServerExecutors,
+    user_id: str,
+    file_id: str,
+    sheet_idx: int,
+    payload: SheetInfoPayload,
+) -> None:
+    """Remembers the approved tags of a saved sheet by financial item label.
+
+    Later files of the same user are pre-tagged from this index. Failures
+    are logged only; the index is an optimization, not part of the save.
+    """
+    try:
+        source = await load_sheet_source(
+            f_store, cache, pool, user_id, file_id, sheet_idx
+        )
+        label_tags = label_tags_from_payload(payload, source.frame)
+        await pool.run_io(
+            sheet_info_store.record_label_tags,
+            user_id,
+            file_id,
+            payload.structure.statement_type,
+            label_tags,
+        )
+    except Exception:
+        logger.exception("Indexing label tags of %s/%s failed", file_id, sheet_idx)
+
+
 class UpdateSheetInfoRequest(BaseModel):
     sheet_name: str
     payload: Optional[SheetInfoPayload] = None
 
 
 @app.post("/sheetinfo/{file_id}/{sheet_idx}", response_model=SheetInfo)
-def update_sheet_info(
+async def update_sheet_info(
     file_id: str,
     sheet_idx: int,
     request: UpdateSheetInfoRequest,
     user_id: str = Depends(get_user_id),
     sheet_info_store: SheetInfoStore = Depends(get_sheet_info_store),
+    writer: SheetInfoWriteCoalescer = Depends(get_sheet_info_writer),
+    f_store: FileStore = Depends(get_file_store),
+    cache: SheetSourceCache = Depends(get_sheet_source_cache),
+    pool: ServerExecutors = Depends(get_executors),
 ) -> SheetInfo:
-    from time import sleep
+    async def index_written(sheet_info: SheetInfo) -> None:
+        # Saves merged away by the coalescer were never stored; only the
+        # written version is indexed.
+        if sheet_info.payload is not None and sheet_info.payload.tags:
+            await index_label_tags(
+                f_store,
+                sheet_info_store,
+                cache,
+                pool,
+                user_id,
+                file_id,
+                sheet_idx,
+                sheet_info.payload,
+            )
 
-    sleep(2)
     try:
-        sheet_name = request.sheet_name
-        payload = request.payload
-        return sheet_info_store.add_sheet_info(
-            user_id, file_id, sheet_idx, sheet_name, payload
+        # Rapid successive saves from the UI collapse into a single version;
+        # every caller gets that version back.
+        sheet_info = await writer.submit(
+            sheet_info_store,
+            user_id,
+            file_id,
+            sheet_idx,
+            request.sheet_name,
+            request.payload,
+            after_write=index_written,
         )
     except ValueError as e:
         raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    return sheet_info
 
-def list_to_csv_string(data: list[list[str]]) -> str:
-    # 1. Create an in-memory text buffer
-    output = io.StringIO()
-
-    # 2. Initialize the writer
-    # lineterminator='\n' ensures consistent line endings across OS platforms
-    writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
 
-    # 3. Write all rows
-    writer.writerows(data)
-
-    # 4. Retrieve the string and return it
-    return output.getvalue()
+def event_data(event: Event) -> str:
+    """JSON of an agent event, as sent in SSE data lines."""
+    if hasattr(event, "model_dump"):
+        return json.dumps(event.model_dump(), default=str)
+    elif hasattr(event, "dict"):
+        return json.dumps(event.dict(), default=str)
+    else:
+        return json.dumps(event, default=str)
 
 
 class ChatRequest(BaseModel):
     user_input: str
+    # Ask the models again instead of replaying cached replies
+    bypass_llm_cache: bool = False
+    # Re-tag only groups changed since the last tagged version; None uses the
+    # server default (tag_groups_incremental)
+    incremental_tagging: Optional[bool] = None
 
 
 @app.post("/sheetchat/{file_id}/{sheet_idx}")
@@ -337,21 +771,18 @@ async def sheet_chat_stream(
     sheet_info_store: SheetInfoStore = Depends(get_sheet_info_store),
     runner: Runner = Depends(get_runner),
     session_service: DatabaseSessionService = Depends(get_session_service),
+    pool: ServerExecutors = Depends(get_executors),
+    sheet_cache: SheetSourceCache = Depends(get_sheet_source_cache),
 ) -> StreamingResponse:
-    # Check if file exists
     try:
-        f_store.get_file_metadata(user_id, file_id)
+        source = await load_sheet_source(
+            f_store, sheet_cache, pool, user_id, file_id, sheet_idx
+        )
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
 
     session_id = f"{file_id}_{sheet_idx}"
-    user_file, content = f_store.get_file(user_id, file_id)
-    sheet_data_list = convert_excel_to_sheet_data(content, [sheet_idx])
-    sheet_name, sheet_data = sheet_data_list[0]
-
-    # Convert the sheet data to a csv string
-    excel_file_data = list_to_csv_string(sheet_data.data)
-
+    sheet_name = source.sheet_name
     user_input = request.user_input
 
     session = await session_service.get_session(
@@ -364,35 +795,39 @@ async def sheet_chat_stream(
         if not session:
             raise HTTPException(status_code=500, detail="Failed to create session")
 
+    # The session only records which sheet content it is about. The CSV is
+    # resolved from the sheet source when prompts are rendered, so it is never
+    # written to the session database.
+    register_sheet_source(source)
+    state_delta = None
+    if session.state.get(EXCEL_FILE_REF) != source.key:
+        state_delta = {EXCEL_FILE_REF: source.key}
+
     async def event_generator():
         try:
-            async with Aclosing(
-                runner.run_async(
-                    user_id=user_id,
-                    session_id=session_id,
-                    new_message=Content(parts=[Part(text=user_input)], role="user"),
-                    state_delta={
-                        "excel_file_data": excel_file_data,
-                    },
-                    run_config=RunConfig(
-                        streaming_mode=StreamingMode.SSE,
-                        custom_metadata={
-                            "sheet_info_store": sheet_info_store,
-                            "file_id": file_id,
-                            "sheet_idx": sheet_idx,
-                            "sheet_name": sheet_name,
-                        },
-                    ),
-                )
-            ) as agen:
-                async for event in agen:
-                    if hasattr(event, "model_dump"):
-                        data = json.dumps(event.model_dump(), default=str)
-                    elif hasattr(event, "dict"):
-                        data = json.dumps(event.dict(), default=str)
-                    else:
-                        data = json.dumps(event, default=str)
-                    yield f"data: {data}\n\n"
+            bypass = llm_cache_bypass() if request.bypass_llm_cache else nullcontext()
+            with bypass:
+                async with Aclosing(
+                    runner.run_async(
+                        user_id=user_id,
+                        session_id=session_id,
+                        new_message=Content(parts=[Part(text=user_input)], role="user"),
+                        state_delta=state_delta,
+                        run_config=RunConfig(
+                            streaming_mode=StreamingMode.SSE,
+                            custom_metadata={
+                                "sheet_info_store": sheet_info_store,
+                                "file_id": file_id,
+                                "sheet_idx": sheet_idx,
+                                "sheet_name": sheet_name,
+                                "sheet_source": source,
+                                "incremental_tagging": request.incremental_tagging,
+                            },
+                        ),
+                    )
+                ) as agen:
+                    async for event in agen:
+                        yield f"data: {event_data(event)}\n\n"
         except Exception as e:
             error_data = json.dumps({"error": str(e)})
             yield f"event: error\ndata: {error_data}\n\n"
@@ -402,6 +837,332 @@ async def sheet_chat_stream(
     # return {"message": "Analysis started", "file_id": file_id, "sheet_idx": sheet_idx}
 
 
+async def tag_sheet(
+    runner: Runner,
+    session_service: DatabaseSessionService,
+    sheet_info_store: SheetInfoStore,
+    source: SheetSource,
+    user_id: str,
+    file_id: str,
+    session_id: str,
+    incremental_tagging: Optional[bool] = None,
+) -> AsyncGenerator[Event, None]:
+    """Runs excel_tag_agent for one sheet in a new session of its own."""
+    register_sheet_source(source)
+    await session_service.create_session(
+        app_name=TAG_JOB_APP_NAME,
+        user_id=user_id,
+        session_id=session_id,
+        state={EXCEL_FILE_REF: source.key},
+    )
+    async with Aclosing(
+        runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=Content(parts=[Part(text=TAG_JOB_MESSAGE)], role="user"),
+            run_config=RunConfig(
+                custom_metadata={
+                    "sheet_info_store": sheet_info_store,
+                    "file_id": file_id,
+                    "sheet_idx": source.sheet_idx,
+                    "sheet_name": source.sheet_name,
+                    "sheet_source": source,
+                    "incremental_tagging": incremental_tagging,
+                },
+            ),
+        )
+    ) as agen:
+        async for event in agen:
+            yield event
+
+
+def job_session_cleanup(
+    session_service: DatabaseSessionService, user_id: str, session_id: str
+) -> Cleanup:
+    """Deletes a tag_sheet session once its job is dropped from the queue."""
+    return functools.partial(
+        session_service.delete_session,
+        app_name=TAG_JOB_APP_NAME,
+        user_id=user_id,
+        session_id=session_id,
+    )
+
+
+async def run_tag_job(
+    job: Job,
+    runner: Runner,
+    session_service: DatabaseSessionService,
+    f_store: FileStore,
+    sheet_info_store: SheetInfoStore,
+    cache: SheetSourceCache,
+    pool: ServerExecutors,
+    incremental_tagging: Optional[bool] = None,
+) -> None:
+    info = job.info
+    assert info.sheet_idx is not None
+    source = await load_sheet_source(
+        f_store, cache, pool, info.user_id, info.file_id, info.sheet_idx
+    )
+    job.cleanups.append(job_session_cleanup(session_service, info.user_id, info.job_id))
+    async for event in tag_sheet(
+        runner,
+        session_service,
+        sheet_info_store,
+        source,
+        info.user_id,
+        info.file_id,
+        info.job_id,
+        incremental_tagging,
+    ):
+        job.publish(event_data(event))
+
+
+class SheetAnalysis(BaseModel):
+    sheet_idx: int
+    sheet_name: str
+    status: JobStatus
+    error: Optional[str] = None
+
+
+async def run_analyze_job(
+    job: Job,
+    runner: Runner,
+    session_service: DatabaseSessionService,
+    f_store: FileStore,
+    sheet_info_store: SheetInfoStore,
+    cache: SheetSourceCache,
+    pool: ServerExecutors,
+    max_parallel_sheets: int,
+    incremental_tagging: Optional[bool] = None,
+) -> None:
+    """
+    Tags every sheet of a workbook, up to `max_parallel_sheets` at a time.
+
+    The workbook is parsed once for all sheets. Each sheet runs in its own
+    session and writes its own SheetInfo versions. Events are published as
+    `{"sheet_idx", "event"}`, followed by a SheetAnalysis per sheet once it
+    is done; the job fails if any sheet did, after all sheets have run.
+    """
+    info = job.info
+    sources = await load_workbook_sources(
+        f_store, cache, pool, info.user_id, info.file_id
+    )
+    semaphore = asyncio.Semaphore(max(1, max_parallel_sheets))
+
+    async def analyze(source: SheetSource) -> SheetAnalysis:
+        session_id = f"{info.job_id}_{source.sheet_idx}"
+        async with semaphore:
+            job.cleanups.append(
+                job_session_cleanup(session_service, info.user_id, session_id)
+            )
+            try:
+                async for event in tag_sheet(
+                    runner,
+                    session_service,
+                    sheet_info_store,
+                    source,
+                    info.user_id,
+                    info.file_id,
+                    session_id,
+                    incremental_tagging,
+                ):
+                    job.publish(
+                        json.dumps(
+                            {
+                                "sheet_idx": source.sheet_idx,
+                                "event": event.model_dump(),
+                            },
+                            default=str,
+                        )
+                    )
+                analysis = SheetAnalysis(
+                    sheet_idx=source.sheet_idx,
+                    sheet_name=source.sheet_name,
+                    status=JobStatus.SUCCEEDED,
+                )
+            except Exception as e:
+                logger.exception(
+                    "Analyzing sheet %s of %s failed", source.sheet_idx, info.file_id
+                )
+                analysis = SheetAnalysis(
+                    sheet_idx=source.sheet_idx,
+                    sheet_name=source.sheet_name,
+                    status=JobStatus.FAILED,
+                    error=str(e),
+                )
+        job.publish(analysis.model_dump_json())
+        return analysis
+
+    sheets = await asyncio.gather(*(analyze(source) for source in sources))
+    info.result = {"sheets": [sheet.model_dump(mode="json") for sheet in sheets]}
+    failed = [sheet.sheet_name for sheet in sheets if sheet.status == JobStatus.FAILED]
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(sheets)} sheets failed: {', '.join(failed)}"
+        )
+
+
+class TagJobRequest(BaseModel):
+    # Re-tag only groups changed since the last tagged version; None uses the
+    # server default (tag_groups_incremental)
+    incremental_tagging: Optional[bool] = None
+
+
+@app.post("/jobs/tag/{file_id}/{sheet_idx}", response_model=JobInfo, status_code=202)
+async def create_tag_job(
+    file_id: str,
+    sheet_idx: int,
+    request: Optional[TagJobRequest] = None,
+    user_id: str = Depends(get_user_id),
+    queue: JobQueue = Depends(get_job_queue),
+    runner: Runner = Depends(get_tag_job_runner),
+    session_service: DatabaseSessionService = Depends(get_session_service),
+    f_store: FileStore = Depends(get_file_store),
+    sheet_info_store: SheetInfoStore = Depends(get_sheet_info_store),
+    cache: SheetSourceCache = Depends(get_sheet_source_cache),
+    pool: ServerExecutors = Depends(get_executors),
+) -> JobInfo:
+    """Queues a tagging run of one sheet; poll or follow it under /jobs."""
+    try:
+        await pool.run_io(f_store.get_file_metadata, user_id, file_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    incremental_tagging = request.incremental_tagging if request else None
+
+    async def run(job: Job) -> None:
+        await run_tag_job(
+            job,
+            runner,
+            session_service,
+            f_store,
+            sheet_info_store,
+            cache,
+            pool,
+            incremental_tagging,
+        )
+
+    return queue.submit(
+        "tag",
+        user_id,
+        file_id,
+        run,
+        sheet_idx=sheet_idx,
+        options={"incremental_tagging": incremental_tagging},
+    ).info
+
+
+class AnalyzeRequest(BaseModel):
+    # Re-tag only groups changed since the last tagged version; None uses the
+    # server default (tag_groups_incremental)
+    incremental_tagging: Optional[bool] = None
+
+
+@app.post("/analyze/{file_id}", response_model=JobInfo, status_code=202)
+async def analyze_file(
+    file_id: str,
+    request: Optional[AnalyzeRequest] = None,
+    user_id: str = Depends(get_user_id),
+    queue: JobQueue = Depends(get_job_queue),
+    runner: Runner = Depends(get_tag_job_runner),
+    session_service: DatabaseSessionService = Depends(get_session_service),
+    f_store: FileStore = Depends(get_file_store),
+    sheet_info_store: SheetInfoStore = Depends(get_sheet_info_store),
+    cache: SheetSourceCache = Depends(get_sheet_source_cache),
+    pool: ServerExecutors = Depends(get_executors),
+) -> JobInfo:
+    """Queues tagging of every sheet in the workbook as one job."""
+    try:
+        await pool.run_io(f_store.get_file_metadata, user_id, file_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    incremental_tagging = request.incremental_tagging if request else None
+    max_parallel_sheets = ANALYZE_MAX_PARALLEL_SHEETS
+
+    async def run(job: Job) -> None:
+        await run_analyze_job(
+            job,
+            runner,
+            session_service,
+            f_store,
+            sheet_info_store,
+            cache,
+            pool,
+            max_parallel_sheets,
+            incremental_tagging,
+        )
+
+    return queue.submit(
+        "analyze",
+        user_id,
+        file_id,
+        run,
+        options={
+            "incremental_tagging": incremental_tagging,
+            "max_parallel_sheets": max_parallel_sheets,
+        },
+    ).info
+
+
+@app.get("/jobs", response_model=List[JobInfo])
+async def list_jobs(
+    user_id: str = Depends(get_user_id),
+    queue: JobQueue = Depends(get_job_queue),
+) -> List[JobInfo]:
+    return queue.list_jobs(user_id)
+
+
+def _get_job(queue: JobQueue, user_id: str, job_id: str) -> Job:
+    job = queue.get(user_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(
+    job_id: str,
+    user_id: str = Depends(get_user_id),
+    queue: JobQueue = Depends(get_job_queue),
+) -> JobInfo:
+    return _get_job(queue, user_id, job_id).info
+
+
+@app.delete("/jobs/{job_id}", response_model=JobInfo)
+async def cancel_job(
+    job_id: str,
+    user_id: str = Depends(get_user_id),
+    queue: JobQueue = Depends(get_job_queue),
+) -> JobInfo:
+    _get_job(queue, user_id, job_id)
+    return queue.cancel(user_id, job_id).info
+
+
+@app.get("/jobs/{job_id}/events")
+async def follow_job_events(
+    job_id: str,
+    http_request: Request,
+    user_id: str = Depends(get_user_id),
+    queue: JobQueue = Depends(get_job_queue),
+) -> StreamingResponse:
+    """
+    Streams the job's events as SSE, from the first one or from after the
+    Last-Event-ID a reconnecting client sends, and ends with an `end` event
+    carrying the final job status. Disconnecting does not affect the job.
+    """
+    job = _get_job(queue, user_id, job_id)
+    last_event_id = http_request.headers.get("last-event-id", "")
+    start = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+
+    async def event_generator():
+        async for index, data in job.follow(start):
+            yield f"id: {index}\ndata: {data}\n\n"
+        yield f"event: end\ndata: {job.info.model_dump_json()}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
 @app.get("/sheetchat/history/{file_id}/{sheet_idx}")
 async def get_sheet_chat_history(
     file_id: str,
@@ -424,10 +1185,11 @@ async def upload_file(
     file: UploadFile = File(...),
     user_id: str = Depends(get_user_id),
     store: FileStore = Depends(get_file_store),
+    pool: ServerExecutors = Depends(get_executors),
 ) -> UserFile:
     content = await file.read()
     filename = file.filename or "unknown"
-    return store.create_file(user_id, filename, content)
+    return await pool.run_io(store.create_file, user_id, filename, content)
 
 
 if __name__ == "__main__":
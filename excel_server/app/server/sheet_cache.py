@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import Optional
+
+from app.domain import SheetData
+from app.exgent.sheet_encoding import encode_sheet_compact
+from app.exgent.sheet_frame import SheetFrame
+from app.server.excel_utils import list_to_csv_string
+
+
+class SheetSource:
+    """A parsed sheet and the prompt artifacts derived from it.
+
+    Uploaded files are immutable, so a source is identified by the file's
+    content key and the sheet index, and its derived artifacts are computed
+    at most once.
+    """
+
+    def __init__(
+        self, content_key: str, sheet_idx: int, sheet_name: str, sheet_data: SheetData
+    ):
+        self.content_key = content_key
+        self.sheet_idx = sheet_idx
+        self.sheet_name = sheet_name
+        self.sheet_data = sheet_data
+        self._compact: dict[int, str] = {}
+
+    @property
+    def key(self) -> str:
+        return f"{self.content_key}:{self.sheet_idx}"
+
+    @cached_property
+    def csv(self) -> str:
+        return list_to_csv_string(self.sheet_data.data)
+
+    @cached_property
+    def frame(self) -> SheetFrame:
+        return SheetFrame.from_sheet_data(self.sheet_data)
+
+    def compact(self, token_budget: int = 0) -> str:
+        """Compact prompt encoding of the sheet, memoized per token budget."""
+        text = self._compact.get(token_budget)
+        if text is None:
+            text = encode_sheet_compact(self.frame, token_budget)
+            self._compact[token_budget] = text
+        return text
+
+
+class SheetSourceCache:
+    """Bounded LRU of SheetSources keyed by (content key, sheet_idx)."""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, int], SheetSource] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, content_key: str, sheet_idx: int) -> Optional[SheetSource]:
+        with self._lock:
+            source = self._entries.get((content_key, sheet_idx))
+            if source is not None:
+                self._entries.move_to_end((content_key, sheet_idx))
+            return source
+
+    def put(self, source: SheetSource) -> SheetSource:
+        key = (source.content_key, source.sheet_idx)
+        with self._lock:
+            # Keep the first source if two requests raced to build it
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._entries.move_to_end(key)
+                return existing
+            self._entries[key] = source
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return source
@@ -1,4 +1,5 @@
 import logging
+import re
 from datetime import datetime, timezone
 from typing import Callable, List, Optional
 
@@ -51,6 +52,32 @@ class SheetInfoModel(Base):
         )
 
 
+class LabelTagModel(Base):
+    """Analyst-approved tag for a financial item label, per user."""
+
+    __tablename__ = "label_tags"
+
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    statement_type: Mapped[str] = mapped_column(String, primary_key=True)
+    label: Mapped[str] = mapped_column(String, primary_key=True)
+
+    tag: Mapped[str] = mapped_column(String)
+    file_id: Mapped[str] = mapped_column(String)
+    update_time: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+
+# Tags that say nothing about a label and are never indexed
+UNINDEXED_TAGS = {"", "unclear"}
+
+
+def normalize_label(label: str) -> str:
+    # Case, surrounding punctuation and runs of whitespace vary between
+    # exports of the same chart of accounts
+    return re.sub(r"\s+", " ", label).strip(" \t:;.-").casefold()
+
+
 class SheetInfoStore:
     def __init__(
         self,
@@ -129,6 +156,19 @@ class SheetInfoStore:
             results = session.execute(stmt).scalars().all()
             return [r.to_pydantic() for r in results]
 
+    def get_latest_versions(self, user_id: str, file_id: str) -> dict[int, int]:
+        """Latest version number per sheet_idx, without loading payloads."""
+        self._check_auth(user_id, "read", file_id)
+        with self.SessionLocal() as session:
+            stmt = (
+                select(SheetInfoModel.sheet_idx, func.max(SheetInfoModel.version))
+                .where(SheetInfoModel.file_id == file_id)
+                .group_by(SheetInfoModel.sheet_idx)
+            )
+            return {
+                sheet_idx: version for sheet_idx, version in session.execute(stmt).all()
+            }
+
     def get_latest(
         self, user_id: str, file_id: str, sheet_idx: int
     ) -> Optional[SheetInfo]:
@@ -145,3 +185,79 @@ class SheetInfoStore:
             )
             result = session.execute(stmt).scalar()
             return result.to_pydantic() if result else None
+
+    def get_latest_tagged(
+        self, user_id: str, file_id: str, sheet_idx: int
+    ) -> Optional[SheetInfo]:
+        """The most recent version whose payload carries tags, if any."""
+        self._check_auth(user_id, "read", file_id)
+        with self.SessionLocal() as session:
+            stmt = (
+                select(SheetInfoModel)
+                .where(
+                    SheetInfoModel.file_id == file_id,
+                    SheetInfoModel.sheet_idx == sheet_idx,
+                    SheetInfoModel.payload.is_not(None),
+                )
+                .order_by(SheetInfoModel.version.desc())
+            )
+            # Newer versions are usually tagged, so this stops early
+            for result in session.execute(stmt).scalars():
+                sheet_info = result.to_pydantic()
+                if sheet_info.payload is not None and sheet_info.payload.tags:
+                    return sheet_info
+            return None
+
+    def record_label_tags(
+        self,
+        user_id: str,
+        file_id: str,
+        statement_type: str,
+        label_tags: list[tuple[str, str]],
+    ) -> int:
+        """Indexes (label, tag) pairs approved in file_id for later files.
+
+        The latest approval of a label wins. Returns the number of labels
+        written.
+        """
+        self._check_auth(user_id, "update", file_id)
+        statement_type = normalize_label(statement_type)
+        latest: dict[str, str] = {}
+        for label, tag in label_tags:
+            label, tag = normalize_label(label or ""), (tag or "").strip()
+            if label and tag.casefold() not in UNINDEXED_TAGS:
+                latest[label] = tag
+
+        now = datetime.now(timezone.utc)
+        with self.SessionLocal() as session:
+            for label, tag in latest.items():
+                session.merge(
+                    LabelTagModel(
+                        user_id=user_id,
+                        statement_type=statement_type,
+                        label=label,
+                        tag=tag,
+                        file_id=file_id,
+                        update_time=now,
+                    )
+                )
+            session.commit()
+        return len(latest)
+
+    def get_label_tags(
+        self, user_id: str, statement_type: str, labels: list[str]
+    ) -> dict[str, str]:
+        """Known tags for the given labels, keyed by the labels as passed in."""
+        self._check_auth(user_id, "read")
+        normalized = {label: normalize_label(label or "") for label in labels}
+        wanted = {n for n in normalized.values() if n}
+        if not wanted:
+            return {}
+        with self.SessionLocal() as session:
+            stmt = select(LabelTagModel.label, LabelTagModel.tag).where(
+                LabelTagModel.user_id == user_id,
+                LabelTagModel.statement_type == normalize_label(statement_type),
+                LabelTagModel.label.in_(wanted),
+            )
+            tags = dict(session.execute(stmt).all())
+        return {label: tags[n] for label, n in normalized.items() if n in tags}
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from app.domain import SheetInfo, SheetInfoPayload
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+
+logger = logging.getLogger(__name__)
+
+# Runs a blocking callable off the event loop, e.g. ServerExecutors.run_io
+RunBlocking = Callable[..., Awaitable[Any]]
+# Called with the stored version before the callers get it back
+AfterWrite = Callable[[SheetInfo], Awaitable[None]]
+
+
+@dataclass
+class _PendingWrite:
+    store: SheetInfoStore
+    user_id: str
+    sheet_name: str
+    payload: Optional[SheetInfoPayload]
+    future: asyncio.Future
+    first_submit: float
+    submits: int = 1
+    after_write: Optional[AfterWrite] = None
+    timer: Optional[asyncio.TimerHandle] = field(default=None, repr=False)
+
+
+class SheetInfoWriteCoalescer:
+    """Debounces SheetInfo saves per (user_id, file_id, sheet_idx).
+
+    Saves arriving within `window_seconds` of each other collapse into one
+    add_sheet_info call carrying the last payload, and every caller gets the
+    resulting SheetInfo. Only the `after_write` hook of the save whose payload
+    was written is run, once per version and in version order. A steady
+    stream of saves is flushed at most `max_delay_seconds` after the first
+    one. Saves of different users are never merged, but all writes for the
+    same sheet are serialized, so a flush never races the previous one for a
+    version number.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 0.3,
+        max_delay_seconds: float = 2.0,
+        run_blocking: Optional[RunBlocking] = None,
+    ):
+        self.window_seconds = window_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.run_blocking = run_blocking or asyncio.to_thread
+        self._pending: dict[tuple, _PendingWrite] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    async def submit(
+        self,
+        store: SheetInfoStore,
+        user_id: str,
+        file_id: str,
+        sheet_idx: int,
+        sheet_name: str,
+        payload: Optional[SheetInfoPayload] = None,
+        after_write: Optional[AfterWrite] = None,
+    ) -> SheetInfo:
+        loop = asyncio.get_running_loop()
+        key = (id(store), file_id, sheet_idx, user_id)
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = _PendingWrite(
+                store=store,
+                user_id=user_id,
+                sheet_name=sheet_name,
+                payload=payload,
+                future=loop.create_future(),
+                first_submit=loop.time(),
+                after_write=after_write,
+            )
+            self._pending[key] = pending
+        else:
+            pending.sheet_name = sheet_name
+            pending.payload = payload
+            pending.after_write = after_write
+            pending.submits += 1
+            if pending.timer is not None:
+                pending.timer.cancel()
+
+        remaining = pending.first_submit + self.max_delay_seconds - loop.time()
+        delay = max(0.0, min(self.window_seconds, remaining))
+        pending.timer = loop.call_later(delay, self._flush, key, file_id, sheet_idx)
+
+        # Shielded so that one caller disconnecting does not cancel the write
+        # the other callers are waiting on.
+        return await asyncio.shield(pending.future)
+
+    def _flush(self, key: tuple, file_id: str, sheet_idx: int) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        # Writes are serialized per sheet, across users
+        sheet_key = key[:3]
+        previous = self._inflight.get(sheet_key)
+        task = asyncio.ensure_future(
+            self._write(sheet_key, pending, file_id, sheet_idx, previous)
+        )
+        self._inflight[sheet_key] = task
+
+    async def _write(
+        self,
+        sheet_key: tuple,
+        pending: _PendingWrite,
+        file_id: str,
+        sheet_idx: int,
+        previous: Optional[asyncio.Task],
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            try:
+                result = await self.run_blocking(
+                    pending.store.add_sheet_info,
+                    pending.user_id,
+                    file_id,
+                    sheet_idx,
+                    pending.sheet_name,
+                    pending.payload,
+                )
+            except Exception as e:
+                # Logged here as well, since every caller may have gone away
+                logger.exception("Writing %s/%d failed", file_id, sheet_idx)
+                pending.future.set_exception(e)
+                # Mark retrieved so asyncio does not report it a second time
+                pending.future.exception()
+                return
+
+            if pending.submits > 1:
+                logger.debug(
+                    "Coalesced %d saves of %s/%d into version %d",
+                    pending.submits,
+                    file_id,
+                    sheet_idx,
+                    result.version,
+                )
+            if pending.after_write is not None:
+                # The version is stored either way; a failing hook must not
+                # turn the save into an error for the callers.
+                try:
+                    await pending.after_write(result)
+                except Exception:
+                    logger.exception(
+                        "after_write of %s/%d version %d failed",
+                        file_id,
+                        sheet_idx,
+                        result.version,
+                    )
+            pending.future.set_result(result)
+        finally:
+            if self._inflight.get(sheet_key) is asyncio.current_task():
+                del self._inflight[sheet_key]
+
+    async def flush_all(self) -> None:
+        """Write every pending save now and wait for in-flight writes."""
+        for key, pending in list(self._pending.items()):
+            if pending.timer is not None:
+                pending.timer.cancel()
+            _, file_id, sheet_idx, _ = key
+            self._flush(key, file_id, sheet_idx)
+        if self._inflight:
+            await asyncio.wait(list(self._inflight.values()))
@@ -0,0 +1,104 @@
+"""Group CSV generation: per-group generate_group_csv vs generate_groups_csv.
+
+Builds a synthetic statement (or uses the first sheet of a workbook with
+consecutive groups over its rows) and times producing the tagging CSV of
+every group both ways.
+
+Usage (from excel_server/):
+    uv run python -m benchmarks.bench_group_csv [--rows 3000 --cols 40]
+    uv run python -m benchmarks.bench_group_csv --workbook book.xlsx
+"""
+
+import argparse
+import random
+import time
+from typing import Callable
+
+from app.domain import ReportGroup, SheetData, SheetStructure
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.tag_groups_utils import generate_group_csv, generate_groups_csv
+from app.server.excel_utils import get_sheet_data
+
+
+def _synthetic_sheet(rows: int, cols: int) -> SheetData:
+    rng = random.Random(0)
+    header = [" "] + [f"C{i}" for i in range(1, cols)]
+    data = [header]
+    for r in range(1, rows):
+        values = [f"{rng.randint(-99999, 999999):,}" for _ in range(cols - 3)]
+        data.append([str(r), "", f"Line item {r}", *values])
+    return SheetData(data=data)
+
+
+def _structure(sheet: SheetData, group_size: int) -> SheetStructure:
+    groups = [
+        ReportGroup(
+            name=f"Group {start}",
+            header_rows=[start],
+            line_items=list(range(start + 1, start + group_size - 1)),
+            total=start + group_size - 1,
+        )
+        for start in range(1, len(sheet.data) - group_size + 1, group_size)
+    ]
+    return SheetStructure(
+        statement_type="Income Statement",
+        financial_items_column=2,
+        date_columns=[3, 4],
+        groups=groups,
+    )
+
+
+def _time(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workbook")
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--cols", type=int, default=40)
+    parser.add_argument("--group-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.workbook:
+        with open(args.workbook, "rb") as f:
+            sheet = get_sheet_data(f.read(), 0)
+    else:
+        sheet = _synthetic_sheet(args.rows, args.cols)
+    structure = _structure(sheet, args.group_size)
+    frame = SheetFrame.from_sheet_data(sheet)
+    df = frame.to_dataframe()
+
+    def per_group() -> list[str]:
+        return [
+            generate_group_csv(
+                group, df, structure.financial_items_column, structure.date_columns
+            )
+            for group in structure.groups
+        ]
+
+    def batch() -> list[str]:
+        return generate_groups_csv(structure, frame)
+
+    assert per_group() == batch()
+
+    per_group_time = _time(per_group, args.repeat)
+    batch_time = _time(batch, args.repeat)
+    print(
+        f"{frame.shape[0]} rows x {frame.shape[1]} cols, {len(structure.groups)} groups"
+    )
+    print(f"  generate_group_csv   {per_group_time * 1000:9.2f} ms")
+    print(
+        f"  generate_groups_csv  {batch_time * 1000:9.2f} ms"
+        f"  ({per_group_time / max(batch_time, 1e-9):.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Bytes on the wire and serialization CPU for the sheet payloads.
+
+Compares FastAPI's default path (pydantic serialize + json.dumps) with
+SheetJSONResponse (orjson), and reports the FileDetailResponse size raw,
+gzipped and brotli-compressed.
+
+Usage (from excel_server/):
+    uv run python -m benchmarks.bench_sheet_payloads [workbook.xlsx ...]
+"""
+
+import argparse
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Callable
+
+from app.domain import FileDetailResponse, SheetInfo
+from app.server.excel_utils import convert_excel_to_sheet_data
+from app.server.responses import SheetJSONResponse
+from pydantic import TypeAdapter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_WORKBOOK = Path(__file__).resolve().parent.parent / "tests" / "sample.xlsx"
+
+
+def _fastapi_default(model: FileDetailResponse) -> bytes:
+    # What FastAPI does for a response_model: serialize to python in json
+    # mode, then JSONResponse.render
+    content = TypeAdapter(FileDetailResponse).dump_python(model, mode="json")
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _orjson(model: FileDetailResponse) -> bytes:
+    return SheetJSONResponse(model).body
+
+
+def _time(func: Callable[[], bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        func()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def _file_details(path: Path) -> FileDetailResponse:
+    sheets = convert_excel_to_sheet_data(path.read_bytes())
+    return FileDetailResponse(
+        sheets=[
+            SheetInfo(
+                user_id="bench",
+                file_id="bench",
+                sheet_name=name,
+                sheet_idx=idx,
+                version=0,
+            )
+            for idx, (name, _) in enumerate(sheets)
+        ],
+        sheets_data=[data for _, data in sheets],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("workbooks", nargs="*", default=[str(DEFAULT_WORKBOOK)])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for workbook in args.workbooks:
+        model = _file_details(Path(workbook))
+        cells = sum(len(row) for data in model.sheets_data for row in data.data)
+        body = _orjson(model)
+        assert json.loads(body) == json.loads(_fastapi_default(model))
+
+        print(f"{Path(workbook).name}: {cells} cells")
+        print(f"  raw        {len(body):>10,} bytes")
+        print(f"  gzip (6)   {len(gzip.compress(body, compresslevel=6)):>10,} bytes")
+        if brotli is not None:
+            print(f"  brotli (4) {len(brotli.compress(body, quality=4)):>10,} bytes")
+        default_cpu = _time(lambda m=model: _fastapi_default(m), args.repeat)
+        orjson_cpu = _time(lambda m=model: _orjson(m), args.repeat)
+        print(f"  serialize  default {default_cpu * 1000:8.2f} ms")
+        print(
+            f"  serialize  orjson  {orjson_cpu * 1000:8.2f} ms"
+            f"  ({default_cpu / max(orjson_cpu, 1e-9):.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
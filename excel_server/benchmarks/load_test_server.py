@@ -0,0 +1,118 @@
+"""Concurrent load test for the file and sheet endpoints.
+
+Fires a burst of slow /sheetdata parses alongside cheap /files metadata calls
+and reports per-endpoint throughput and latency for two executor layouts:
+
+* shared: one pool for everything, the way sync handlers share Starlette's
+  default threadpool.
+* dedicated: the io and parse pools the server uses.
+
+Usage (from excel_server/):
+    uv run python -m benchmarks.load_test_server [workbook.xlsx]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import httpx
+from app.file_store.file_store import FileStore, LocalFileStoreBackend
+from app.server import server
+from app.server.executors import ServerExecutors
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+
+DEFAULT_WORKBOOK = Path(__file__).resolve().parent.parent / "tests" / "sample.xlsx"
+
+
+def _provider(value: object) -> Callable[[], object]:
+    # A default argument would bind the value too, but FastAPI would treat it
+    # as a query parameter of every endpoint using the dependency.
+    return lambda: value
+
+
+def _summary(name: str, latencies: list[float], elapsed: float) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    return (
+        f"  {name:<10} n={len(latencies):<4} {len(latencies) / elapsed:8.1f} req/s"
+        f"  p50={statistics.median(latencies) * 1000:7.1f}ms"
+        f"  p95={p95 * 1000:7.1f}ms"
+    )
+
+
+async def _run_load(
+    file_id: str, parse_requests: int, metadata_requests: int
+) -> tuple[list[float], list[float], float, float]:
+    async def timed_get(client: httpx.AsyncClient, url: str) -> float:
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        start = time.perf_counter()
+        parses = asyncio.gather(
+            *[timed_get(c, f"/sheetdata/{file_id}/0") for _ in range(parse_requests)]
+        )
+        metadata = await asyncio.gather(
+            *[timed_get(c, "/files") for _ in range(metadata_requests)]
+        )
+        metadata_elapsed = time.perf_counter() - start
+        parse_latencies = await parses
+        parse_elapsed = time.perf_counter() - start
+    return parse_latencies, metadata, parse_elapsed, metadata_elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("workbook", nargs="?", default=str(DEFAULT_WORKBOOK))
+    parser.add_argument("--parse-requests", type=int, default=32)
+    parser.add_argument("--metadata-requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_store = FileStore(
+            db_url=f"sqlite:///{os.path.join(tmp, 'fs.db')}",
+            backend=LocalFileStoreBackend(base_path=os.path.join(tmp, "files")),
+        )
+        sheet_info_store = SheetInfoStore(
+            db_url=f"sqlite:///{os.path.join(tmp, 'si.db')}"
+        )
+        file_id = file_store.create_file(
+            "user_one", Path(args.workbook).name, Path(args.workbook).read_bytes()
+        ).file_id
+
+        server.app.dependency_overrides[server.get_file_store] = lambda: file_store
+        server.app.dependency_overrides[server.get_sheet_info_store] = lambda: (
+            sheet_info_store
+        )
+
+        shared = ServerExecutors(io_workers=args.workers, parse_workers=1)
+        shared.parse.shutdown()
+        shared.parse = shared.io
+        dedicated = ServerExecutors(
+            io_workers=args.workers, parse_workers=max(1, args.workers // 2)
+        )
+
+        for name, pool in (("shared", shared), ("dedicated", dedicated)):
+            server.app.dependency_overrides[server.get_executors] = _provider(pool)
+            parse, metadata, parse_elapsed, metadata_elapsed = asyncio.run(
+                _run_load(file_id, args.parse_requests, args.metadata_requests)
+            )
+            print(f"{name} executors:")
+            print(_summary("/files", metadata, metadata_elapsed))
+            print(_summary("/sheetdata", parse, parse_elapsed))
+            pool.shutdown()
+
+        server.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
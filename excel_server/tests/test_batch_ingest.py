@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.batch.ingest import Checkpoint, FileResult, main
+from app.exgent.agent import generate_agent
+from app.exgent.fake_llm import pipeline_reply
+from app.file_store.file_store import FileStore, LocalFileStoreBackend
+from app.server import server
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+
+SAMPLE = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+
+
+def read_checkpoint(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_ingest_tags_every_workbook_and_resumes(tmp_path, capsys):
+    input_dir = tmp_path / "in"
+    (input_dir / "march").mkdir(parents=True)
+    shutil.copy(SAMPLE, input_dir / "a.xlsx")
+    shutil.copy(SAMPLE, input_dir / "march" / "b.xlsx")
+    (input_dir / "~$a.xlsx").write_bytes(b"lock file")
+    storage_dir = tmp_path / "storage"
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    real_client = generate_agent.model.llm_client
+
+    args = [
+        str(input_dir),
+        "--storage-dir",
+        str(storage_dir),
+        "--checkpoint",
+        str(checkpoint),
+        "--workers",
+        "2",
+        "--parse-processes",
+        "1",
+        "--fake-llm",
+    ]
+    assert main(args) == 0
+
+    records = read_checkpoint(checkpoint)
+    assert sorted(r["path"] for r in records) == ["a.xlsx", "march/b.xlsx"]
+    for record in records:
+        assert record["status"] == "succeeded"
+        # The empty blank_detection sheet is skipped
+        assert record["sheets"] == 4
+        assert record["seconds"] >= record["tag_seconds"] > 0
+
+    # Uploaded through the server's stores, with structure and tags saved
+    file_store = FileStore(
+        db_url=f"sqlite:///{storage_dir / 'file_store' / 'file_store_db.sqllite'}",
+        backend=LocalFileStoreBackend(
+            base_path=str(storage_dir / "file_store" / "files")
+        ),
+    )
+    assert len(file_store.list_files("user_one")) == 2
+    sheet_info_store = SheetInfoStore(
+        db_url="sqlite:///"
+        f"{storage_dir / 'file_extract_store' / 'file_extract_store_db.sqllite'}"
+    )
+    latest = sheet_info_store.get_latest("user_one", records[0]["file_id"], 0)
+    assert latest.payload.structure.groups
+    assert latest.payload.tags
+
+    report = capsys.readouterr().out
+    assert "2 files processed (2 succeeded, 0 failed), 0 skipped" in report
+    assert "files/min" in report and "march/b.xlsx" in report
+    # The fake is uninstalled again
+    assert generate_agent.model.llm_client is real_client
+
+    # A second run only picks up new files
+    shutil.copy(SAMPLE, input_dir / "c.xlsx")
+    assert main(args) == 0
+    assert [r["path"] for r in read_checkpoint(checkpoint)][2:] == ["c.xlsx"]
+    assert "1 files processed (1 succeeded, 0 failed), 2 skipped" in (
+        capsys.readouterr().out
+    )
+
+
+def test_failed_files_are_retried_without_a_second_upload(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "broken.xlsx").write_bytes(b"not a workbook")
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    args = [
+        str(input_dir),
+        "--storage-dir",
+        str(tmp_path / "storage"),
+        "--checkpoint",
+        str(checkpoint),
+        "--parse-processes",
+        "0",
+        "--fake-llm",
+    ]
+
+    assert main(args) == 1
+    assert main(args) == 1
+    first, second = read_checkpoint(checkpoint)
+    assert first["status"] == second["status"] == "failed"
+    assert first["error"]
+    assert first["file_id"] == second["file_id"]
+
+
+def test_checkpoint_keeps_the_last_readable_record_per_path(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    now = datetime.now(timezone.utc)
+    failed = FileResult(
+        path="a.xlsx", sha256="1", status="failed", file_id="f1", finished_at=now
+    )
+    succeeded = failed.model_copy(update={"status": "succeeded"})
+    path.write_text(
+        failed.model_dump_json()
+        + "\n"
+        + succeeded.model_dump_json()
+        + "\n"
+        # Cut short by an interrupted run
+        + '{"path": "b.xlsx", "sha2'
+    )
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.is_done("a.xlsx", "1")
+    # Changed content is processed again
+    assert not checkpoint.is_done("a.xlsx", "2")
+    assert checkpoint.uploaded_file_id("a.xlsx", "2") is None
+    assert not checkpoint.is_done("b.xlsx", "1")
+
+
+def test_pipeline_reply_tags_group_rows_by_label():
+    prompt = (
+        "## 📚 Internal Ontology\n...\n**User Input:**\n"
+        "row_number,row_type,financial_item,value\n"
+        "5,header,Revenue,\n"
+        "6,line_item,Product Sales,100\n"
+        "7,line_item,Sales Discounts,-5\n"
+        "8,total_row,Total Revenue,95\n"
+        "9,line_item,Sundry,1\n"
+    )
+    reply = pipeline_reply("m", [{"role": "user", "content": prompt}])
+    assert reply.splitlines() == [
+        "6,Gross Revenue",
+        "7,Total Discounts",
+        "8,Net Revenue",
+        "9,Unclear",
+    ]
+
+
+def test_caches_are_kept_under_the_storage_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "STORAGE_CACHE_MAX_BYTES", 1 << 20)
+    monkeypatch.setattr(server, "LLM_CACHE_BACKEND", "sqlite")
+    monkeypatch.delenv("storage_cache_dir", raising=False)
+
+    file_store = server.create_file_store(str(tmp_path))
+    file_store.create_file("user_one", "sample.xlsx", SAMPLE.read_bytes())
+    server.create_llm_response_cache(str(tmp_path))
+
+    assert any((tmp_path / "file_store" / "cache").iterdir())
+    assert (tmp_path / "llm_cache" / "llm_cache_db.sqllite").exists()
@@ -0,0 +1,160 @@
+import threading
+import time
+
+import pytest
+from app.file_store.caching_backend import CachingStorageBackend
+from app.file_store.file_store import LocalFileStoreBackend
+
+
+class CountingBackend(LocalFileStoreBackend):
+    """Local backend that counts reads and can simulate fetch latency."""
+
+    def __init__(self, base_path: str, delay: float = 0.0):
+        super().__init__(base_path=base_path)
+        self.delay = delay
+        self.reads = 0
+
+    def read(self, file_uri: str) -> bytes:
+        self.reads += 1
+        time.sleep(self.delay)
+        return super().read(file_uri)
+
+
+@pytest.fixture
+def slow_backend(tmp_path):
+    return CountingBackend(base_path=str(tmp_path / "remote"))
+
+
+@pytest.fixture
+def cache(slow_backend, tmp_path):
+    return CachingStorageBackend(
+        slow_backend, cache_dir=str(tmp_path / "cache"), max_bytes=100
+    )
+
+
+def test_write_through_and_hit(cache, slow_backend):
+    uri = cache.save("a", b"x" * 10)
+
+    # Written to the wrapped backend as well as the cache
+    assert slow_backend.read(uri) == b"x" * 10
+    slow_backend.reads = 0
+
+    assert cache.read(uri) == b"x" * 10
+    assert slow_backend.reads == 0
+
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 0
+    assert stats.size_bytes == 10
+
+
+def test_read_miss_fills_cache(cache, slow_backend):
+    uri = slow_backend.save("a", b"hello")
+
+    assert cache.read(uri) == b"hello"
+    assert cache.read(uri) == b"hello"
+    assert slow_backend.reads == 1
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+    assert stats.hit_rate == 0.5
+    assert stats.model_dump()["hit_rate"] == 0.5
+
+
+def test_lru_eviction(cache, slow_backend):
+    uri_a = cache.save("a", b"a" * 40)
+    uri_b = cache.save("b", b"b" * 40)
+    cache.read(uri_a)  # a is now most recently used
+    cache.save("c", b"c" * 40)
+
+    stats = cache.stats()
+    assert stats.evictions == 1
+    assert stats.size_bytes == 80
+
+    cache.read(uri_a)
+    assert slow_backend.reads == 0
+    cache.read(uri_b)
+    assert slow_backend.reads == 1
+
+
+def test_concurrent_misses_fetch_once(tmp_path):
+    slow_backend = CountingBackend(base_path=str(tmp_path / "remote"), delay=0.1)
+    cache = CachingStorageBackend(slow_backend, cache_dir=str(tmp_path / "cache"))
+    uri = slow_backend.save("a", b"payload")
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.read(uri)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [b"payload"] * 8
+    assert slow_backend.reads == 1
+    assert cache.stats().misses == 1
+
+
+def test_fill_lock_outlives_the_first_fill_while_readers_wait(tmp_path):
+    fetching, release = threading.Event(), threading.Event()
+
+    class BlockingBackend(CountingBackend):
+        def read(self, file_uri: str) -> bytes:
+            fetching.set()
+            release.wait(5)
+            return super().read(file_uri)
+
+    slow_backend = BlockingBackend(base_path=str(tmp_path / "remote"))
+    cache = CachingStorageBackend(slow_backend, cache_dir=str(tmp_path / "cache"))
+    uri = slow_backend.save("a", b"payload")
+    name = cache._cache_name(uri)
+
+    first = threading.Thread(target=cache.read, args=(uri,))
+    first.start()
+    assert fetching.wait(5)
+    waiter = threading.Thread(target=cache.read, args=(uri,))
+    waiter.start()
+    while cache._fill_locks[name].users < 2:
+        time.sleep(0.01)
+
+    release.set()
+    first.join()
+    waiter.join()
+
+    assert slow_backend.reads == 1
+    assert cache._fill_locks == {}
+
+
+def test_open_miss_streams_without_filling(cache, slow_backend):
+    uri = slow_backend.save("a", b"hello")
+
+    with cache.open(uri) as stream:
+        assert stream.read() == b"hello"
+    assert cache.stats().entries == 0
+
+    cache.read(uri)
+    with cache.open(uri) as stream:
+        assert stream.read() == b"hello"
+    assert (cache.stats().hits, cache.stats().misses) == (1, 2)
+
+
+def test_delete_invalidates(cache, slow_backend):
+    uri = cache.save("a", b"data")
+    cache.delete(uri)
+    assert cache.stats().entries == 0
+    with pytest.raises(FileNotFoundError):
+        cache.read(uri)
+    # Failed reads do not leave a fill lock behind
+    assert cache._fill_locks == {}
+
+
+def test_entries_survive_restart(slow_backend, tmp_path):
+    cache = CachingStorageBackend(slow_backend, cache_dir=str(tmp_path / "cache"))
+    uri = cache.save("a", b"data")
+
+    reopened = CachingStorageBackend(slow_backend, cache_dir=str(tmp_path / "cache"))
+    assert reopened.stats().entries == 1
+    assert reopened.read(uri) == b"data"
+    assert slow_backend.reads == 0
@@ -0,0 +1,398 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+from app.exgent import llm_scheduler
+from app.exgent.agent_utils import EXCEL_FILE_REF
+from app.file_store.file_store import FileStore, LocalFileStoreBackend
+from app.server import server
+from app.server.job_queue import JobQueue, JobStatus
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+from fastapi.testclient import TestClient
+from google.adk.events.event import Event
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.genai.types import Content, Part
+
+SAMPLE = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+
+
+def test_jobs_run_on_a_bounded_worker_pool():
+    running = 0
+    peak = 0
+
+    async def work(job):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        job.publish(json.dumps({"file": job.info.file_id}))
+        running -= 1
+
+    async def run():
+        queue = JobQueue(workers=2)
+        await queue.start()
+        jobs = [queue.submit("tag", "u", f"f{i}", work, sheet_idx=0) for i in range(5)]
+        while not all(job.done for job in jobs):
+            await asyncio.sleep(0.005)
+        await queue.stop()
+        return jobs
+
+    jobs = asyncio.run(run())
+    assert peak == 2
+    assert [job.info.status for job in jobs] == [JobStatus.SUCCEEDED] * 5
+    assert [job.events for job in jobs] == [[f'{{"file": "f{i}"}}'] for i in range(5)]
+
+
+def test_jobs_use_background_priority_and_record_failures():
+    seen = []
+
+    async def work(job):
+        seen.append(llm_scheduler._priority.get())
+        raise RuntimeError("model unavailable")
+
+    async def run():
+        queue = JobQueue(workers=1)
+        await queue.start()
+        job = queue.submit("tag", "u", "f", work, sheet_idx=0)
+        await asyncio.wait_for(_until_done(job), 1)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(run())
+    assert seen == [llm_scheduler.Priority.BACKGROUND]
+    assert job.info.status == JobStatus.FAILED
+    assert job.info.error == "model unavailable"
+
+
+async def _until_done(job):
+    async for _ in job.follow():
+        pass
+
+
+def test_identical_pending_jobs_are_shared_and_can_be_cancelled():
+    async def run():
+        gate = asyncio.Event()
+
+        async def work(job):
+            await gate.wait()
+
+        queue = JobQueue(workers=1)
+        await queue.start()
+        first = queue.submit("tag", "u", "f", work, sheet_idx=0)
+        again = queue.submit("tag", "u", "f", work, sheet_idx=0)
+        queued = queue.submit("tag", "u", "f", work, sheet_idx=1)
+        await asyncio.sleep(0.01)
+
+        # One running, one still queued; both can be cancelled
+        assert first.info.status == JobStatus.RUNNING
+        queue.cancel("u", queued.info.job_id)
+        queue.cancel("u", first.info.job_id)
+        await asyncio.wait_for(_until_done(first), 1)
+
+        # Other users cannot see the job
+        assert queue.get("someone_else", first.info.job_id) is None
+        await queue.stop()
+        return first, again, queued
+
+    first, again, queued = asyncio.run(run())
+    assert again is first
+    assert first.info.status == JobStatus.CANCELLED
+    assert queued.info.status == JobStatus.CANCELLED
+    assert queued.info.started_at is None
+
+
+def test_jobs_with_other_options_are_not_shared():
+    async def run():
+        gate = asyncio.Event()
+
+        async def work(job):
+            await gate.wait()
+
+        queue = JobQueue(workers=1)
+        await queue.start()
+        incremental = queue.submit(
+            "tag", "u", "f", work, sheet_idx=0, options={"incremental_tagging": None}
+        )
+        full = queue.submit(
+            "tag", "u", "f", work, sheet_idx=0, options={"incremental_tagging": False}
+        )
+        again = queue.submit(
+            "tag", "u", "f", work, sheet_idx=0, options={"incremental_tagging": False}
+        )
+        gate.set()
+        await asyncio.wait_for(_until_done(full), 1)
+        await queue.stop()
+        return incremental, full, again
+
+    incremental, full, again = asyncio.run(run())
+    assert full is not incremental
+    assert again is full
+    assert full.info.options == {"incremental_tagging": False}
+    assert [incremental.info.status, full.info.status] == [JobStatus.SUCCEEDED] * 2
+
+
+def test_followers_replay_past_events_then_get_live_ones():
+    async def run():
+        gate = asyncio.Event()
+
+        async def work(job):
+            job.publish("1")
+            await gate.wait()
+            job.publish("2")
+
+        queue = JobQueue(workers=1)
+        await queue.start()
+        job = queue.submit("tag", "u", "f", work, sheet_idx=0)
+        await asyncio.sleep(0.01)
+
+        received = []
+
+        async def follow():
+            async for index, data in job.follow():
+                received.append((index, data))
+
+        follower = asyncio.create_task(follow())
+        await asyncio.sleep(0.01)
+        assert received == [(0, "1")]
+        gate.set()
+        await asyncio.wait_for(follower, 1)
+        await queue.stop()
+        return received
+
+    assert asyncio.run(run()) == [(0, "1"), (1, "2")]
+
+
+def test_events_are_capped_and_trimmed_when_the_job_ends():
+    async def run():
+        gate = asyncio.Event()
+
+        async def work(job):
+            for i in range(6):
+                job.publish(str(i))
+            await gate.wait()
+            job.publish("6")
+
+        queue = JobQueue(workers=1, max_events_per_job=4, max_finished_job_events=2)
+        await queue.start()
+        job = queue.submit("tag", "u", "f", work, sheet_idx=0)
+        await asyncio.sleep(0.01)
+        running = [event async for event in _take(job.follow(), 4)]
+        gate.set()
+        await asyncio.wait_for(_until_done(job), 1)
+        await queue.stop()
+        return job, running
+
+    job, running = asyncio.run(run())
+    # Only the newest events are kept; the indices stay the same
+    assert running == [(2, "2"), (3, "3"), (4, "4"), (5, "5")]
+    assert job.info.event_count == 7
+    assert job.events == ["5", "6"]
+
+
+async def _take(events, count):
+    async for event in events:
+        yield event
+        count -= 1
+        if not count:
+            return
+
+
+def test_dropped_jobs_run_their_cleanups():
+    cleaned = []
+
+    async def work(job):
+        async def cleanup():
+            cleaned.append(job.info.file_id)
+
+        job.cleanups.append(cleanup)
+
+    async def run():
+        queue = JobQueue(workers=1, max_finished_jobs=1)
+        await queue.start()
+        for file_id in ("f1", "f2"):
+            job = queue.submit("tag", "u", file_id, work, sheet_idx=0)
+            await asyncio.wait_for(_until_done(job), 1)
+        await asyncio.sleep(0)
+        evicted = list(cleaned)
+        await queue.stop()
+        return evicted
+
+    # f1 is evicted once f2 finishes; the rest when the queue stops
+    assert asyncio.run(run()) == ["f1"]
+    assert cleaned == ["f1", "f2"]
+
+
+class FakeTagRunner:
+    """Stands in for the tag job Runner; checks the job session it is given."""
+
+    def __init__(self, session_service: InMemorySessionService):
+        self.session_service = session_service
+        self.calls: list[dict] = []
+        self.fail_sheets: set[str] = set()
+        self.running = 0
+        self.max_running = 0
+
+    async def run_async(self, *, user_id, session_id, new_message, run_config):
+        session = await self.session_service.get_session(
+            app_name=server.TAG_JOB_APP_NAME, user_id=user_id, session_id=session_id
+        )
+        metadata = run_config.custom_metadata
+        self.calls.append(
+            {
+                "session_id": session_id,
+                "state": dict(session.state),
+                "metadata": metadata,
+            }
+        )
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            for text in ("**Task** - Revenue tagged.", "**All groups tagged***"):
+                await asyncio.sleep(0.01)
+                if metadata["sheet_name"] in self.fail_sheets:
+                    raise RuntimeError(f"Cannot tag {metadata['sheet_name']}")
+                yield Event(
+                    author="tag_all_groups_agent",
+                    content=Content(parts=[Part(text=text)], role="assistant"),
+                )
+        finally:
+            self.running -= 1
+
+
+@pytest.fixture
+def job_env(tmp_path):
+    file_store = FileStore(
+        db_url=f"sqlite:///{tmp_path / 'fs.db'}",
+        backend=LocalFileStoreBackend(base_path=str(tmp_path / "files")),
+    )
+    sheet_info_store = SheetInfoStore(db_url=f"sqlite:///{tmp_path / 'si.db'}")
+    session_service = InMemorySessionService()
+    runner = FakeTagRunner(session_service)
+
+    server.app.dependency_overrides.update(
+        {
+            server.get_file_store: lambda: file_store,
+            server.get_sheet_info_store: lambda: sheet_info_store,
+            server.get_session_service: lambda: session_service,
+            server.get_tag_job_runner: lambda: runner,
+        }
+    )
+    # The job queue runs on the event loop of the app's lifespan
+    with TestClient(server.app) as client:
+        yield client, file_store, runner
+    server.app.dependency_overrides.clear()
+
+
+def wait_for_job(client, job_id):
+    for _ in range(200):
+        info = client.get(f"/jobs/{job_id}").json()
+        if info["status"] not in ("queued", "running"):
+            return info
+        time.sleep(0.01)
+    raise AssertionError("Job did not finish")
+
+
+def test_tag_job_runs_without_a_connected_client(job_env):
+    client, file_store, runner = job_env
+    file_id = file_store.create_file(
+        "user_one", "sample.xlsx", SAMPLE.read_bytes()
+    ).file_id
+
+    response = client.post(
+        f"/jobs/tag/{file_id}/0", json={"incremental_tagging": False}
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    info = wait_for_job(client, job_id)
+    assert info["status"] == "succeeded"
+    assert info["event_count"] == 2
+    assert [job["job_id"] for job in client.get("/jobs").json()] == [job_id]
+
+    (call,) = runner.calls
+    source = call["metadata"]["sheet_source"]
+    assert call["session_id"] == job_id
+    assert call["state"] == {EXCEL_FILE_REF: source.key}
+    assert call["metadata"]["file_id"] == file_id
+    assert call["metadata"]["sheet_idx"] == 0
+    assert call["metadata"]["incremental_tagging"] is False
+
+    # Events can be replayed after the fact, or resumed after the last seen id
+    body = client.get(f"/jobs/{job_id}/events").text
+    assert body.count("data: {") == 3
+    assert body.startswith("id: 0\n")
+    assert "event: end" in body and '"status":"succeeded"' in body
+
+    resumed = client.get(f"/jobs/{job_id}/events", headers={"Last-Event-ID": "0"})
+    assert not resumed.text.startswith("id: 0\n")
+    assert resumed.text.startswith("id: 1\n")
+
+
+def test_tag_job_for_unknown_file_or_job_is_404(job_env):
+    client, _, _ = job_env
+    assert client.post("/jobs/tag/missing/0").status_code == 404
+    assert client.get("/jobs/missing").status_code == 404
+    assert client.get("/jobs/missing/events").status_code == 404
+    assert client.delete("/jobs/missing").status_code == 404
+
+
+def test_analyze_tags_every_sheet_from_one_workbook_parse(job_env, monkeypatch):
+    client, file_store, runner = job_env
+    file_id = file_store.create_file(
+        "user_one", "sample.xlsx", SAMPLE.read_bytes()
+    ).file_id
+
+    parses = []
+    real_convert = server.convert_excel_to_sheet_data
+
+    def convert(content, sheet_indices=None):
+        parses.append(sheet_indices)
+        return real_convert(content, sheet_indices)
+
+    monkeypatch.setattr(server, "convert_excel_to_sheet_data", convert)
+    monkeypatch.setattr(server, "ANALYZE_MAX_PARALLEL_SHEETS", 2)
+    runner.fail_sheets = {"Tags"}
+
+    response = client.post(f"/analyze/{file_id}")
+    assert response.status_code == 202
+    info = wait_for_job(client, response.json()["job_id"])
+
+    assert parses == [None]
+    assert runner.max_running == 2
+    assert sorted(call["metadata"]["sheet_idx"] for call in runner.calls) == list(
+        range(5)
+    )
+    assert len({call["session_id"] for call in runner.calls}) == 5
+
+    # One failing sheet does not stop the others, but fails the job
+    sheets = info["result"]["sheets"]
+    assert [sheet["sheet_name"] for sheet in sheets] == [
+        "sample_income_stmt",
+        "sample_balance_sheet",
+        "blank_detection",
+        "Tags",
+        "Income Statement",
+    ]
+    assert [sheet["status"] for sheet in sheets] == ["succeeded"] * 3 + [
+        "failed",
+        "succeeded",
+    ]
+    assert info["status"] == "failed"
+    assert info["error"] == "1 of 5 sheets failed: Tags"
+
+    # Agent events name the sheet they belong to
+    body = client.get(f"/jobs/{info['job_id']}/events").text
+    assert '"sheet_idx": 4, "event": {' in body
+
+    # The parsed sheets are shared with later single-sheet requests
+    response = client.post(f"/jobs/tag/{file_id}/1")
+    assert wait_for_job(client, response.json()["job_id"])["status"] == "succeeded"
+    assert parses == [None]
+
+
+def test_analyze_unknown_file_is_404(job_env):
+    client, _, _ = job_env
+    assert client.post("/analyze/missing").status_code == 404
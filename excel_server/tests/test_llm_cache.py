@@ -0,0 +1,198 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from app.domain import SheetStructure
+from app.exgent import llm_cache
+from app.exgent.agent_utils import CustomLiteLlm
+from app.exgent.llm_cache import (
+    CACHE_METADATA_KEY,
+    CachedLlmResponse,
+    InMemoryLlmCacheBackend,
+    LlmResponseCache,
+    SqliteLlmCacheBackend,
+    llm_cache_bypass,
+    set_default_response_cache,
+)
+from google.adk.models.lite_llm import LiteLLMClient
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+from litellm import ModelResponse
+
+MODEL = "gemini/gemini-2.5-flash"
+
+
+class FakeLiteLLMClient(LiteLLMClient):
+    def __init__(self):
+        self.calls = 0
+
+    async def acompletion(self, model, messages, tools, **kwargs):
+        self.calls += 1
+        return ModelResponse(
+            choices=[
+                {
+                    "message": {"role": "assistant", "content": f"reply {self.calls}"},
+                    "finish_reason": "stop",
+                }
+            ]
+        )
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryLlmCacheBackend(max_entries=8)
+    return SqliteLlmCacheBackend(db_url=f"sqlite:///{tmp_path / 'llm_cache.db'}")
+
+
+@pytest.fixture
+def use_cache():
+    def install(cache):
+        set_default_response_cache(cache)
+        return cache
+
+    yield install
+    set_default_response_cache(None)
+
+
+def make_request(text: str, schema=None) -> LlmRequest:
+    return LlmRequest(
+        model=MODEL,
+        contents=[types.Content(role="user", parts=[types.Part(text=text)])],
+        config=types.GenerateContentConfig(
+            system_instruction="Be brief.", response_schema=schema
+        ),
+    )
+
+
+def generate(model: CustomLiteLlm, request: LlmRequest):
+    async def run():
+        return [r async for r in model.generate_content_async(request)]
+
+    return asyncio.run(run())
+
+
+def text(responses) -> str:
+    return responses[-1].content.parts[0].text
+
+
+def test_identical_prompts_are_served_from_cache(backend, use_cache):
+    cache = use_cache(LlmResponseCache(backend))
+    client = FakeLiteLLMClient()
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=client)
+
+    first = generate(model, make_request("hello"))
+    second = generate(model, make_request("hello"))
+    other = generate(model, make_request("goodbye"))
+
+    assert client.calls == 2
+    assert text(first) == text(second) == "reply 1"
+    assert text(other) == "reply 2"
+
+    # Both the fresh and the replayed reply point at the same entry
+    fresh = first[-1].custom_metadata[CACHE_METADATA_KEY]
+    replayed = second[-1].custom_metadata[CACHE_METADATA_KEY]
+    assert fresh["hit"] is False and replayed["hit"] is True
+    assert fresh["key"] == replayed["key"]
+
+    entry = backend.get(fresh["key"])
+    assert entry.model == MODEL
+    assert entry.hit_count == 1
+    assert '"hello"' in entry.request_json
+    assert cache.stats().hits == 1
+    assert cache.stats().misses == 2
+
+
+def test_output_schema_is_part_of_the_key(use_cache):
+    use_cache(LlmResponseCache(InMemoryLlmCacheBackend()))
+    client = FakeLiteLLMClient()
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=client)
+
+    generate(model, make_request("hello"))
+    generate(model, make_request("hello", schema=SheetStructure))
+    generate(model, make_request("hello", schema=SheetStructure))
+    assert client.calls == 2
+
+
+def test_expired_entries_are_refetched(backend, use_cache):
+    cache = use_cache(LlmResponseCache(backend, ttl_seconds=60))
+    client = FakeLiteLLMClient()
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=client)
+
+    first = generate(model, make_request("hello"))
+    key = first[-1].custom_metadata[CACHE_METADATA_KEY]["key"]
+    entry = backend.get(key)
+    entry.created_at = datetime.now(timezone.utc) - timedelta(seconds=61)
+    backend.put(entry)
+
+    assert text(generate(model, make_request("hello"))) == "reply 2"
+    assert text(generate(model, make_request("hello"))) == "reply 2"
+    assert client.calls == 2
+    assert cache.stats().hits == 1
+
+
+def test_bypass_skips_lookup_but_refreshes_entry(use_cache):
+    cache = use_cache(LlmResponseCache(InMemoryLlmCacheBackend()))
+    client = FakeLiteLLMClient()
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=client)
+
+    generate(model, make_request("hello"))
+    with llm_cache_bypass():
+        assert text(generate(model, make_request("hello"))) == "reply 2"
+    assert text(generate(model, make_request("hello"))) == "reply 2"
+    assert client.calls == 2
+    assert cache.stats().bypassed == 1
+
+
+def test_no_cache_configured_or_opted_out(use_cache):
+    client = FakeLiteLLMClient()
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=client)
+    generate(model, make_request("hello"))
+    generate(model, make_request("hello"))
+    assert client.calls == 2
+
+    use_cache(LlmResponseCache(InMemoryLlmCacheBackend()))
+    model.use_response_cache = False
+    generate(model, make_request("hello"))
+    assert client.calls == 3
+    assert llm_cache.get_default_response_cache().stats().misses == 0
+
+
+def test_in_memory_backend_evicts_least_recently_used(use_cache):
+    backend = InMemoryLlmCacheBackend(max_entries=2)
+    use_cache(LlmResponseCache(backend))
+    client = FakeLiteLLMClient()
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=client)
+
+    for prompt in ("a", "b", "a", "c", "a", "b"):
+        generate(model, make_request(prompt))
+    # "b" was evicted by "c" while "a" stayed warm
+    assert client.calls == 4
+
+
+def test_backends_keep_the_hit_audit_of_stored_entries(backend):
+    hit_at = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    backend.put(
+        CachedLlmResponse(
+            key="k",
+            model=MODEL,
+            prompt_hash="p",
+            request_json="{}",
+            responses=[],
+            created_at=hit_at - timedelta(days=1),
+            hit_count=3,
+            last_hit_at=hit_at,
+        )
+    )
+
+    entry = backend.get("k")
+    assert (entry.hit_count, entry.last_hit_at) == (3, hit_at)
+
+
+def test_stats_report_the_hit_rate(use_cache):
+    cache = use_cache(LlmResponseCache(InMemoryLlmCacheBackend()))
+    model = CustomLiteLlm(model=MODEL, stream=False, llm_client=FakeLiteLLMClient())
+
+    generate(model, make_request("a"))
+    generate(model, make_request("a"))
+    assert cache.stats().model_dump()["hit_rate"] == 0.5
@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import pytest
+from app.exgent.agent_utils import CustomLiteLlm
+from app.exgent.fake_llm import FakeLiteLLMClient
+from app.exgent.llm_scheduler import (
+    LlmQueueTimeout,
+    LlmScheduler,
+    ModelLimits,
+    Priority,
+    llm_deadline,
+    llm_priority,
+    set_default_scheduler,
+)
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+from litellm.exceptions import RateLimitError
+
+MODEL = "gemini/gemini-2.5-flash"
+
+
+@pytest.fixture
+def use_scheduler():
+    def install(scheduler):
+        set_default_scheduler(scheduler)
+        return scheduler
+
+    yield install
+    set_default_scheduler(None)
+
+
+def make_request(text: str) -> LlmRequest:
+    return LlmRequest(
+        model=MODEL,
+        contents=[types.Content(role="user", parts=[types.Part(text=text)])],
+    )
+
+
+async def generate(model: CustomLiteLlm, text: str, stream: bool = False) -> str:
+    responses = [
+        r async for r in model.generate_content_async(make_request(text), stream=stream)
+    ]
+    return responses[-1].content.parts[0].text
+
+
+def test_concurrent_calls_are_capped_per_model(use_scheduler):
+    scheduler = use_scheduler(LlmScheduler(ModelLimits(max_concurrency=2)))
+    client = FakeLiteLLMClient(latency=0.02)
+    model = CustomLiteLlm(model=MODEL, llm_client=client)
+
+    async def run():
+        return await asyncio.gather(*(generate(model, f"q{i}") for i in range(6)))
+
+    replies = asyncio.run(run())
+
+    assert replies == [f"{MODEL}: q{i}" for i in range(6)]
+    assert client.max_running == 2
+    (stats,) = scheduler.stats()
+    assert stats.granted == 6 and stats.active == 0 and stats.queued == 0
+
+
+def test_interactive_calls_go_ahead_of_background_calls():
+    scheduler = LlmScheduler(ModelLimits(max_concurrency=1))
+    order = []
+
+    async def call(name: str, priority: Priority):
+        with llm_priority(priority):
+            async with scheduler.slot(MODEL, 1):
+                order.append(name)
+
+    async def run():
+        async with scheduler.slot(MODEL, 1):
+            tasks = [
+                asyncio.create_task(call("background 1", Priority.BACKGROUND)),
+                asyncio.create_task(call("background 2", Priority.BACKGROUND)),
+                asyncio.create_task(call("chat", Priority.INTERACTIVE)),
+            ]
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["chat", "background 1", "background 2"]
+
+
+def test_calls_not_started_before_their_deadline_time_out():
+    scheduler = LlmScheduler(ModelLimits(max_concurrency=1))
+
+    async def run():
+        async with scheduler.slot(MODEL, 1):
+            with llm_deadline(0.01), pytest.raises(LlmQueueTimeout):
+                async with scheduler.slot(MODEL, 1):
+                    pass
+        # The timed out waiter does not hold the slot
+        async with scheduler.slot(MODEL, 1):
+            pass
+
+    asyncio.run(run())
+    (stats,) = scheduler.stats()
+    assert stats.timed_out == 1 and stats.granted == 2 and stats.active == 0
+
+
+def test_cancelled_waiters_give_up_their_place():
+    scheduler = LlmScheduler(ModelLimits(max_concurrency=1))
+
+    async def run():
+        async with scheduler.slot(MODEL, 1):
+            waiter = asyncio.create_task(scheduler.slot(MODEL, 1).__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        async with scheduler.slot(MODEL, 1):
+            pass
+
+    asyncio.run(run())
+    assert scheduler.stats()[0].active == 0
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_rate_limited_calls_are_retried(use_scheduler, stream):
+    scheduler = use_scheduler(LlmScheduler(ModelLimits(), backoff_base_seconds=0.001))
+    client = FakeLiteLLMClient(rate_limit_failures=2)
+    model = CustomLiteLlm(model=MODEL, llm_client=client)
+
+    reply = asyncio.run(generate(model, "hello", stream=stream))
+
+    assert reply == f"{MODEL}: hello"
+    assert len(client.calls) == 3
+    (stats,) = scheduler.stats()
+    assert stats.rate_limited == 2 and stats.retries == 2
+
+
+def test_rate_limit_errors_surface_after_max_retries(use_scheduler):
+    use_scheduler(
+        LlmScheduler(ModelLimits(), max_retries=1, backoff_base_seconds=0.001)
+    )
+    client = FakeLiteLLMClient(rate_limit_failures=5)
+    model = CustomLiteLlm(model=MODEL, llm_client=client)
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(generate(model, "hello"))
+    assert len(client.calls) == 2
+
+
+def test_token_budget_delays_calls_until_refilled():
+    # 600 tokens a minute refill at 10 tokens a second
+    scheduler = LlmScheduler(ModelLimits(max_concurrency=4, tokens_per_minute=600))
+
+    async def run():
+        async with scheduler.slot(MODEL, 600):
+            pass
+        start = time.monotonic()
+        async with scheduler.slot(MODEL, 2):
+            pass
+        return time.monotonic() - start
+
+    waited = asyncio.run(run())
+    assert 0.15 <= waited < 1.0
+
+
+def test_unused_estimate_is_returned_to_the_budget():
+    scheduler = LlmScheduler(ModelLimits(tokens_per_minute=600))
+
+    async def run():
+        async with scheduler.slot(MODEL, 600) as lease:
+            lease.used_tokens = 10
+        start = time.monotonic()
+        async with scheduler.slot(MODEL, 500):
+            pass
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
@@ -216,3 +216,198 @@ def test_update_extract(client, sample_xlsx_path):
     assert sheet_info_payload == payload
     assert data["file_id"] == file_id
     assert data["sheet_idx"] == 0
+
+
+def upload_sample(client, sample_xlsx_path) -> str:
+    with open(sample_xlsx_path, "rb") as f:
+        upload_resp = client.post(
+            "/upload",
+            files={
+                "file": (
+                    "sample.xlsx",
+                    f,
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                )
+            },
+        )
+    return upload_resp.json()["file_id"]
+
+
+def test_upload_records_content_hash(client, sample_xlsx_path):
+    import hashlib
+
+    file_id = upload_sample(client, sample_xlsx_path)
+    data = client.get(f"/files/{file_id}").json()
+    with open(sample_xlsx_path, "rb") as f:
+        assert data["content_hash"] == hashlib.sha256(f.read()).hexdigest()
+
+
+def test_sheet_data_conditional_get(client, sample_xlsx_path):
+    file_id = upload_sample(client, sample_xlsx_path)
+
+    response = client.get(f"/sheetdata/{file_id}/0")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert "immutable" in response.headers["cache-control"]
+
+    cached = client.get(f"/sheetdata/{file_id}/0", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    other_sheet = client.get(f"/sheetdata/{file_id}/1", headers={"If-None-Match": etag})
+    assert other_sheet.status_code == 200
+
+
+def test_file_details_etag_tracks_sheet_info_versions(
+    client, sample_xlsx_path, test_file_extract_store
+):
+    file_id = upload_sample(client, sample_xlsx_path)
+
+    response = client.get(f"/filedetails/{file_id}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    cached = client.get(f"/filedetails/{file_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    test_file_extract_store.add_sheet_info("user_one", file_id, 2, "blank_detection")
+
+    refreshed = client.get(f"/filedetails/{file_id}", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+    assert refreshed.json()["sheets"][2]["version"] == 1
+
+
+def test_sheet_info_conditional_get(client, test_file_extract_store):
+    response = client.get("/sheetinfo/file_abc/0")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    assert (
+        client.get("/sheetinfo/file_abc/0", headers={"If-None-Match": etag}).status_code
+        == 304
+    )
+
+    test_file_extract_store.add_sheet_info("user_one", "file_abc", 0, "sheet1")
+
+    response = client.get("/sheetinfo/file_abc/0", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["version"] == 1
+
+
+def test_sheet_info_etag_matches_the_served_version(
+    client, test_file_extract_store, monkeypatch
+):
+    test_file_extract_store.add_sheet_info("user_one", "file_abc", 0, "sheet1")
+    current = client.get("/sheetinfo/file_abc/0").headers["etag"]
+
+    # A write lands between the version check and the read of the body
+    monkeypatch.setattr(test_file_extract_store, "get_latest_versions", lambda *a: {})
+    response = client.get("/sheetinfo/file_abc/0")
+    assert response.json()["version"] == 1
+    assert response.headers["etag"] == current
+
+
+def test_etags_are_weak_across_content_encodings(client, sample_xlsx_path):
+    file_id = upload_sample(client, sample_xlsx_path)
+
+    identity = client.get(
+        f"/filedetails/{file_id}", headers={"Accept-Encoding": "identity"}
+    )
+    gzipped = client.get(f"/filedetails/{file_id}", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert identity.headers["etag"].startswith("W/")
+    assert gzipped.headers["etag"] == identity.headers["etag"]
+
+    # Weak comparison: the opaque tag alone still matches
+    strong = identity.headers["etag"].removeprefix("W/")
+    cached = client.get(f"/filedetails/{file_id}", headers={"If-None-Match": strong})
+    assert cached.status_code == 304
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_sheet_payloads_are_compressed(client, sample_xlsx_path, encoding):
+    if encoding == "br":
+        pytest.importorskip("brotli")
+    file_id = upload_sample(client, sample_xlsx_path)
+
+    response = client.get(
+        f"/filedetails/{file_id}", headers={"Accept-Encoding": encoding}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == encoding
+    assert int(response.headers["content-length"]) < len(response.content)
+    FileDetailResponse.model_validate(response.json())
+
+    # Small responses are left alone
+    small = client.get("/", headers={"Accept-Encoding": encoding})
+    assert "content-encoding" not in small.headers
+
+
+def test_malformed_accept_encoding_is_not_an_error(client, sample_xlsx_path):
+    file_id = upload_sample(client, sample_xlsx_path)
+
+    response = client.get(
+        f"/filedetails/{file_id}", headers={"Accept-Encoding": "gzip;q=high"}
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.parametrize(
+    "media_type,module",
+    [
+        ("application/vnd.exgent.sheet+msgpack", "msgpack"),
+        ("application/vnd.apache.arrow.stream", "pyarrow"),
+    ],
+)
+def test_sheet_data_binary_formats(client, sample_xlsx_path, media_type, module):
+    pytest.importorskip(module)
+    from app.server.binary_encoding import (
+        decode_sheet_data_arrow,
+        decode_sheet_data_msgpack,
+    )
+
+    file_id = upload_sample(client, sample_xlsx_path)
+    as_json = client.get(f"/sheetdata/{file_id}/0")
+
+    response = client.get(f"/sheetdata/{file_id}/0", headers={"Accept": media_type})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    assert response.headers["etag"] != as_json.headers["etag"]
+    assert "Accept" in response.headers["vary"]
+
+    decode = (
+        decode_sheet_data_msgpack if module == "msgpack" else decode_sheet_data_arrow
+    )
+    assert decode(response.content).data == as_json.json()["data"]
+    if module == "msgpack":
+        assert len(response.content) < len(as_json.content)
+
+
+def test_file_details_msgpack(client, sample_xlsx_path):
+    pytest.importorskip("msgpack")
+    from app.server.binary_encoding import decode_file_details_msgpack
+
+    file_id = upload_sample(client, sample_xlsx_path)
+    as_json = FileDetailResponse.model_validate(
+        client.get(f"/filedetails/{file_id}").json()
+    )
+
+    response = client.get(
+        f"/filedetails/{file_id}",
+        headers={
+            "Accept": "application/vnd.exgent.sheet+msgpack, application/json;q=0.5"
+        },
+    )
+    assert response.headers["content-type"] == "application/vnd.exgent.sheet+msgpack"
+    assert decode_file_details_msgpack(response.content) == as_json
+
+    # Arrow is not offered for the multi-sheet response
+    response = client.get(
+        f"/filedetails/{file_id}",
+        headers={"Accept": "application/vnd.apache.arrow.stream"},
+    )
+    assert response.headers["content-type"] == "application/json"
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from app.file_store.file_store import FileStore, LocalFileStoreBackend
+from app.server import server
+from app.server.executors import ServerExecutors
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+
+SLOW_PARSE_SECONDS = 0.5
+
+
+@pytest.fixture
+def stores(tmp_path):
+    file_store = FileStore(
+        db_url=f"sqlite:///{tmp_path / 'fs.db'}",
+        backend=LocalFileStoreBackend(base_path=str(tmp_path / "files")),
+    )
+    sheet_info_store = SheetInfoStore(db_url=f"sqlite:///{tmp_path / 'si.db'}")
+    return file_store, sheet_info_store
+
+
+@pytest.fixture
+def pool():
+    executors = ServerExecutors(io_workers=8, parse_workers=2)
+    yield executors
+    executors.shutdown()
+
+
+@pytest.fixture
+def slow_parse(monkeypatch):
+    real_get_sheet_data = server.get_sheet_data
+
+    def get_sheet_data(content, sheet_idx):
+        time.sleep(SLOW_PARSE_SECONDS)
+        return real_get_sheet_data(content, sheet_idx)
+
+    monkeypatch.setattr(server, "get_sheet_data", get_sheet_data)
+
+
+@pytest.fixture
+def override_dependencies(stores, pool):
+    file_store, sheet_info_store = stores
+    server.app.dependency_overrides[server.get_file_store] = lambda: file_store
+    server.app.dependency_overrides[server.get_sheet_info_store] = lambda: (
+        sheet_info_store
+    )
+    server.app.dependency_overrides[server.get_executors] = lambda: pool
+    yield
+    server.app.dependency_overrides.clear()
+
+
+def test_slow_parses_do_not_starve_metadata_calls(
+    stores, override_dependencies, slow_parse
+):
+    file_store, _ = stores
+    sample = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+    file_id = file_store.create_file(
+        "user_one", "sample.xlsx", sample.read_bytes()
+    ).file_id
+
+    async def timed_get(client: httpx.AsyncClient, url: str) -> float:
+        start = time.perf_counter()
+        response = await client.get(url)
+        assert response.status_code == 200
+        return time.perf_counter() - start
+
+    async def run() -> tuple[list[float], list[float]]:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            # 6 slow parses on a 2 thread parse pool take ~3 parse rounds
+            parses = [
+                asyncio.create_task(timed_get(client, f"/sheetdata/{file_id}/0"))
+                for _ in range(6)
+            ]
+            await asyncio.sleep(0.05)
+            metadata = await asyncio.gather(
+                *[timed_get(client, "/files") for _ in range(40)]
+            )
+            return await asyncio.gather(*parses), metadata
+
+    parse_latencies, metadata_latencies = asyncio.run(run())
+
+    assert max(parse_latencies) >= 3 * SLOW_PARSE_SECONDS
+    # Metadata calls are served from the io pool while the parse pool is
+    # saturated, so none of them waits for a parse to finish.
+    assert max(metadata_latencies) < SLOW_PARSE_SECONDS
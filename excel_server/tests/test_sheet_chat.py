@@ -0,0 +1,244 @@
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+from app.domain import ReportGroup, SheetData, SheetStructure, SheetTag
+from app.exgent import agent_utils
+from app.exgent.agent_utils import (
+    EXCEL_FILE_REF,
+    get_sheet_csv,
+    register_sheet_source,
+    sheet_instruction,
+)
+from app.exgent.sheet_encoding import COMPACT_SHEET_PREAMBLE
+from app.file_store.file_store import FileStore, LocalFileStoreBackend
+from app.server import server
+from app.server.executors import ServerExecutors
+from app.server.sheet_cache import SheetSource, SheetSourceCache
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+from app.sheet_info_store.write_coalescer import SheetInfoWriteCoalescer
+from fastapi.testclient import TestClient
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.agents.run_config import RunConfig
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+
+SAMPLE = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+
+
+class FakeRunner:
+    """Records run_async calls and persists state_delta like Runner does."""
+
+    def __init__(self, session_service: InMemorySessionService):
+        self.session_service = session_service
+        self.calls: list[dict] = []
+
+    async def run_async(self, *, user_id, session_id, new_message, **kwargs):
+        self.calls.append(kwargs)
+        session = await self.session_service.get_session(
+            app_name="excel_tag", user_id=user_id, session_id=session_id
+        )
+        event = Event(
+            author="user",
+            content=new_message,
+            actions=EventActions(state_delta=kwargs.get("state_delta") or {}),
+        )
+        await self.session_service.append_event(session, event)
+        yield event
+
+
+@pytest.fixture
+def chat_env(tmp_path):
+    file_store = FileStore(
+        db_url=f"sqlite:///{tmp_path / 'fs.db'}",
+        backend=LocalFileStoreBackend(base_path=str(tmp_path / "files")),
+    )
+    sheet_info_store = SheetInfoStore(db_url=f"sqlite:///{tmp_path / 'si.db'}")
+    session_service = InMemorySessionService()
+    runner = FakeRunner(session_service)
+    cache = SheetSourceCache(max_entries=4)
+    pool = ServerExecutors(io_workers=2, parse_workers=1)
+    writer = SheetInfoWriteCoalescer(window_seconds=0.0)
+
+    overrides = {
+        server.get_file_store: lambda: file_store,
+        server.get_sheet_info_store: lambda: sheet_info_store,
+        server.get_session_service: lambda: session_service,
+        server.get_runner: lambda: runner,
+        server.get_sheet_source_cache: lambda: cache,
+        server.get_executors: lambda: pool,
+        server.get_sheet_info_writer: lambda: writer,
+    }
+    server.app.dependency_overrides.update(overrides)
+    yield file_store, runner, cache
+    server.app.dependency_overrides.clear()
+    pool.shutdown()
+
+
+def test_chat_keeps_only_a_sheet_reference_in_session(chat_env, monkeypatch):
+    file_store, runner, cache = chat_env
+    file_id = file_store.create_file(
+        "user_one", "sample.xlsx", SAMPLE.read_bytes()
+    ).file_id
+
+    parses = []
+    real_convert = server.convert_excel_to_sheet_data
+
+    def convert(content, sheet_indices=None):
+        parses.append(sheet_indices)
+        return real_convert(content, sheet_indices)
+
+    monkeypatch.setattr(server, "convert_excel_to_sheet_data", convert)
+
+    client = TestClient(server.app)
+    for text in ("first", "second", "third"):
+        response = client.post(f"/sheetchat/{file_id}/0", json={"user_input": text})
+        assert response.status_code == 200
+
+    # Parsed once; the session gets a reference on the first turn only and
+    # never the CSV itself
+    assert parses == [[0]]
+    source = cache.get(
+        file_store.get_file_metadata("user_one", file_id).content_hash, 0
+    )
+    first, second, third = runner.calls
+    assert first["state_delta"] == {EXCEL_FILE_REF: source.key}
+    assert second["state_delta"] is None
+    assert third["state_delta"] is None
+    for call in runner.calls:
+        assert call["run_config"].custom_metadata["sheet_source"] is source
+
+
+def test_chat_unknown_file_is_404(chat_env):
+    client = TestClient(server.app)
+    response = client.post("/sheetchat/missing/0", json={"user_input": "hi"})
+    assert response.status_code == 404
+
+
+def test_saved_tags_are_indexed_by_label(chat_env):
+    file_store, _, _ = chat_env
+    sheet_info_store = server.app.dependency_overrides[server.get_sheet_info_store]()
+    file_id = file_store.create_file(
+        "user_one", "sample.xlsx", SAMPLE.read_bytes()
+    ).file_id
+    structure = SheetStructure(
+        statement_type="Income Statement",
+        financial_items_column=2,
+        date_columns=[3],
+        groups=[ReportGroup(name="Revenue", header_rows=[5], line_items=[6], total=7)],
+    )
+    payload = {
+        "structure": structure.model_dump(),
+        "tags": [
+            SheetTag(row=6, tag="Product Revenue").model_dump(),
+            SheetTag(row=7, tag="unclear").model_dump(),
+        ],
+    }
+
+    client = TestClient(server.app)
+    response = client.post(
+        f"/sheetinfo/{file_id}/0", json={"sheet_name": "Sheet1", "payload": payload}
+    )
+    assert response.status_code == 200
+
+    tags = sheet_info_store.get_label_tags(
+        "user_one",
+        "Income Statement",
+        ["4100 - X Men Sales CA", "4100-12 - X Men Sales KS"],
+    )
+    assert tags == {"4100 - X Men Sales CA": "Product Revenue"}
+
+
+def _source(content_key: str, sheet_idx: int = 0) -> SheetSource:
+    return SheetSource(
+        content_key, sheet_idx, "Sheet1", SheetData(data=[["a", "1"], ["b", "2"]])
+    )
+
+
+def test_sheet_source_csv_is_memoized():
+    source = _source("abc")
+    assert source.csv == '"a","1"\n"b","2"\n'
+    assert source.csv is source.csv
+    assert source.key == "abc:0"
+
+
+def test_sheet_source_cache_evicts_least_recently_used():
+    cache = SheetSourceCache(max_entries=2)
+    cache.put(_source("a"))
+    cache.put(_source("b"))
+    assert cache.get("a", 0) is not None
+    cache.put(_source("c"))
+
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) is not None
+    assert cache.get("c", 0) is not None
+
+
+def test_sheet_source_cache_keeps_first_put():
+    cache = SheetSourceCache()
+    first = cache.put(_source("a"))
+    assert cache.put(_source("a")) is first
+    assert cache.get("a", 1) is None
+
+
+def _invocation_context(state: dict, custom_metadata: dict) -> InvocationContext:
+    from app.exgent.agent import qa_agent
+
+    return InvocationContext(
+        session_service=InMemorySessionService(),
+        invocation_id="inv",
+        agent=qa_agent,
+        session=Session(id="s", app_name="excel_tag", user_id="u", state=state),
+        run_config=RunConfig(custom_metadata=custom_metadata),
+    )
+
+
+def test_sheet_instruction_renders_sheet_from_source():
+    source = _source("abc")
+    source.sheet_data.data[1][1] = "{not_state}"
+    register_sheet_source(source)
+    ctx = _invocation_context({"name": "Ann", EXCEL_FILE_REF: source.key}, {})
+
+    provider = sheet_instruction("Hi {name}.\n{excel_file_data}\nBye {name}.")
+    rendered = asyncio.run(provider(ReadonlyContext(ctx)))
+
+    assert rendered == (
+        f"Hi Ann.\n{COMPACT_SHEET_PREAMBLE}\n1 @1: {{not_state}}\nBye Ann."
+    )
+
+
+def test_sheet_instruction_can_render_csv(monkeypatch):
+    monkeypatch.setattr(agent_utils, "SHEET_PROMPT_FORMAT", "csv")
+    source = _source("abc")
+    source.sheet_data.data[0][0] = "{not_state}"
+    register_sheet_source(source)
+    ctx = _invocation_context({"name": "Ann", EXCEL_FILE_REF: source.key}, {})
+
+    provider = sheet_instruction("Hi {name}.\n{excel_file_data}\nBye {name}.")
+    rendered = asyncio.run(provider(ReadonlyContext(ctx)))
+
+    assert rendered == 'Hi Ann.\n"{not_state}","1"\n"b","2"\n\nBye Ann.'
+
+
+def test_sheet_instruction_falls_back_to_legacy_state(monkeypatch):
+    monkeypatch.setattr(agent_utils, "SHEET_PROMPT_FORMAT", "csv")
+    ctx = _invocation_context({"excel_file_data": "a,b\n"}, {})
+    provider = sheet_instruction("Sheet:\n{excel_file_data}")
+
+    assert asyncio.run(provider(ReadonlyContext(ctx))) == "Sheet:\na,b\n"
+
+    unregistered = _invocation_context({EXCEL_FILE_REF: "gone:0"}, {})
+    with pytest.raises(ValueError):
+        asyncio.run(provider(ReadonlyContext(unregistered)))
+
+
+def test_get_sheet_csv_falls_back_to_legacy_state():
+    ctx = _invocation_context({"excel_file_data": "a,b\n"}, {"file_id": "f"})
+    assert get_sheet_csv(ctx) == "a,b\n"
+
+    with pytest.raises(ValueError):
+        get_sheet_csv(_invocation_context({}, {"file_id": "f"}))
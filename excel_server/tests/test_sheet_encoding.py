@@ -0,0 +1,71 @@
+import os
+from pathlib import Path
+
+from app.domain import SheetData
+from app.exgent.sheet_encoding import (
+    COMPACT_SHEET_PREAMBLE,
+    compact_rows,
+    encode_sheet_compact,
+)
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.tag_groups_utils import estimate_tokens
+from app.server.excel_utils import get_sheet_data, list_to_csv_string
+
+SAMPLE = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+
+
+def _frame(rows: list[list[str]]) -> SheetFrame:
+    return SheetFrame.from_sheet_data(SheetData(data=rows))
+
+
+def test_compact_rows_drop_empty_cells_and_keep_positions():
+    frame = _frame(
+        [
+            [" ", "A", "B", "C", "D", "E"],
+            ["1", "", "Income", "", "", ""],
+            ["2", "", "", "", "", ""],
+            ["3", "", "", "2023-01-01 00:00:00", "", "2023-03-01 00:00:00"],
+            ["4", "", "  Sales | CA\n", "100.0", "", "-2.5"],
+        ]
+    )
+    assert compact_rows(frame) == [
+        "1 @2: Income",
+        "3 @3: 2023-01-01||2023-03-01",
+        "4 @2:   Sales / CA|100||-2.5",
+    ]
+
+
+def test_encode_sheet_compact_is_smaller_than_csv():
+    sheet_data = get_sheet_data(SAMPLE.read_bytes(), 0)
+    text = encode_sheet_compact(SheetFrame.from_sheet_data(sheet_data))
+
+    assert text.startswith(COMPACT_SHEET_PREAMBLE)
+    assert len(text) < len(list_to_csv_string(sheet_data.data))
+
+
+def test_encode_sheet_compact_truncates_to_token_budget():
+    rows = [[" ", "A", "B"]] + [
+        [str(r), f"Item {r}", str(r * 10)] for r in range(1, 201)
+    ]
+    frame = _frame(rows)
+
+    assert encode_sheet_compact(frame, token_budget=100_000) == encode_sheet_compact(
+        frame
+    )
+
+    text = encode_sheet_compact(frame, token_budget=200)
+    assert estimate_tokens(text) <= 200
+    lines = text.splitlines()
+    assert lines[1] == "1 @1: Item 1|10"
+    kept = len(lines) - 2
+    assert lines[-1] == (
+        f"[truncated: {200 - kept} more non-empty rows ({kept + 1}-200) of 200 "
+        "were left out to fit the token budget]"
+    )
+
+
+def test_encode_sheet_compact_of_an_empty_sheet_over_budget():
+    assert encode_sheet_compact(_frame([]), 10) == COMPACT_SHEET_PREAMBLE
+    assert encode_sheet_compact(_frame([[" ", "A"], ["1", ""]]), 10) == (
+        COMPACT_SHEET_PREAMBLE
+    )
@@ -0,0 +1,73 @@
+import io
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from app.domain import SheetData
+from app.exgent.sheet_frame import SheetFrame, parse_number, parse_numbers
+from app.server.excel_utils import get_sheet_data, list_to_csv_string
+from app.server.sheet_cache import SheetSource
+
+SAMPLE = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("1234", 1234.0),
+        ("1,234.50", 1234.5),
+        ("$1,234", 1234.0),
+        ("(1,234)", -1234.0),
+        ("($ 12.5)", -12.5),
+        ("-7", -7.0),
+        ("1e3", 1000.0),
+    ],
+)
+def test_parse_number(value, expected):
+    assert parse_number(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "  ", "Revenue", "A", "12/31/2024"])
+def test_parse_number_non_numeric_is_nan(value):
+    assert math.isnan(parse_number(value))
+
+
+def test_parse_numbers_matches_parse_number():
+    cells = [
+        ["1234", "1,234.50", "$1,234", "(1,234)", "($ 12.5)", "-7", "1e3"],
+        ["", " ", "Revenue", "12/31/2024", "-(5)", "(5", "  42  "],
+    ]
+    expected = [[parse_number(cell) for cell in row] for row in cells]
+    np.testing.assert_array_equal(
+        parse_numbers(np.array(cells, dtype=object)), expected
+    )
+
+
+def test_from_sheet_data_pads_ragged_rows():
+    frame = SheetFrame.from_sheet_data(
+        SheetData(data=[[" ", "A", "B"], ["1", "Cash"], ["2", "AR", "(5)"]])
+    )
+    assert frame.shape == (3, 3)
+    assert frame.labels[1].tolist() == ["1", "Cash", ""]
+    np.testing.assert_array_equal(
+        frame.values,
+        [[np.nan, np.nan, np.nan], [1.0, np.nan, np.nan], [2.0, np.nan, -5.0]],
+    )
+
+
+def test_to_dataframe_matches_read_csv_of_sheet():
+    sheet_data = get_sheet_data(SAMPLE.read_bytes(), 0)
+    expected = pd.read_csv(
+        io.StringIO(list_to_csv_string(sheet_data.data)), header=None, dtype=str
+    )
+    frame = SheetFrame.from_sheet_data(sheet_data)
+    pd.testing.assert_frame_equal(frame.to_dataframe(), expected, check_dtype=False)
+
+
+def test_sheet_source_frame_is_shared():
+    source = SheetSource("abc", 0, "Sheet1", SheetData(data=[["1", "2"]]))
+    assert source.frame is source.frame
+    assert source.frame.values.tolist() == [[1.0, 2.0]]
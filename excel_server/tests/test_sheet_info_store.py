@@ -2,7 +2,7 @@ import shutil
 from pathlib import Path
 
 import pytest
-from app.domain import SheetInfoPayload, SheetStructure
+from app.domain import SheetInfoPayload, SheetStructure, SheetTag
 from app.sheet_info_store.sheet_info_store import SheetInfoStore
 
 
@@ -161,3 +161,57 @@ def test_get_latest_no_results(sheet_info_store):
 
     latest = sheet_info_store.get_latest(user_id, file_id, sheet_idx)
     assert latest is None
+
+
+def test_label_tags_are_normalized_and_latest_wins(sheet_info_store):
+    written = sheet_info_store.record_label_tags(
+        "user1",
+        "file1",
+        "Income Statement",
+        [
+            ("Total  Revenue:", "Revenue"),
+            ("Rent", "unclear"),
+            ("", "Other"),
+            ("Payroll", "Salaries"),
+        ],
+    )
+    assert written == 2
+    sheet_info_store.record_label_tags(
+        "user1", "file2", "income statement", [("payroll", "Compensation")]
+    )
+
+    tags = sheet_info_store.get_label_tags(
+        "user1", "Income Statement", ["total revenue", "PAYROLL", "Rent", "Other"]
+    )
+    assert tags == {"total revenue": "Revenue", "PAYROLL": "Compensation"}
+
+
+def test_label_tags_are_scoped_by_user_and_statement(sheet_info_store):
+    sheet_info_store.record_label_tags(
+        "user1", "file1", "Income Statement", [("Payroll", "Salaries")]
+    )
+    assert (
+        sheet_info_store.get_label_tags("user2", "Income Statement", ["Payroll"]) == {}
+    )
+    assert sheet_info_store.get_label_tags("user1", "Balance Sheet", ["Payroll"]) == {}
+
+
+def test_get_latest_tagged_skips_untagged_versions(sheet_info_store):
+    structure = SheetStructure(
+        statement_type="Income Statement",
+        financial_items_column=1,
+        date_columns=[2],
+        groups=[],
+    )
+    assert sheet_info_store.get_latest_tagged("user1", "file1", 0) is None
+
+    tagged = SheetInfoPayload(structure=structure, tags=[SheetTag(row=1, tag="Sales")])
+    sheet_info_store.add_sheet_info("user1", "file1", 0, "s", tagged)
+    sheet_info_store.add_sheet_info(
+        "user1", "file1", 0, "s", SheetInfoPayload(structure=structure, tags=[])
+    )
+    sheet_info_store.add_sheet_info("user1", "file1", 0, "s", None)
+
+    latest_tagged = sheet_info_store.get_latest_tagged("user1", "file1", 0)
+    assert latest_tagged.version == 1
+    assert latest_tagged.payload.tags == [SheetTag(row=1, tag="Sales")]
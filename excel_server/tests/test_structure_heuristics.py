@@ -0,0 +1,179 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import AsyncGenerator
+
+import pytest
+from app.domain import ReportGroup, SheetData
+from app.exgent.heuristic_structure_agent import (
+    SHEET_STRUCTURE_DETECTED,
+    SHEET_STRUCTURE_HINT,
+    SHEET_STRUCTURE_HUMAN_READABLE,
+    HeuristicStructureAgent,
+    skip_when_structure_detected,
+)
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.structure_heuristics import coverage, detect_sheet_structure
+from app.exgent.structure_parser import parse_sheet_structure_markdown
+from app.server.excel_utils import get_sheet_data
+from app.server.sheet_cache import SheetSource
+from google.adk.agents.llm_agent import LlmAgent
+from google.adk.agents.run_config import RunConfig
+from google.adk.agents.sequential_agent import SequentialAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.genai.types import Content, Part
+
+SAMPLE = Path(os.path.dirname(os.path.abspath(__file__))) / "sample.xlsx"
+
+# (indented label, value for each of two months)
+STATEMENT = [
+    ("Income Statement", None),
+    ("  Revenue", None),
+    ("    Product sales", (100, 110)),
+    ("    Service sales", (50, 40)),
+    ("  Total Revenue", (150, 150)),
+    ("  Operating Expenses", None),
+    ("    Payroll", None),
+    ("      Salaries", (30, 30)),
+    ("      Bonuses", (10, 0)),
+    ("    Total Payroll", (40, 30)),
+    ("    Rent", (10, 10)),
+    ("    Unused account", None),
+    ("  Total Operating Expenses", (50, 40)),
+]
+
+
+def _sheet(statement=STATEMENT) -> SheetData:
+    data = [[" ", "A", "B", "C"]]
+    for row, (label, values) in enumerate(statement, start=1):
+        values = values or ("", "")
+        data.append([str(row), label, *(f"{v:,}" if v != "" else "" for v in values)])
+    return SheetData(data=data)
+
+
+def test_detects_nested_groups():
+    frame = SheetFrame.from_sheet_data(_sheet())
+    structure = detect_sheet_structure(frame)
+
+    assert structure.statement_type == "Income Statement"
+    assert structure.financial_items_column == 1
+    assert structure.date_columns == [2, 3]
+    assert structure.groups == [
+        ReportGroup(name="Revenue", header_rows=[2], line_items=[3, 4], total=5),
+        ReportGroup(name="Payroll", header_rows=[7], line_items=[8, 9], total=10),
+        ReportGroup(
+            name="Operating Expenses",
+            header_rows=[6],
+            line_items=[10, 11, 12],
+            total=13,
+        ),
+    ]
+    assert coverage(frame, structure) == 1.0
+
+
+def test_no_structure_without_numbers():
+    frame = SheetFrame.from_sheet_data(
+        SheetData(data=[[" ", "A"], ["1", "Notes"], ["2", "More notes"]])
+    )
+    assert detect_sheet_structure(frame) is None
+
+
+def _run_agent(sheet: SheetData, **kwargs) -> dict:
+    """Runs the heuristic agent ahead of a generate step that must not call a model
+    when the structure is detected, and returns the final session state."""
+
+    class RecordingLlm(BaseLlm):
+        calls: list = []
+
+        async def generate_content_async(
+            self, llm_request: LlmRequest, stream: bool = False
+        ) -> AsyncGenerator[LlmResponse, None]:
+            self.calls.append(llm_request)
+            yield LlmResponse(
+                content=Content(parts=[Part(text="from the model")], role="model")
+            )
+
+    model = RecordingLlm(model="recording")
+    generate = LlmAgent(
+        name="generate",
+        model=model,
+        instruction="{sheet_structure_hint?}",
+        output_key=SHEET_STRUCTURE_HUMAN_READABLE,
+        include_contents="none",
+        before_agent_callback=skip_when_structure_detected,
+    )
+    root = SequentialAgent(
+        name="root", sub_agents=[HeuristicStructureAgent(**kwargs), generate]
+    )
+    session_service = InMemorySessionService()
+    runner = Runner(app_name="test", agent=root, session_service=session_service)
+
+    async def run() -> dict:
+        session = await session_service.create_session(app_name="test", user_id="u")
+        async for _ in runner.run_async(
+            user_id="u",
+            session_id=session.id,
+            new_message=Content(parts=[Part(text="tag")], role="user"),
+            run_config=RunConfig(
+                custom_metadata={
+                    "sheet_source": SheetSource("hash", 0, "Sheet1", sheet)
+                }
+            ),
+        ):
+            pass
+        session = await session_service.get_session(
+            app_name="test", user_id="u", session_id=session.id
+        )
+        return {**session.state, "llm_calls": model.calls}
+
+    return asyncio.run(run())
+
+
+def test_detected_structure_skips_the_model():
+    state = _run_agent(_sheet())
+
+    assert state[SHEET_STRUCTURE_DETECTED] is True
+    assert state["llm_calls"] == []
+    structure = parse_sheet_structure_markdown(state[SHEET_STRUCTURE_HUMAN_READABLE])
+    assert [g.total for g in structure.groups] == [5, 10, 13]
+
+
+@pytest.mark.parametrize(
+    "sheet, kwargs, reason",
+    [
+        # Payroll no longer adds up
+        (
+            _sheet(STATEMENT[:8] + [("      Bonuses", (99, 0))] + STATEMENT[9:]),
+            {},
+            "do not add up: Payroll",
+        ),
+        (_sheet(), {"min_coverage": 1.5}, "cover only 100%"),
+    ],
+)
+def test_candidate_is_passed_to_the_model_as_hint(sheet, kwargs, reason):
+    state = _run_agent(sheet, **kwargs)
+
+    assert state[SHEET_STRUCTURE_DETECTED] is False
+    assert reason in state[SHEET_STRUCTURE_HINT]
+    (request,) = state["llm_calls"]
+    assert "**Group Name:** Revenue" in request.config.system_instruction
+    assert state[SHEET_STRUCTURE_HUMAN_READABLE] == "from the model"
+
+
+def test_partly_understood_sheet_goes_to_the_model():
+    state = _run_agent(get_sheet_data(SAMPLE.read_bytes(), 0))
+
+    assert state[SHEET_STRUCTURE_DETECTED] is False
+    assert "cover only" in state[SHEET_STRUCTURE_HINT]
+    assert len(state["llm_calls"]) == 1
+
+
+def test_disabled_heuristics_leave_no_hint():
+    state = _run_agent(_sheet(), enabled=False)
+
+    assert state[SHEET_STRUCTURE_HINT] == ""
+    assert len(state["llm_calls"]) == 1
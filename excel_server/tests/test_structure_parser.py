@@ -0,0 +1,161 @@
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+from app.domain import ReportGroup, SheetData, SheetStructure
+from app.exgent.parse_sheet_structure_agent import ParseSheetStructureAgent
+from app.exgent.structure_parser import (
+    StructureParseError,
+    format_sheet_structure_markdown,
+    parse_sheet_structure_markdown,
+)
+from app.server.sheet_cache import SheetSource
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import RunConfig
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+
+REPLY = """
+My task is to **Identify the structure of the excel file**.
+
+1. **Statement Type:** Income Statement
+2. **Financial Items Column:** 2
+   **Date Columns:** 3, 4-6
+
+### Groups
+
+*   **Group Name:** Revenue - X Men
+    *   **Header Rows:** 5
+    *   **Line Items:** 6, 7, 8 (4100-14 - X Men Sales NJ)
+    *   **Total Row:** 9 (Total Revenue - X Men)
+*   **Group Name:** Other Income
+    *   **Header Rows:** None
+    *   **Line Items:** 11 to 13
+    *   **Total Row:** Row 14 - Total Other Income
+"""
+
+EXPECTED = SheetStructure(
+    statement_type="Income Statement",
+    financial_items_column=2,
+    date_columns=[3, 4, 5, 6],
+    groups=[
+        ReportGroup(
+            name="Revenue - X Men", header_rows=[5], line_items=[6, 7, 8], total=9
+        ),
+        ReportGroup(
+            name="Other Income", header_rows=[], line_items=[11, 12, 13], total=14
+        ),
+    ],
+)
+
+
+def test_parse_markdown_reply():
+    assert parse_sheet_structure_markdown(REPLY) == EXPECTED
+
+
+def test_parse_headings_and_column_letters():
+    reply = """
+## Statement Type
+Balance Sheet
+
+**Financial Items Column:** B
+**Date Columns:** C-E
+
+**Group 1: Cash**
+- Header Rows: 2
+- Line Items: 3, 4
+- Total Row: 5
+"""
+    structure = parse_sheet_structure_markdown(reply)
+    assert structure.statement_type == "Balance Sheet"
+    assert structure.financial_items_column == 2
+    assert structure.date_columns == [3, 4, 5]
+    assert structure.groups == [
+        ReportGroup(name="Cash", header_rows=[2], line_items=[3, 4], total=5)
+    ]
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        "Here is the structure in prose, without the expected fields.",
+        REPLY.replace("**Date Columns:** 3, 4-6", ""),
+        REPLY.replace("*   **Total Row:** 9 (Total Revenue - X Men)", ""),
+        REPLY.replace("6, 7, 8", "6, 7, 800"),
+    ],
+)
+def test_parse_rejects_replies_off_the_layout(reply):
+    with pytest.raises(StructureParseError):
+        parse_sheet_structure_markdown(reply, n_rows=20, n_cols=10)
+
+
+class FakeExtractionAgent(BaseAgent):
+    """Stands in for structured_response_agent."""
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        yield Event(
+            author=self.name,
+            actions=EventActions(
+                state_delta={"sheet_structure_json": EXPECTED.model_dump()}
+            ),
+        )
+
+
+def _run(reply: str, use_local_parser: bool = True) -> list[Event]:
+    agent = ParseSheetStructureAgent(
+        input_key="sheet_structure_human_readable",
+        output_key="sheet_structure_json",
+        fallback_agent=FakeExtractionAgent(name="fake_extraction"),
+        use_local_parser=use_local_parser,
+    )
+    rows = [[str(r)] + [""] * 9 for r in range(20)]
+    ctx = InvocationContext(
+        session_service=InMemorySessionService(),
+        invocation_id="inv",
+        agent=agent,
+        session=Session(
+            id="s",
+            app_name="excel_tag",
+            user_id="u",
+            state={"sheet_structure_human_readable": reply},
+        ),
+        run_config=RunConfig(
+            custom_metadata={
+                "sheet_source": SheetSource("hash", 0, "Sheet1", SheetData(data=rows))
+            }
+        ),
+    )
+
+    async def collect() -> list[Event]:
+        return [event async for event in agent.run_async(ctx)]
+
+    return asyncio.run(collect())
+
+
+def test_agent_parses_locally_without_llm_call():
+    (event,) = _run(REPLY)
+    assert event.author == "parse_sheet_structure_agent"
+    assert (
+        SheetStructure.model_validate(event.actions.state_delta["sheet_structure_json"])
+        == EXPECTED
+    )
+
+
+@pytest.mark.parametrize(
+    "reply, use_local_parser",
+    [("Not the expected layout", True), (REPLY, False)],
+)
+def test_agent_falls_back_to_llm_extraction(reply, use_local_parser):
+    (event,) = _run(reply, use_local_parser)
+    assert event.author == "fake_extraction"
+
+
+def test_format_round_trips_through_parser():
+    text = format_sheet_structure_markdown(EXPECTED, {9: "Total Revenue - X Men"})
+    assert "**Total Row:** 9 (Total Revenue - X Men)" in text
+    assert parse_sheet_structure_markdown(text) == EXPECTED
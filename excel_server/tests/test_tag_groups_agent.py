@@ -0,0 +1,425 @@
+import asyncio
+import csv
+import io
+from typing import AsyncGenerator
+
+import pytest
+from app.domain import (
+    ReportGroup,
+    SheetData,
+    SheetInfoPayload,
+    SheetStructure,
+    SheetTag,
+)
+from app.exgent import tag_groups_agent
+from app.exgent.tag_groups_agent import TagAllGroupsAgent
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.tag_groups_utils import (
+    generate_group_csv,
+    generate_groups_csv,
+    merge_known_tags,
+    pack_group_batches,
+    parse_tag_results,
+    split_tag_results,
+    unknown_rows_group,
+)
+from app.server.sheet_cache import SheetSource
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import RunConfig
+from google.adk.events.event import Event
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+from google.genai.types import Content, Part
+
+# Column 0 is the row number, 1 the item, 2 the value
+SHEET = [
+    ["0", "Revenue", ""],
+    ["1", "Product sales", "100"],
+    ["2", "Service sales", "50"],
+    ["3", "Total revenue", "150"],
+    ["4", "Expenses", ""],
+    ["5", "Payroll", "40"],
+    ["6", "Rent", "10"],
+    ["7", "Total expenses", "50"],
+    ["8", "Interest", "5"],
+    ["9", "Total interest", "5"],
+]
+
+GROUPS = [
+    ReportGroup(name="Revenue", header_rows=[0], line_items=[1, 2], total=3),
+    ReportGroup(name="Expenses", header_rows=[4], line_items=[5, 6], total=7),
+    ReportGroup(name="Interest", header_rows=[], line_items=[8], total=9),
+]
+
+# Later groups finish first so ordering has to come from the merge
+DELAYS = {"Total revenue": 0.15, "Total expenses": 0.05, "Total interest": 0.0}
+
+
+class FakeTagAgent(BaseAgent):
+    """Tags every non-header row of its report_group_data as `<item> tag`."""
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        stats = ctx.run_config.custom_metadata["stats"]
+        stats["running"] += 1
+        stats["max_running"] = max(stats["max_running"], stats["running"])
+        stats["requests"].append(ctx.session.state["report_group_data"])
+        # Batched requests interleave `Verifying group:` lines with the CSVs
+        rows = [
+            row
+            for row in csv.reader(io.StringIO(ctx.session.state["report_group_data"]))
+            if len(row) == 4 and row[0].isdigit()
+        ]
+        try:
+            await asyncio.sleep(max(DELAYS.get(row[2], 0.0) for row in rows))
+        finally:
+            stats["running"] -= 1
+        lines = [f"{row[0]},{row[2]} tag" for row in rows if row[1] != "header"]
+        yield Event(
+            author=self.name,
+            content=Content(parts=[Part(text="\n".join(lines))], role="model"),
+        )
+
+
+@pytest.fixture
+def fake_tag_agent(monkeypatch):
+    monkeypatch.setattr(
+        tag_groups_agent, "tag_report_group_agent", FakeTagAgent(name="fake_tagger")
+    )
+
+
+@pytest.fixture
+def sheet_info_store(tmp_path):
+    store = SheetInfoStore(db_url=f"sqlite:///{tmp_path / 'si.db'}")
+    structure = SheetStructure(
+        statement_type="Income Statement",
+        financial_items_column=1,
+        date_columns=[2],
+        groups=GROUPS,
+    )
+    store.add_sheet_info(
+        "agent", "file", 0, "Sheet1", SheetInfoPayload(structure=structure, tags=[])
+    )
+    return store
+
+
+def run_agent(agent: TagAllGroupsAgent, store: SheetInfoStore, **metadata):
+    structure = store.get_latest("agent", "file", 0).payload.structure
+    state = {"sheet_structure_json": structure.model_dump()}
+    stats = {"running": 0, "max_running": 0, "requests": []}
+    ctx = InvocationContext(
+        session_service=InMemorySessionService(),
+        invocation_id="inv",
+        agent=agent,
+        session=Session(id="s", app_name="excel_tag", user_id="u", state=state),
+        run_config=RunConfig(
+            custom_metadata={
+                "sheet_info_store": store,
+                "file_id": "file",
+                "sheet_idx": 0,
+                "sheet_name": "Sheet1",
+                "sheet_source": SheetSource("hash", 0, "Sheet1", SheetData(data=SHEET)),
+                "stats": stats,
+                **metadata,
+            }
+        ),
+    )
+
+    async def collect() -> list[Event]:
+        return [event async for event in agent.run_async(ctx)]
+
+    return asyncio.run(collect()), stats, state
+
+
+def test_groups_are_tagged_concurrently_and_merged_in_order(
+    fake_tag_agent, sheet_info_store
+):
+    agent = TagAllGroupsAgent(input_key="sheet_structure_json", max_concurrency=3)
+    events, stats, state = run_agent(agent, sheet_info_store)
+
+    assert stats["max_running"] == 3
+    assert [e.content.parts[0].text for e in events] == [
+        "**Task** - Revenue tagged.",
+        "**Task** - Expenses tagged.",
+        "**Task** - Interest tagged.",
+        "**All groups tagged***",
+    ]
+    tags = sheet_info_store.get_latest("agent", "file", 0).payload.tags
+    assert [t.row for t in tags] == [1, 2, 3, 5, 6, 7, 8, 9]
+    assert tags[0] == SheetTag(row=1, tag="Product sales tag")
+    # Group data never leaks into the caller's session state
+    assert "report_group_data" not in state
+
+
+def test_concurrency_limit_is_respected(fake_tag_agent, sheet_info_store):
+    agent = TagAllGroupsAgent(input_key="sheet_structure_json", max_concurrency=1)
+    _, stats, _ = run_agent(agent, sheet_info_store)
+    assert stats["max_running"] == 1
+
+
+def test_batched_tagging_packs_groups_and_splits_results(
+    fake_tag_agent, sheet_info_store
+):
+    unbatched, _, _ = run_agent(
+        TagAllGroupsAgent(input_key="sheet_structure_json"), sheet_info_store
+    )
+    unbatched_tags = sheet_info_store.get_latest("agent", "file", 0).payload.tags
+
+    # Not incremental, so the second run tags every group again
+    agent = TagAllGroupsAgent(
+        input_key="sheet_structure_json", batch_token_budget=80, incremental=False
+    )
+    events, stats, _ = run_agent(agent, sheet_info_store)
+
+    # Revenue + Expenses fit the budget, Interest starts a new batch
+    assert len(stats["requests"]) == 2
+    assert stats["requests"][0].startswith("Verifying group: Revenue\n")
+    assert "Verifying group: Expenses\n" in stats["requests"][0]
+    assert not stats["requests"][1].startswith("Verifying group:")
+    assert [e.content.parts[0].text for e in events] == [
+        e.content.parts[0].text for e in unbatched
+    ]
+    tags = sheet_info_store.get_latest("agent", "file", 0).payload.tags
+    assert tags == unbatched_tags
+
+
+def test_tags_are_saved_once_per_run(fake_tag_agent, sheet_info_store):
+    agent = TagAllGroupsAgent(input_key="sheet_structure_json")
+    events, _, _ = run_agent(agent, sheet_info_store)
+
+    history = sheet_info_store.get_history("agent", "file", 0)
+    assert [h.version for h in history] == [1, 2]
+    assert len(history[-1].payload.tags) == 8
+    # Every group reports progress; only the one followed by a save asks the
+    # UI to refresh
+    refresh = [
+        p.code_execution_result is not None
+        for e in events[:-1]
+        for p in e.content.parts
+    ]
+    assert refresh == [False, False, True]
+
+
+def test_tags_are_checkpointed(fake_tag_agent, sheet_info_store):
+    agent = TagAllGroupsAgent(input_key="sheet_structure_json", checkpoint_interval=2)
+    events, _, _ = run_agent(agent, sheet_info_store)
+
+    history = sheet_info_store.get_history("agent", "file", 0)
+    assert [len(h.payload.tags) for h in history] == [0, 6, 8]
+    refresh = [
+        p.code_execution_result is not None
+        for e in events[:-1]
+        for p in e.content.parts
+    ]
+    assert refresh == [False, True, True]
+
+
+def test_label_index_pretags_known_rows(fake_tag_agent, sheet_info_store):
+    # Everything in Revenue and half of Expenses was approved in another file
+    sheet_info_store.record_label_tags(
+        "u",
+        "other_file",
+        "Income Statement",
+        [
+            ("Product sales", "Sales"),
+            ("service sales", "Sales"),
+            ("Total revenue", "Revenue"),
+            ("Payroll", "Salaries"),
+        ],
+    )
+
+    events, stats, _ = run_agent(
+        TagAllGroupsAgent(input_key="sheet_structure_json", use_label_index=True),
+        sheet_info_store,
+    )
+
+    assert len(stats["requests"]) == 2
+    assert not any("Product sales" in r for r in stats["requests"])
+    expenses = next(r for r in stats["requests"] if "Rent" in r)
+    assert "Payroll" not in expenses and "Total expenses" in expenses
+    assert [e.author for e in events].count("tag_all_groups_agent") == 4
+
+    tags = sheet_info_store.get_latest("agent", "file", 0).payload.tags
+    assert [(t.row, t.tag) for t in tags] == [
+        (1, "Sales"),
+        (2, "Sales"),
+        (3, "Revenue"),
+        (5, "Salaries"),
+        (6, "Rent tag"),
+        (7, "Total expenses tag"),
+        (8, "Interest tag"),
+        (9, "Total interest tag"),
+    ]
+
+
+def test_label_index_is_off_by_default(fake_tag_agent, sheet_info_store):
+    sheet_info_store.record_label_tags(
+        "u", "other_file", "Income Statement", [("Payroll", "Salaries")]
+    )
+    _, stats, _ = run_agent(
+        TagAllGroupsAgent(input_key="sheet_structure_json"), sheet_info_store
+    )
+    assert any("Payroll" in r for r in stats["requests"])
+
+
+def _save_version(store: SheetInfoStore, groups: list[ReportGroup], tags: list):
+    structure = store.get_latest("agent", "file", 0).payload.structure
+    structure.groups = groups
+    store.add_sheet_info(
+        "agent", "file", 0, "Sheet1", SheetInfoPayload(structure=structure, tags=tags)
+    )
+
+
+def test_incremental_run_only_tags_changed_groups(fake_tag_agent, sheet_info_store):
+    agent = TagAllGroupsAgent(
+        input_key="sheet_structure_json", use_label_index=False, incremental=True
+    )
+    run_agent(agent, sheet_info_store)
+    tags = sheet_info_store.get_latest("agent", "file", 0).payload.tags
+    assert len(tags) == 8
+
+    # The analyst corrects a tag, then the structure is re-detected with a
+    # changed Expenses group (saved untagged, like ValidateSheetStructureAgent)
+    tags[0] = SheetTag(row=1, tag="Analyst tag")
+    _save_version(sheet_info_store, GROUPS, tags)
+    expenses = ReportGroup(name="Expenses", header_rows=[4], line_items=[5], total=7)
+    _save_version(sheet_info_store, [GROUPS[0], expenses, GROUPS[2]], [])
+
+    events, stats, _ = run_agent(agent, sheet_info_store)
+
+    assert len(stats["requests"]) == 1
+    assert "Payroll" in stats["requests"][0]
+    texts = [e.content.parts[0].text for e in events]
+    assert texts[:3] == [
+        "**Task** - Revenue unchanged, kept its tags.",
+        "**Task** - Expenses tagged.",
+        "**Task** - Interest unchanged, kept its tags.",
+    ]
+    tags = sheet_info_store.get_latest("agent", "file", 0).payload.tags
+    assert [(t.row, t.tag) for t in tags] == [
+        (1, "Analyst tag"),
+        (2, "Service sales tag"),
+        (3, "Total revenue tag"),
+        (5, "Payroll tag"),
+        (7, "Total expenses tag"),
+        (8, "Interest tag"),
+        (9, "Total interest tag"),
+    ]
+
+
+def test_incremental_tagging_can_be_overridden_per_run(
+    fake_tag_agent, sheet_info_store
+):
+    # Off by default: re-running asks the model for every group again
+    agent = TagAllGroupsAgent(input_key="sheet_structure_json", use_label_index=False)
+    run_agent(agent, sheet_info_store)
+    _, stats, _ = run_agent(agent, sheet_info_store)
+    assert len(stats["requests"]) == 3
+
+    agent = TagAllGroupsAgent(
+        input_key="sheet_structure_json", use_label_index=False, incremental=True
+    )
+    _, stats, _ = run_agent(agent, sheet_info_store, incremental_tagging=False)
+    assert len(stats["requests"]) == 3
+
+    agent = TagAllGroupsAgent(
+        input_key="sheet_structure_json", use_label_index=False, incremental=False
+    )
+    _, stats, _ = run_agent(agent, sheet_info_store, incremental_tagging=True)
+    assert len(stats["requests"]) == 0
+
+
+def test_unknown_rows_group_and_merge_known_tags():
+    group = GROUPS[1]
+    assert unknown_rows_group(group, {}) is group
+    assert unknown_rows_group(group, {5: "a", 6: "b", 7: "c"}) is None
+    reduced = unknown_rows_group(group, {5: "a", 7: "c"})
+    assert reduced.line_items == [6] and reduced.total == 7
+
+    merged = merge_known_tags(
+        group, [SheetTag(row=6, tag="x"), SheetTag(row=7, tag="y")], {5: "a", 7: "c"}
+    )
+    assert [(t.row, t.tag) for t in merged] == [(5, "a"), (6, "x"), (7, "c")]
+
+
+def test_pack_group_batches():
+    csvs = ["a" * 40, "b" * 40, "c" * 80, "d" * 400, "e" * 4]
+    assert pack_group_batches(csvs, 0) == [[0], [1], [2], [3], [4]]
+    assert pack_group_batches(csvs, 30) == [[0, 1], [2], [3], [4]]
+    assert pack_group_batches(csvs, 1000) == [[0, 1, 2, 3, 4]]
+
+
+def test_split_tag_results_by_row_membership():
+    tags = [SheetTag(row=r, tag="t") for r in (1, 3, 8, 9, 42)]
+    revenue, interest = split_tag_results(tags, [GROUPS[0], GROUPS[2]])
+    assert [t.row for t in revenue] == [1, 3]
+    assert [t.row for t in interest] == [8, 9]
+
+
+def test_parse_tag_results_skips_malformed_lines():
+    results = "1,Gross Revenue\n\nnot a row\nx,Tag\n 3 , Marketing, Ads \n"
+    assert parse_tag_results(results) == [
+        SheetTag(row=1, tag="Gross Revenue"),
+        SheetTag(row=3, tag="Marketing, Ads"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "items_column, date_columns", [(2, [3]), (1, [2, 3]), (9, []), (-1, [-1])]
+)
+def test_generate_groups_csv_matches_per_group_csv(items_column, date_columns):
+    sheet = [
+        [" ", "A", "B", "C"],
+        ["1", "", "Revenue", ""],
+        ["2", "", 'Sales, "net"', "1,000"],
+        ["3", "", "Other\nincome", "(5)"],
+        ["4", "", "Total", "995"],
+    ]
+    structure = SheetStructure(
+        statement_type="Income Statement",
+        financial_items_column=items_column,
+        date_columns=date_columns,
+        groups=[
+            ReportGroup(name="Revenue", header_rows=[1], line_items=[2, 3], total=4),
+            ReportGroup(name="Out of range", header_rows=[-1], line_items=[7], total=9),
+            ReportGroup(name="Empty", header_rows=[], line_items=[], total=4),
+        ],
+    )
+    frame = SheetFrame.from_sheet_data(SheetData(data=sheet))
+    df = frame.to_dataframe()
+
+    assert generate_groups_csv(structure, frame) == [
+        generate_group_csv(group, df, items_column, date_columns)
+        for group in structure.groups
+    ]
+
+
+def test_generate_groups_csv_writes_cells_as_in_the_sheet():
+    sheet = [
+        [" ", "A", "B"],
+        ["1", "Revenue", ""],
+        ["2", "Sales", "N/A"],
+        ["3", "null", "1,000.50"],
+        ["4", "Total", "1005.5"],
+    ]
+    structure = SheetStructure(
+        statement_type="Income Statement",
+        financial_items_column=1,
+        date_columns=[2],
+        groups=[
+            ReportGroup(name="Revenue", header_rows=[1], line_items=[2, 3], total=4)
+        ],
+    )
+    frame = SheetFrame.from_sheet_data(SheetData(data=sheet))
+
+    assert generate_groups_csv(structure, frame) == [
+        "row_number,row_type,financial_item,value\n"
+        "1,header,Revenue,\n"
+        # Kept as written; pd.read_csv used to turn these into empty cells
+        "2,line_item,Sales,N/A\n"
+        '3,line_item,null,"1,000.50"\n'
+        "4,total_row,Total,1005.5\n"
+    ]
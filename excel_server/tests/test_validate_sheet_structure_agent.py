@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from app.domain import ReportGroup, SheetData, SheetStructure
+from app.exgent.sheet_frame import SheetFrame
+from app.exgent.validate_sheet_structure_agent import (
+    ValidateSheetStructureAgent,
+    validate_groups,
+)
+from app.server.sheet_cache import SheetSource
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import RunConfig
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+
+SHEET = [
+    [" ", "A", "B", "C", "D"],
+    ["1", "", "Revenue", "FY23", "FY24"],
+    ["2", "", "Product sales", "$1,000", "1,200"],
+    ["3", "", "Returns", "(100)", "(150)"],
+    ["4", "", "Total revenue", "900", "1,000"],
+    ["5", "", "Expenses", "", ""],
+    ["6", "", "Payroll", "400", "n/a"],
+    ["7", "", "Rent", "", "100"],
+    ["8", "", "Total expenses", "400.004", "100"],
+]
+
+STRUCTURE = SheetStructure(
+    statement_type="Income Statement",
+    financial_items_column=2,
+    date_columns=[3, 4],
+    groups=[
+        ReportGroup(name="Revenue", header_rows=[1], line_items=[2, 3], total=4),
+        ReportGroup(name="Expenses", header_rows=[5], line_items=[6, 7, 99], total=8),
+    ],
+)
+
+
+@pytest.fixture
+def sheet_info_store(tmp_path):
+    return SheetInfoStore(db_url=f"sqlite:///{tmp_path / 'si.db'}")
+
+
+def test_validation_results(sheet_info_store):
+    agent = ValidateSheetStructureAgent(input_key="sheet_structure_json")
+    source = SheetSource("hash", 0, "Sheet1", SheetData(data=SHEET))
+    ctx = InvocationContext(
+        session_service=InMemorySessionService(),
+        invocation_id="inv",
+        agent=agent,
+        session=Session(
+            id="s",
+            app_name="excel_tag",
+            user_id="u",
+            state={"sheet_structure_json": STRUCTURE.model_dump()},
+        ),
+        run_config=RunConfig(
+            custom_metadata={
+                "sheet_info_store": sheet_info_store,
+                "file_id": "file",
+                "sheet_idx": 0,
+                "sheet_name": "Sheet1",
+                "sheet_source": source,
+            }
+        ),
+    )
+
+    async def collect():
+        return [event async for event in agent.run_async(ctx)]
+
+    asyncio.run(collect())
+
+    saved = sheet_info_store.get_latest("agent", "file", 0).payload.structure
+    results = [
+        (r.group_name, r.date_column, r.calculated_total, r.actual_total, r.matches)
+        for r in saved.validation_results
+    ]
+    assert results == [
+        ("Revenue", 3, 900.0, 900.0, True),
+        ("Revenue", 4, 1050.0, 1000.0, False),
+        ("Expenses", 3, 400.0, 400.004, True),
+        # Non-numeric cells count as 0 and out-of-range rows are skipped
+        ("Expenses", 4, 100.0, 100.0, True),
+    ]
+
+
+def test_validate_groups_edge_cases():
+    frame = SheetFrame.from_sheet_data(SheetData(data=SHEET))
+    structure = STRUCTURE.model_copy(
+        update={
+            "date_columns": [3],
+            "groups": [
+                # A row listed twice is counted twice, like summing the list
+                ReportGroup(name="Twice", header_rows=[], line_items=[2, 2], total=2),
+                ReportGroup(name="No total", header_rows=[], line_items=[3], total=-1),
+                ReportGroup(name="Empty", header_rows=[], line_items=[], total=5),
+            ],
+        }
+    )
+    results = validate_groups(frame, structure)
+    assert [(r.calculated_total, r.actual_total, r.matches) for r in results] == [
+        (2000.0, 1000.0, False),
+        (-100.0, 0.0, False),
+        (0.0, 0.0, True),
+    ]
+    assert (
+        validate_groups(frame, structure.model_copy(update={"date_columns": []})) == []
+    )
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+from app.domain import SheetInfoPayload, SheetStructure
+from app.sheet_info_store.sheet_info_store import SheetInfoStore
+from app.sheet_info_store.write_coalescer import SheetInfoWriteCoalescer
+
+
+@pytest.fixture
+def sheet_info_store(tmp_path):
+    return SheetInfoStore(db_url=f"sqlite:///{tmp_path / 'sheet_info_store.db'}")
+
+
+def make_payload(statement_type: str) -> SheetInfoPayload:
+    return SheetInfoPayload(
+        structure=SheetStructure(
+            statement_type=statement_type,
+            financial_items_column=1,
+            date_columns=[2],
+            groups=[],
+        ),
+        tags=[],
+    )
+
+
+def test_rapid_saves_collapse_into_one_version(sheet_info_store):
+    coalescer = SheetInfoWriteCoalescer(window_seconds=0.05)
+
+    async def run():
+        saves = []
+        for i in range(5):
+            saves.append(
+                asyncio.create_task(
+                    coalescer.submit(
+                        sheet_info_store,
+                        "user1",
+                        "file1",
+                        0,
+                        "sheet1",
+                        make_payload(f"edit {i}"),
+                    )
+                )
+            )
+            await asyncio.sleep(0.01)
+        return await asyncio.gather(*saves)
+
+    results = asyncio.run(run())
+
+    assert [r.version for r in results] == [1] * 5
+    assert results[0].payload == make_payload("edit 4")
+    assert len(sheet_info_store.get_history("user1", "file1", 0)) == 1
+
+
+def test_saves_outside_window_and_other_sheets_are_separate(sheet_info_store):
+    coalescer = SheetInfoWriteCoalescer(window_seconds=0.02)
+
+    async def run():
+        first, other_sheet = await asyncio.gather(
+            coalescer.submit(sheet_info_store, "user1", "file1", 0, "s0"),
+            coalescer.submit(sheet_info_store, "user1", "file1", 1, "s1"),
+        )
+        second = await coalescer.submit(sheet_info_store, "user1", "file1", 0, "s0")
+        return first, other_sheet, second
+
+    first, other_sheet, second = asyncio.run(run())
+
+    assert (first.version, second.version) == (1, 2)
+    assert other_sheet.version == 1
+    assert other_sheet.sheet_idx == 1
+
+
+def test_max_delay_bounds_a_continuous_stream(sheet_info_store):
+    coalescer = SheetInfoWriteCoalescer(window_seconds=0.05, max_delay_seconds=0.1)
+
+    async def run():
+        saves = []
+        for _ in range(10):
+            saves.append(
+                asyncio.create_task(
+                    coalescer.submit(sheet_info_store, "user1", "file1", 0, "s0")
+                )
+            )
+            await asyncio.sleep(0.03)
+        return await asyncio.gather(*saves)
+
+    versions = {r.version for r in asyncio.run(run())}
+
+    # Never more than ~max_delay between flushes, but still far fewer than
+    # one write per save.
+    assert 2 <= len(versions) <= 5
+
+
+def test_write_errors_reach_every_caller(sheet_info_store, caplog):
+    def deny(user_id, action, file_id=None):
+        return False
+
+    store = SheetInfoStore(db_url=str(sheet_info_store.engine.url), auth_callback=deny)
+    coalescer = SheetInfoWriteCoalescer(window_seconds=0.01)
+
+    async def run():
+        return await asyncio.gather(
+            coalescer.submit(store, "user1", "file1", 0, "s0"),
+            coalescer.submit(store, "user1", "file1", 0, "s0"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, PermissionError) for r in results)
+    # Logged once, even though both callers got the error
+    assert [r.message for r in caplog.records] == ["Writing file1/0 failed"]
+
+
+def test_only_the_written_save_runs_its_after_write_hook(sheet_info_store):
+    coalescer = SheetInfoWriteCoalescer(window_seconds=0.05)
+    written = []
+
+    def hook(name):
+        async def after_write(sheet_info):
+            written.append((name, sheet_info.version, sheet_info.payload))
+
+        return after_write
+
+    async def run():
+        saves = [
+            asyncio.create_task(
+                coalescer.submit(
+                    sheet_info_store,
+                    "user1",
+                    "file1",
+                    0,
+                    "sheet1",
+                    make_payload(f"edit {i}"),
+                    after_write=hook(f"save {i}"),
+                )
+            )
+            for i in range(3)
+        ]
+        await asyncio.gather(*saves)
+        await coalescer.submit(
+            sheet_info_store,
+            "user1",
+            "file1",
+            0,
+            "sheet1",
+            make_payload("later"),
+            after_write=hook("later"),
+        )
+
+    asyncio.run(run())
+    assert written == [
+        ("save 2", 1, make_payload("edit 2")),
+        ("later", 2, make_payload("later")),
+    ]
+
+
+def test_saves_of_different_users_are_not_merged(sheet_info_store):
+    coalescer = SheetInfoWriteCoalescer(window_seconds=0.05)
+
+    async def run():
+        return await asyncio.gather(
+            coalescer.submit(
+                sheet_info_store, "user1", "file1", 0, "s0", make_payload("one")
+            ),
+            coalescer.submit(
+                sheet_info_store, "user2", "file1", 0, "s0", make_payload("two")
+            ),
+        )
+
+    first, second = asyncio.run(run())
+
+    assert (first.user_id, first.payload) == ("user1", make_payload("one"))
+    assert (second.user_id, second.payload) == ("user2", make_payload("two"))
+    # Still written one after the other
+    assert {first.version, second.version} == {1, 2}